@@ -8,10 +8,12 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 
 from app import schemas
-from app.core.dependencies import get_db, get_current_active_user
+from app.core.dependencies import get_db, get_current_active_user, get_current_admin_user
 from app.models.knowledge import KnowledgeBase
 from app.models.user import User
-from app.services.knowledge_service import KnowledgeService
+from app.services.faiss_embedding_service import FAISSEmbeddingService, VectorIndexUnavailable
+from app.services.knowledge_service import KnowledgeService, tag_index
+from app.services.container import get_knowledge_service, get_vector_index
 
 router = APIRouter()
 
@@ -48,13 +50,13 @@ def create_knowledge_base_entry(
     knowledge_in: schemas.KnowledgeBaseCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
+    knowledge_service: KnowledgeService = Depends(get_knowledge_service),
 ) -> Any:
     """
     Create new knowledge base entry
     """
     # Generate embeddings for the content
-    knowledge_service = KnowledgeService()
-    embedding = knowledge_service.generate_embedding(knowledge_in.content)
+    embedding = knowledge_service.embed_for_storage(knowledge_in.content)
     
     knowledge = KnowledgeBase(
         **knowledge_in.dict(),
@@ -63,9 +65,122 @@ def create_knowledge_base_entry(
     db.add(knowledge)
     db.commit()
     db.refresh(knowledge)
+    knowledge_service.refresh_entry_indexes(knowledge)
     return knowledge
 
 
+@router.get("/by-tags", response_model=List[schemas.KnowledgeBase])
+def search_knowledge_by_tags(
+    tags: List[str] = Query(...),
+    match: str = Query("any", pattern="^(any|all)$"),
+    skip: int = 0,
+    limit: int = Query(20, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+    knowledge_service: KnowledgeService = Depends(get_knowledge_service),
+) -> Any:
+    """
+    Find knowledge base entries tagged with any (or all) of the given tags
+    """
+    return knowledge_service.search_by_tags(
+        tags,
+        db=db,
+        limit=limit,
+        offset=skip,
+        match_all=match == "all"
+    )
+
+
+@router.post("/embeddings/refresh")
+def refresh_knowledge_embeddings(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user),
+    knowledge_service: KnowledgeService = Depends(get_knowledge_service),
+) -> Any:
+    """
+    Re-embed entries whose stored embedding is missing or from another model
+    """
+    updated = knowledge_service.bulk_update_embeddings(db)
+    return {"updated": updated, "embedding_model": knowledge_service.embedding_tag()}
+
+
+@router.post("/tags/reload")
+def reload_tag_index(
+    current_user: User = Depends(get_current_admin_user),
+) -> Any:
+    """
+    Rebuild the tag index from the database on every worker; API writes are
+    applied incrementally, so this is for changes made outside the API
+    """
+    tag_index.invalidate()
+    return {"reload_requested": True}
+
+
+@router.get("/index")
+def read_vector_index(
+    current_user: User = Depends(get_current_admin_user),
+    vector_index: FAISSEmbeddingService = Depends(get_vector_index),
+) -> Any:
+    """
+    Vector index statistics, including the progress of a re-embedding job
+    """
+    return vector_index.get_index_stats()
+
+
+@router.post("/index/reembed", status_code=status.HTTP_202_ACCEPTED)
+def start_vector_index_reembedding(
+    reembed_in: schemas.VectorIndexReembed,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user),
+    vector_index: FAISSEmbeddingService = Depends(get_vector_index),
+    knowledge_service: KnowledgeService = Depends(get_knowledge_service),
+) -> Any:
+    """
+    Build a new index generation with the given model in the background;
+    the current generation keeps serving until it is swapped out
+    """
+    try:
+        generation = vector_index.start_reembedding(
+            knowledge_service.index_entry_batches(db),
+            reembed_in.model_name,
+            model_version=reembed_in.model_version,
+            dual_read=reembed_in.dual_read
+        )
+    except VectorIndexUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {"generation": generation, "status": vector_index.get_reembed_status()}
+
+
+@router.post("/index/swap")
+def swap_vector_index_generation(
+    current_user: User = Depends(get_current_admin_user),
+    vector_index: FAISSEmbeddingService = Depends(get_vector_index),
+) -> Any:
+    """
+    Switch searches to the re-embedded generation once it is ready
+    """
+    if not vector_index.swap_generation():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"No re-embedded generation is ready (state: {vector_index.get_reembed_status().get('state')})"
+        )
+    return vector_index.get_index_stats()
+
+
+@router.post("/index/cancel")
+def cancel_vector_index_reembedding(
+    current_user: User = Depends(get_current_admin_user),
+    vector_index: FAISSEmbeddingService = Depends(get_vector_index),
+) -> Any:
+    """
+    Discard a staged generation without touching the serving one
+    """
+    vector_index.cancel_reembedding()
+    return vector_index.get_reembed_status()
+
+
 @router.get("/{knowledge_id}", response_model=schemas.KnowledgeBase)
 def read_knowledge_base_entry(
     knowledge_id: int,
@@ -94,6 +209,7 @@ def update_knowledge_base_entry(
     knowledge_in: schemas.KnowledgeBaseUpdate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
+    knowledge_service: KnowledgeService = Depends(get_knowledge_service),
 ) -> Any:
     """
     Update knowledge base entry
@@ -110,11 +226,11 @@ def update_knowledge_base_entry(
         raise HTTPException(status_code=404, detail="Knowledge base entry not found")
     
     update_data = knowledge_in.dict(exclude_unset=True)
+    previous_category = knowledge.category
     
     # Regenerate embeddings if content changed
     if "content" in update_data:
-        knowledge_service = KnowledgeService()
-        update_data["embedding"] = knowledge_service.generate_embedding(update_data["content"])
+        update_data["embedding"] = knowledge_service.embed_for_storage(update_data["content"])
     
     for field, value in update_data.items():
         setattr(knowledge, field, value)
@@ -122,6 +238,7 @@ def update_knowledge_base_entry(
     db.add(knowledge)
     db.commit()
     db.refresh(knowledge)
+    knowledge_service.refresh_entry_indexes(knowledge, previous_category=previous_category)
     return knowledge
 
 
@@ -130,6 +247,7 @@ def delete_knowledge_base_entry(
     knowledge_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
+    knowledge_service: KnowledgeService = Depends(get_knowledge_service),
 ) -> Any:
     """
     Delete knowledge base entry (soft delete)
@@ -148,6 +266,7 @@ def delete_knowledge_base_entry(
     knowledge.is_active = False
     db.add(knowledge)
     db.commit()
+    knowledge_service.refresh_entry_indexes(knowledge)
     return {"message": "Knowledge base entry deleted successfully"}
 
 
@@ -157,10 +276,10 @@ def semantic_search(
     limit: int = Query(5, le=20),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
+    knowledge_service: KnowledgeService = Depends(get_knowledge_service),
 ) -> Any:
     """
     Perform semantic search on knowledge base
     """
-    knowledge_service = KnowledgeService()
     results = knowledge_service.semantic_search(query, limit=limit, db=db)
     return results
\ No newline at end of file
@@ -2,18 +2,26 @@
 Message handling endpoints with AI integration
 """
 
+import json
+import logging
 import time
-from typing import List
+from typing import List, Dict, Any
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from uuid import uuid4
 
-from app.core.database import get_db
+from app.core.database import SessionLocal, get_db
 from app.models.message import Message
 from app.models.conversation import MessageRole, Conversation
 from app.schemas.message import MessageCreate, MessageResponse, MessageWithFeedback
 from app.services.ai_service import AIService
 from app.services.chat_service import ChatService
+from app.services.container import get_ai_service, get_chat_service
+from app.services.summary_service import conversation_summarizer
+from app.services.turn_pipeline import turn_pipeline
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -22,7 +30,9 @@ router = APIRouter()
 async def send_message(
     conversation_id: str,
     message_data: MessageCreate,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    ai_service: AIService = Depends(get_ai_service),
+    chat_service: ChatService = Depends(get_chat_service)
 ):
     """Send a message and get AI response"""
     # Verify conversation exists
@@ -42,7 +52,7 @@ async def send_message(
         conversation_id=conversation_id,
         role=MessageRole.USER,
         content=message_data.content,
-        metadata=message_data.metadata or {}
+        msg_metadata=message_data.metadata or {}
     )
     
     db.add(user_message)
@@ -52,18 +62,16 @@ async def send_message(
     # Generate AI response
     start_time = time.time()
     
-    ai_service = AIService()
-    chat_service = ChatService(db)
-    
-    # Get conversation context
-    context = await chat_service.get_conversation_context(conversation_id)
+    # Rolling summary plus recent messages; prompt prefix and retrieval are computed alongside
+    turn = await turn_pipeline.prepare(conversation_id, conversation.scenario_type, message_data.content, chat_service)
     
     # Generate AI response based on scenario with RAG support
     ai_response = await ai_service.generate_response(
         message=message_data.content,
         scenario_type=conversation.scenario_type,
-        conversation_context=context,
-        db=db  # Enable RAG by passing database session
+        conversation_context=turn.context,
+        db=db,  # Enable RAG by passing database session
+        conversation_summary=turn.summary
     )
     
     response_time = int((time.time() - start_time) * 1000)  # milliseconds
@@ -74,22 +82,171 @@ async def send_message(
         conversation_id=conversation_id,
         role=MessageRole.ASSISTANT,
         content=ai_response.content,
-        metadata={
+        msg_metadata={
             "model": ai_response.model,
             "tokens_used": ai_response.tokens_used,
-            "confidence": ai_response.confidence
+            "confidence": ai_response.confidence,
+            "intent": ai_response.intent,
+            "stale": ai_response.stale,
+            **ai_response.usage_metadata()
         },
         tokens_used=ai_response.tokens_used,
         response_time=response_time
     )
     
     db.add(ai_message)
+    chat_service.escalate_on_handoff(conversation_id, ai_response.intent)
     db.commit()
     db.refresh(ai_message)
+    conversation_summarizer.schedule_refresh(conversation_id)
     
     return ai_message
 
 
+@router.post("/{conversation_id}/messages/stream")
+async def send_message_stream(
+    conversation_id: str,
+    message_data: MessageCreate,
+    db: Session = Depends(get_db),
+    ai_service: AIService = Depends(get_ai_service),
+    chat_service: ChatService = Depends(get_chat_service)
+):
+    """
+    Send a message and stream the AI response as Server-Sent Events
+    
+    Events:
+    - start: assistant message id reserved for this response
+    - delta: incremental text with a sequence number
+    - complete: persisted message id, final content, tokens_used, response_time, and
+      stale when a recent answer was served because generation failed
+    - error: the response was streamed but could not be saved; carries its content
+    """
+    # Verify conversation exists
+    conversation = db.query(Conversation).filter(
+        Conversation.id == conversation_id
+    ).first()
+    
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+    
+    # Create user message
+    user_message = Message(
+        id=str(uuid4()),
+        conversation_id=conversation_id,
+        role=MessageRole.USER,
+        content=message_data.content,
+        msg_metadata=message_data.metadata or {}
+    )
+    
+    db.add(user_message)
+    db.commit()
+    db.refresh(user_message)
+    
+    start_time = time.time()
+    
+    # Rolling summary plus recent messages; prompt prefix and retrieval are computed alongside
+    turn = await turn_pipeline.prepare(conversation_id, conversation.scenario_type, message_data.content, chat_service)
+    
+    ai_message_id = str(uuid4())
+    user_message_id = str(user_message.id)
+    scenario_type = conversation.scenario_type
+    
+    async def event_stream():
+        # The request's session is closed once the endpoint returns, before the body streams
+        stream_db = SessionLocal()
+        try:
+            async for event in _stream_turn(stream_db):
+                yield event
+        finally:
+            stream_db.close()
+    
+    async def _stream_turn(stream_db: Session):
+        yield _sse_event("start", {
+            "message_id": ai_message_id,
+            "user_message_id": user_message_id
+        })
+        
+        ai_response = None
+        async for chunk in ai_service.stream_response(
+            message=message_data.content,
+            scenario_type=scenario_type,
+            conversation_context=turn.context,
+            db=stream_db,  # Enable RAG by passing database session
+            conversation_summary=turn.summary
+        ):
+            if chunk.done:
+                ai_response = chunk.response
+                continue
+            
+            yield _sse_event("delta", {"sequence": chunk.sequence, "delta": chunk.delta})
+        
+        response_time = int((time.time() - start_time) * 1000)  # milliseconds
+        
+        # Persist the AI message once the stream completes
+        ai_message = Message(
+            id=ai_message_id,
+            conversation_id=conversation_id,
+            role=MessageRole.ASSISTANT,
+            content=ai_response.content,
+            msg_metadata={
+                "model": ai_response.model,
+                "tokens_used": ai_response.tokens_used,
+                "confidence": ai_response.confidence,
+                "time_to_first_token_ms": ai_response.time_to_first_token_ms,
+                "cached": ai_response.cached,
+                "stale": ai_response.stale,
+                "intent": ai_response.intent,
+                **ai_response.usage_metadata()
+            },
+            tokens_used=ai_response.tokens_used,
+            response_time=response_time
+        )
+        
+        try:
+            stream_db.add(ai_message)
+            ChatService(stream_db).escalate_on_handoff(conversation_id, ai_response.intent)
+            stream_db.commit()
+        except Exception as e:
+            stream_db.rollback()
+            logger.error(f"Could not save streamed response {ai_message_id}: {e!r}")
+            yield _sse_event("error", {
+                "message_id": ai_message_id,
+                "message": "Failed to save AI response",
+                "content": ai_response.content
+            })
+            return
+        conversation_summarizer.schedule_refresh(conversation_id)
+        
+        yield _sse_event("complete", {
+            "message_id": ai_message_id,
+            "content": ai_response.content,
+            "model": ai_response.model,
+            "tokens_used": ai_response.tokens_used,
+            "prompt_tokens": ai_response.prompt_tokens,
+            "completion_tokens": ai_response.completion_tokens,
+            "response_time": response_time,
+            "time_to_first_token_ms": ai_response.time_to_first_token_ms,
+            "stale": ai_response.stale
+        })
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Stop nginx from buffering the stream
+        }
+    )
+
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @router.get("/{conversation_id}/messages", response_model=List[MessageResponse])
 async def get_messages(
     conversation_id: str,
@@ -10,6 +10,9 @@ from app.core.database import get_db
 from app.core.dependencies import get_current_active_user
 from app.models.user import User
 from app.models.scenario import CustomScenario
+from app.services.container import get_scenario_service
+from app.services.prompt_templates import prompt_templates
+from app.services.scenario_service import ScenarioService
 from app.schemas.scenario import (
     CustomScenarioCreate, 
     CustomScenarioUpdate, 
@@ -149,12 +152,10 @@ async def create_custom_scenario(
 @router.get("/")
 async def get_all_scenarios(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    scenario_service: ScenarioService = Depends(get_scenario_service)
 ):
     """Get all scenarios (built-in + custom)"""
-    from app.services.scenario_service import ScenarioService
-    
-    scenario_service = ScenarioService()
     all_scenarios = scenario_service.get_all_scenarios(db)
     
     return all_scenarios
@@ -207,6 +208,7 @@ async def update_custom_scenario(
     
     db.commit()
     db.refresh(scenario)
+    prompt_templates.invalidate_custom(scenario.id)
     
     return scenario
 
@@ -232,6 +234,7 @@ async def delete_custom_scenario(
     # Soft delete
     scenario.is_active = False
     db.commit()
+    prompt_templates.invalidate_custom(scenario.id)
     
     return {"message": f"Scenario '{scenario_id}' deleted successfully"}
 
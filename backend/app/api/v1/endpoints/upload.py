@@ -2,6 +2,7 @@
 File upload endpoints for business context documents
 """
 
+import asyncio
 import os
 import uuid
 from typing import List, Optional
@@ -16,6 +17,7 @@ from app.models.user import User
 from app.models.knowledge import KnowledgeBase
 from app.services.knowledge_service import KnowledgeService
 from app.services.document_parser import DocumentParser
+from app.services.container import get_document_parser, get_knowledge_service
 
 router = APIRouter()
 
@@ -35,7 +37,9 @@ async def upload_business_context(
     title: Optional[str] = Form(None),
     category: Optional[str] = Form(None),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    knowledge_service: KnowledgeService = Depends(get_knowledge_service),
+    parser: DocumentParser = Depends(get_document_parser)
 ):
     """
     Upload and process business context document
@@ -65,12 +69,8 @@ async def upload_business_context(
             f.write(file_content)
         
         # Parse document content
-        parser = DocumentParser()
         extracted_text = parser.parse_document(temp_file_path, file_ext)
         
-        # Create knowledge base entries
-        knowledge_service = KnowledgeService()
-        
         # Chunk large documents
         chunks = parser.chunk_text(extracted_text, max_chunk_size=2000)
         
@@ -112,13 +112,12 @@ async def upload_business_context(
 async def get_business_context(
     scenario: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    knowledge_service: KnowledgeService = Depends(get_knowledge_service)
 ):
     """
     Get uploaded business context for a scenario
     """
-    knowledge_service = KnowledgeService()
-    
     context_entries = knowledge_service.get_knowledge_by_category(
         category=f"{scenario.upper()}_BUSINESS_CONTEXT",
         db=db
@@ -144,7 +143,8 @@ async def get_business_context(
 async def delete_context_entry(
     entry_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    knowledge_service: KnowledgeService = Depends(get_knowledge_service)
 ):
     """
     Delete a business context entry
@@ -160,6 +160,7 @@ async def delete_context_entry(
     # Soft delete
     knowledge.is_active = False
     db.commit()
+    knowledge_service.refresh_entry_indexes(knowledge)
     
     return {"message": "Context entry deleted successfully"}
 
@@ -169,15 +170,16 @@ async def test_context_search(
     query: str = Form(...),
     scenario: str = Form(...),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    knowledge_service: KnowledgeService = Depends(get_knowledge_service)
 ):
     """
     Test context search for a query and scenario
     """
-    knowledge_service = KnowledgeService()
-    
-    # Search in business context - return top 3 for better LLM context
-    results = knowledge_service.semantic_search(
+    # Search in business context - return top 3 for better LLM context.
+    # It may wait on a shared cache fill, so it runs off the event loop
+    results = await asyncio.to_thread(
+        knowledge_service.semantic_search,
         query,
         limit=3,
         db=db,
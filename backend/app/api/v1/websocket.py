@@ -9,10 +9,16 @@ import json
 import asyncio
 from datetime import datetime
 
+from app.core.admission import Priority
+from app.core.config import settings
 from app.core.database import get_db
 from app.models.message import Message
 from app.models.conversation import Conversation, MessageRole
-from app.services.ai_service import AIService
+from app.services.chat_service import ChatService
+from app.services.container import services
+from app.services.speculative_retrieval import speculative_retriever
+from app.services.summary_service import conversation_summarizer
+from app.services.turn_pipeline import turn_pipeline
 from uuid import uuid4
 
 class ConnectionManager:
@@ -54,8 +60,12 @@ async def websocket_endpoint(
     Message types:
     - user_message: User sends a message
     - ai_response_start: AI starts generating response
-    - ai_response_complete: AI completes response
-    - typing_indicator: Show typing indicator
+    - ai_response_queued: Waiting for generation capacity, with the queue position
+    - ai_response_delta: Incremental AI text, ordered by sequence
+    - ai_response_complete: AI completes response (content is authoritative;
+      "stale" marks a recent answer served while generation was failing)
+    - typing_indicator: Show typing indicator; clients may attach their partial
+      "draft" so knowledge retrieval starts before the message is sent
     - error: Error occurred
     """
     await manager.connect(websocket, conversation_id)
@@ -68,8 +78,13 @@ async def websocket_endpoint(
     }))
     
     try:
-        # Initialize AI service
-        ai_service = AIService()
+        # A conversation's scenario never changes: look it up once, not per turn or keystroke
+        conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+        scenario_type = conversation.scenario_type if conversation else "ECOMMERCE"
+        scenario_id = scenario_type.value if hasattr(scenario_type, "value") else str(scenario_type)
+        
+        # Shared, process-wide AI service
+        ai_service = services.ai
         
         while True:
             # Receive message from client
@@ -102,10 +117,14 @@ async def websocket_endpoint(
                     conversation_id
                 )
                 
+                # Pre-assign the assistant message id so deltas and the stored message match
+                ai_message_id = str(uuid4())
+                
                 # Send typing indicator
                 await manager.broadcast_to_conversation(
                     json.dumps({
                         "type": "ai_response_start",
+                        "message_id": ai_message_id,
                         "timestamp": datetime.utcnow().isoformat()
                     }),
                     conversation_id
@@ -113,39 +132,76 @@ async def websocket_endpoint(
                 
                 # Generate AI response
                 try:
-                    # Get conversation context
-                    conversation = db.query(Conversation).filter(
-                        Conversation.id == conversation_id
-                    ).first()
+                    # Retrieval results for a close enough typing draft are already ranked; they apply to this turn only
+                    knowledge_ids = None
+                    if settings.SPECULATIVE_RETRIEVAL_ENABLED:
+                        knowledge_ids = speculative_retriever.claim(conversation_id, scenario_id, user_message.content)
+                    
+                    # Rolling summary of older turns plus recent messages; prompt prefix and retrieval run alongside
+                    turn = await turn_pipeline.prepare(
+                        conversation_id, scenario_type, user_message.content, ChatService(db),
+                        knowledge_ids=knowledge_ids
+                    )
                     
-                    # Get recent messages for context
-                    recent_messages = db.query(Message).filter(
-                        Message.conversation_id == conversation_id
-                    ).order_by(Message.created_at.desc()).limit(10).all()
+                    async def send_queue_position(position: int, message_id: str = ai_message_id):
+                        # Tell clients they are waiting for capacity rather than failing
+                        await manager.broadcast_to_conversation(
+                            json.dumps({
+                                "type": "ai_response_queued",
+                                "message_id": message_id,
+                                "position": position
+                            }),
+                            conversation_id
+                        )
                     
-                    # Generate response using AI service with RAG support
-                    ai_response = await ai_service.generate_response(
+                    # Stream the response using AI service with RAG support
+                    ai_response = None
+                    async for chunk in ai_service.stream_response(
                         user_message.content,
-                        conversation.scenario_type if conversation else "ECOMMERCE",
-                        [{"role": msg.role.value, "content": msg.content} 
-                         for msg in reversed(recent_messages)],
-                        db  # Enable RAG by passing database session
-                    )
+                        scenario_type,
+                        turn.context,
+                        db,  # Enable RAG by passing database session
+                        conversation_summary=turn.summary,
+                        priority=Priority.INTERACTIVE,  # Live chats go ahead of REST and batch work
+                        on_queue_position=send_queue_position,
+                        knowledge_ids=knowledge_ids
+                    ):
+                        if chunk.done:
+                            ai_response = chunk.response
+                            continue
+                        
+                        await manager.broadcast_to_conversation(
+                            json.dumps({
+                                "type": "ai_response_delta",
+                                "message_id": ai_message_id,
+                                "sequence": chunk.sequence,
+                                "delta": chunk.delta
+                            }),
+                            conversation_id
+                        )
                     
-                    # Save AI response to database
+                    # Persist the final message once the stream completes
                     ai_message = Message(
-                        id=str(uuid4()),
+                        id=ai_message_id,
                         conversation_id=conversation_id,
                         role=MessageRole.ASSISTANT,
                         content=ai_response.content,
                         msg_metadata={
                             "model": ai_response.model,
                             "tokens": ai_response.tokens_used or 0,
-                            "confidence": ai_response.confidence or 0.0
-                        }
+                            "confidence": ai_response.confidence or 0.0,
+                            "time_to_first_token_ms": ai_response.time_to_first_token_ms,
+                            "cached": ai_response.cached,
+                            "stale": ai_response.stale,
+                            "intent": ai_response.intent,
+                            **ai_response.usage_metadata()
+                        },
+                        tokens_used=ai_response.tokens_used
                     )
                     db.add(ai_message)
+                    ChatService(db).escalate_on_handoff(conversation_id, ai_response.intent)
                     db.commit()
+                    conversation_summarizer.schedule_refresh(conversation_id)
                     
                     # Send AI response
                     await manager.broadcast_to_conversation(
@@ -155,6 +211,8 @@ async def websocket_endpoint(
                                 "id": str(ai_message.id),
                                 "role": "ASSISTANT",
                                 "content": ai_message.content,
+                                "time_to_first_token_ms": ai_response.time_to_first_token_ms,
+                                "stale": ai_response.stale,
                                 "timestamp": datetime.utcnow().isoformat()
                             }
                         }),
@@ -180,8 +238,14 @@ async def websocket_endpoint(
                     conversation_id
                 )
                 
+                # Retrieve for the draft in the background while the customer finishes typing
+                draft = message_data.get("draft")
+                if settings.SPECULATIVE_RETRIEVAL_ENABLED and draft and message_data.get("is_typing", False):
+                    speculative_retriever.schedule_prefetch(conversation_id, scenario_id, draft)
+                
     except WebSocketDisconnect:
         manager.disconnect(websocket, conversation_id)
+        speculative_retriever.discard(conversation_id)
         # Notify other clients about disconnection
         await manager.broadcast_to_conversation(
             json.dumps({
@@ -191,4 +255,5 @@ async def websocket_endpoint(
             conversation_id
         )
     except Exception as e:
-        manager.disconnect(websocket, conversation_id)
\ No newline at end of file
+        manager.disconnect(websocket, conversation_id)
+        speculative_retriever.discard(conversation_id)
\ No newline at end of file
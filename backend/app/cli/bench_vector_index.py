@@ -0,0 +1,125 @@
+"""
+Latency and recall benchmark for the vector index layouts
+
+Reproduces the table in docs/VECTOR_INDEX.md: synthetic clustered vectors
+are searched with the in-memory flat index and with the disk-resident IVF
+index at several nprobe values, and recall@k is measured against the flat
+results:
+
+    python -m app.cli.bench_vector_index --vectors 200000 --dim 384 --clusters 2000 --nlist 1024 --nprobe 8 16 64
+
+Searches are single-threaded. The IVF lists are written to a temporary
+directory and read once before timing, so the numbers are for a warm page
+cache; drop the cache between runs to measure cold reads.
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.faiss_embedding_service import MIN_POINTS_PER_CENTROID, faiss
+
+
+def synthetic_vectors(centers: np.ndarray, count: int, spread: float, rng: np.random.Generator) -> np.ndarray:
+    """Unit vectors scattered around the given cluster centers"""
+    labels = rng.integers(0, len(centers), size=count)
+    vectors = centers[labels] + spread * rng.normal(size=(count, centers.shape[1])).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def timed_search(index, queries: np.ndarray, k: int, params=None):
+    """Per-query latency in ms and the result ids"""
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k, params=params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids[0])
+    return np.array(latencies), np.array(results)
+
+
+def recall_at_k(results: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(r) & set(t)) / len(t) for r, t in zip(results, truth)]))
+
+
+def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    faiss.omp_set_num_threads(1)
+    rng = np.random.default_rng(args.seed)
+    centers = rng.normal(size=(args.clusters, args.dim)).astype(np.float32)
+    vectors = synthetic_vectors(centers, args.vectors, args.spread, rng)
+    # Queries come from the same clusters but are not corpus vectors
+    queries = synthetic_vectors(centers, args.queries, args.spread, rng)
+    rows = []
+
+    flat = faiss.IndexFlatIP(args.dim)
+    flat.add(vectors)
+    latencies, truth = timed_search(flat, queries, args.k)
+    rows.append({
+        "index": "flat, in memory",
+        "resident_mb": round(vectors.nbytes / 2**20, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "recall_at_k": 1.0
+    })
+
+    # Same layout as IndexGeneration.init_ondisk_ivf
+    nlist = args.nlist or max(1, min(settings.VECTOR_INDEX_NLIST, min(args.vectors, args.train_size) // MIN_POINTS_PER_CENTROID))
+    train = vectors[rng.choice(args.vectors, min(args.vectors, args.train_size), replace=False)]
+    with tempfile.TemporaryDirectory() as tmp:
+        quantizer = faiss.IndexFlatIP(args.dim)
+        ivf = faiss.IndexIVFFlat(quantizer, args.dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        ivf.train(train)
+        invlists = faiss.OnDiskInvertedLists(nlist, ivf.code_size, str(Path(tmp) / "bench.ivfdata"))
+        ivf.replace_invlists(invlists, True)
+        invlists.this.disown()
+        for start in range(0, args.vectors, 10000):
+            ivf.add(vectors[start:start + 10000])
+        index_path = str(Path(tmp) / "bench.index")
+        faiss.write_index(ivf, index_path)
+        ivf = faiss.read_index(index_path, faiss.IO_FLAG_ONDISK_SAME_DIR)
+
+        for nprobe in args.nprobe:
+            params = faiss.SearchParametersIVF(nprobe=nprobe)
+            timed_search(ivf, queries[:10], args.k, params)  # Page the probed lists in
+            latencies, results = timed_search(ivf, queries, args.k, params)
+            rows.append({
+                "index": f"IVF on disk, nlist {nlist}, nprobe {nprobe}",
+                "resident_mb": round(nlist * args.dim * 4 / 2**20, 1),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+                "recall_at_k": round(recall_at_k(results, truth), 3)
+            })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--spread", type=float, default=0.3, help="Noise around each cluster center")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=0, help="IVF lists; 0 picks them like the service does")
+    parser.add_argument("--train-size", type=int, default=settings.VECTOR_INDEX_TRAIN_SIZE)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 64])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if faiss is None:
+        parser.error("faiss-cpu is not installed")
+    for row in run(args):
+        json.dump(row, sys.stdout)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Offline batch evaluation of the chat pipeline
+
+Runs questions from a JSONL or CSV file through retrieval, prompt assembly
+and generation with bounded concurrency, and writes one JSON result per
+line as each question finishes:
+
+    python -m app.cli.evaluate questions.jsonl --model mock --concurrency 32 -o results.jsonl
+
+Input rows need a "message" (or "question") field. Optional fields: "id",
+"scenario", "context" (list of {"role", "content"}, or a JSON string of one
+in CSV files), "expected" (reference answer) and "expected_knowledge_ids".
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import re
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Union
+
+from app.core.config import settings
+from app.core.metrics import Histogram
+from app.core.resilience import ResilientCaller
+from app.models.conversation import ScenarioType
+from app.services.llm_providers import LLMProvider, create_llm_provider
+from app.services.prompt_service import RETRIEVAL_LIMIT, PromptService
+
+STAGES = ("retrieval", "prompt", "first_token", "generation", "total")
+
+
+def read_rows(path: str) -> Iterator[Dict[str, Any]]:
+    """Rows from a .csv file, or JSON lines from anything else; "-" reads JSONL from stdin"""
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as handle:
+            for row in csv.DictReader(handle):
+                if row.get("context"):
+                    row["context"] = json.loads(row["context"])
+                if row.get("expected_knowledge_ids"):
+                    row["expected_knowledge_ids"] = json.loads(row["expected_knowledge_ids"])
+                yield row
+        return
+
+    handle = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+
+def token_f1(answer: str, expected: str) -> float:
+    """Bag-of-words F1 between the answer and a reference answer"""
+    answer_tokens = re.findall(r"\w+", answer.lower())
+    expected_tokens = re.findall(r"\w+", expected.lower())
+    if not answer_tokens or not expected_tokens:
+        return 0.0
+    remaining = list(expected_tokens)
+    overlap = 0
+    for token in answer_tokens:
+        if token in remaining:
+            remaining.remove(token)
+            overlap += 1
+    if not overlap:
+        return 0.0
+    precision = overlap / len(answer_tokens)
+    recall = overlap / len(expected_tokens)
+    return round(2 * precision * recall / (precision + recall), 4)
+
+
+class EvaluationRunner:
+    """
+    Drives PromptService and an LLM provider directly, bypassing the
+    response caches, intent router and admission queue, so every row pays
+    for the full pipeline and stage timings are comparable between runs.
+    """
+
+    def __init__(
+        self,
+        provider: LLMProvider,
+        concurrency: int = 8,
+        default_scenario: str = "ECOMMERCE",
+        use_db: bool = True,
+        stream: bool = True
+    ):
+        self.provider = provider
+        self.concurrency = concurrency
+        self.default_scenario = default_scenario
+        self.use_db = use_db
+        self.stream = stream
+        self.prompt_service = PromptService()
+        # Retries and deadline as in serving, without the shared breaker
+        self.caller = ResilientCaller(
+            "evaluation",
+            timeout=settings.AI_RESPONSE_TIMEOUT,
+            max_retries=settings.AI_MAX_RETRIES,
+            backoff_base=settings.AI_RETRY_BACKOFF_BASE
+        )
+        self.timings = {stage: Histogram(window_size=100000) for stage in STAGES}
+        self.completed = 0
+        self.errors = 0
+
+    async def run(self, rows: Iterator[Dict[str, Any]], output: TextIO):
+        """Evaluate every row; results are written in completion order"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                index, row = item
+                result = await self.evaluate(index, row)
+                output.write(json.dumps(result, default=str) + "\n")
+                output.flush()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        for index, row in enumerate(rows):
+            await queue.put((index, row))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    async def evaluate(self, index: int, row: Dict[str, Any]) -> Dict[str, Any]:
+        message = row.get("message") or row.get("question") or ""
+        scenario_id = row.get("scenario") or self.default_scenario
+        result: Dict[str, Any] = {
+            "id": row.get("id", index),
+            "scenario": scenario_id,
+            "message": message,
+            "model": self.provider.model
+        }
+        timings: Dict[str, float] = {}
+        start_time = time.perf_counter()
+
+        try:
+            # Retrieval and prompt assembly are blocking (database and CPU); keep them off the loop
+            prompt, retrieved_ids = await asyncio.to_thread(
+                self._prepare, scenario_id, message, row.get("context") or [], timings
+            )
+            answer, usage = await self._generate(prompt, timings, start_time)
+        except Exception as e:
+            self.errors += 1
+            timings["total"] = (time.perf_counter() - start_time) * 1000
+            result.update(ok=False, error=f"{type(e).__name__}: {e}", timings_ms=self._rounded(timings))
+            return result
+
+        timings["total"] = (time.perf_counter() - start_time) * 1000
+        for stage, value in timings.items():
+            self.timings[stage].observe(value)
+        self.completed += 1
+
+        result.update(
+            ok=True,
+            answer=answer,
+            retrieved_ids=retrieved_ids,
+            timings_ms=self._rounded(timings),
+            tokens={
+                "prompt_estimate": prompt.token_count,
+                "prompt": usage.prompt_tokens if usage else None,
+                "completion": usage.completion_tokens if usage else None,
+                "total": usage.total_tokens if usage else None
+            },
+            quality=self._quality(row, answer, retrieved_ids)
+        )
+        return result
+
+    def _prepare(self, scenario_id: str, message: str, context: List[Dict[str, Any]], timings: Dict[str, float]):
+        scenario = self._scenario(scenario_id)
+        db = None
+        if self.use_db:
+            from app.core.database import SessionLocal
+            db = SessionLocal()
+        try:
+            retrieved_ids: List[int] = []
+            start = time.perf_counter()
+            if db is not None:
+                # Same search prompt assembly runs; it then reuses the cached ranking
+                entries = self.prompt_service.knowledge_service.semantic_search(
+                    message, limit=RETRIEVAL_LIMIT, db=db, category=f"{scenario_id}_BUSINESS_CONTEXT"
+                )
+                retrieved_ids = [entry.id for entry in entries]
+            timings["retrieval"] = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            prompt = self.prompt_service.assemble_prompt(
+                scenario=scenario,
+                user_message=message,
+                conversation_history=context,
+                db=db
+            )
+            timings["prompt"] = (time.perf_counter() - start) * 1000
+            return prompt, retrieved_ids
+        finally:
+            if db is not None:
+                db.close()
+
+    async def _generate(self, prompt, timings: Dict[str, float], start_time: float):
+        start = time.perf_counter()
+        if not self.stream:
+            result = await self.caller.call(lambda: self.provider.generate(prompt))
+            timings["generation"] = (time.perf_counter() - start) * 1000
+            return result.text, result.usage
+
+        parts: List[str] = []
+        usage = None
+        chunks = await self.caller.call(lambda: self.provider.open_stream(prompt))
+        async for chunk in chunks:
+            if chunk.text and "first_token" not in timings:
+                timings["first_token"] = (time.perf_counter() - start_time) * 1000
+            parts.append(chunk.text)
+            usage = chunk.usage or usage
+        timings["generation"] = (time.perf_counter() - start) * 1000
+        return "".join(parts), usage
+
+    @staticmethod
+    def _quality(row: Dict[str, Any], answer: str, retrieved_ids: List[int]) -> Dict[str, Any]:
+        quality: Dict[str, Any] = {}
+        if row.get("expected"):
+            quality["token_f1"] = token_f1(answer, row["expected"])
+        expected_ids = row.get("expected_knowledge_ids")
+        if expected_ids:
+            hits = len(set(expected_ids) & set(retrieved_ids))
+            quality["retrieval_recall"] = round(hits / len(set(expected_ids)), 4)
+        return quality
+
+    @staticmethod
+    def _scenario(scenario_id: str) -> Union[ScenarioType, str]:
+        try:
+            return ScenarioType(scenario_id)
+        except ValueError:
+            return scenario_id
+
+    @staticmethod
+    def _rounded(timings: Dict[str, float]) -> Dict[str, float]:
+        return {stage: round(value, 2) for stage, value in timings.items()}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "completed": self.completed,
+            "errors": self.errors,
+            "model": self.provider.model,
+            "timings_ms": {
+                stage: histogram.summary()
+                for stage, histogram in self.timings.items()
+                if histogram.count
+            }
+        }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run questions through the chat pipeline and record timings")
+    parser.add_argument("input", help="JSONL or .csv file of questions, or - for JSONL on stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSONL results file (default: stdout)")
+    parser.add_argument("--model", default=settings.AI_MODEL, help='"mock" for the local mock provider, or a Gemini model name')
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenario", default="ECOMMERCE", help="Scenario for rows that don't set one")
+    parser.add_argument("--no-db", action="store_true", help="Skip the database: no retrieval or custom scenarios")
+    parser.add_argument("--no-stream", action="store_true", help="Use single-shot generation (no time to first token)")
+    args = parser.parse_args(argv)
+
+    runner = EvaluationRunner(
+        create_llm_provider(args.model),
+        concurrency=args.concurrency,
+        default_scenario=args.scenario,
+        use_db=not args.no_db,
+        stream=not args.no_stream
+    )
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        asyncio.run(runner.run(read_rows(args.input), output))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(json.dumps(runner.summary(), indent=2), file=sys.stderr)
+    return 1 if runner.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
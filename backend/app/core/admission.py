@@ -0,0 +1,193 @@
+"""
+Admission control for LLM calls: bounded concurrency with a priority queue
+"""
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+from app.core.metrics import metrics
+
+
+class Priority:
+    """Lower values are admitted first"""
+    INTERACTIVE = 0  # Live WebSocket chats
+    STANDARD = 1  # REST and SSE requests
+    BATCH = 2  # Offline evaluation and bulk jobs
+
+
+class AdmissionRejected(Exception):
+    """The queue was full, or the request waited longer than the queue timeout"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"LLM admission rejected: {reason}")
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ("scenario_id", "priority", "future", "enqueued_at")
+
+    def __init__(self, scenario_id: str, priority: int, future: asyncio.Future):
+        self.scenario_id = scenario_id
+        self.priority = priority
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class AdmissionController:
+    """
+    Caps concurrent upstream calls. Callers beyond the cap wait in a queue
+    ordered by priority; within a priority level, scenarios take turns so
+    one busy tenant cannot starve the others. Runs on a single event loop.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 16,
+        max_queue: int = 200,
+        queue_timeout: float = 20.0,
+        position_interval: float = 1.0
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.position_interval = position_interval
+        self.in_flight = 0
+        self.queued = 0
+        # priority -> scenario -> waiters; scenario order is the round-robin order
+        self._queues: Dict[int, "OrderedDict[str, Deque[_Waiter]]"] = {}
+
+    @asynccontextmanager
+    async def admit(
+        self,
+        scenario_id: str,
+        priority: int = Priority.STANDARD,
+        on_position: Optional[Callable[[int], Awaitable[None]]] = None
+    ):
+        """
+        Hold one upstream slot for the duration of the block.
+        on_position is awaited with the caller's 1-based queue position
+        whenever it changes while waiting.
+        """
+        start = time.perf_counter()
+        if self.in_flight < self.max_concurrent and not self.queued:
+            self.in_flight += 1
+        else:
+            if self.queued >= self.max_queue:
+                self._reject("queue_full", priority)
+            await self._wait(self._enqueue(scenario_id, priority), on_position)
+
+        metrics.observe("admission.queue_ms", (time.perf_counter() - start) * 1000, priority=priority)
+        self._update_gauges()
+        try:
+            yield
+        finally:
+            self._release()
+
+    def position(self, waiter: _Waiter) -> int:
+        """Approximate 1-based position: everyone of higher priority, plus earlier arrivals of equal priority"""
+        ahead = 0
+        for priority in sorted(self._queues):
+            if priority > waiter.priority:
+                break
+            for queue in self._queues[priority].values():
+                for other in queue:
+                    if other.future.done() or other is waiter:
+                        continue
+                    if priority < waiter.priority or other.enqueued_at < waiter.enqueued_at:
+                        ahead += 1
+        return ahead + 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue
+        }
+
+    def _enqueue(self, scenario_id: str, priority: int) -> _Waiter:
+        waiter = _Waiter(scenario_id, priority, asyncio.get_running_loop().create_future())
+        scenarios = self._queues.setdefault(priority, OrderedDict())
+        scenarios.setdefault(scenario_id, deque()).append(waiter)
+        self.queued += 1
+        self._update_gauges()
+        return waiter
+
+    async def _wait(self, waiter: _Waiter, on_position: Optional[Callable[[int], Awaitable[None]]]):
+        deadline = time.perf_counter() + self.queue_timeout
+        last_position = None
+        try:
+            while True:
+                if on_position:
+                    position = self.position(waiter)
+                    if position != last_position:
+                        last_position = position
+                        await on_position(position)
+
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                try:
+                    await asyncio.wait_for(
+                        asyncio.shield(waiter.future),
+                        min(remaining, self.position_interval) if on_position else remaining
+                    )
+                    return
+                except asyncio.TimeoutError:
+                    if time.perf_counter() >= deadline:
+                        raise
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self._reject("timeout", waiter.priority)
+        except BaseException:
+            self._abandon(waiter)
+            raise
+
+    def _abandon(self, waiter: _Waiter):
+        """Leave the queue; if a slot was granted in the meantime, hand it on"""
+        if waiter.future.done():
+            self._release()
+        else:
+            waiter.future.cancel()
+            self.queued -= 1
+            self._update_gauges()
+
+    def _release(self):
+        self.in_flight -= 1
+        self._dispatch()
+        self._update_gauges()
+
+    def _dispatch(self):
+        while self.in_flight < self.max_concurrent:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            self.in_flight += 1
+            self.queued -= 1
+            waiter.future.set_result(True)
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        for priority in sorted(self._queues):
+            scenarios = self._queues[priority]
+            while scenarios:
+                scenario_id, queue = next(iter(scenarios.items()))
+                waiter = queue.popleft() if queue else None
+                if queue:
+                    # Next turn goes to the next scenario at this priority
+                    scenarios.move_to_end(scenario_id)
+                else:
+                    del scenarios[scenario_id]
+                if waiter is not None and not waiter.future.done():
+                    return waiter
+        return None
+
+    def _reject(self, reason: str, priority: int):
+        metrics.increment("admission.rejected", reason=reason, priority=priority)
+        raise AdmissionRejected(reason)
+
+    def _update_gauges(self):
+        metrics.set_gauge("admission.in_flight", self.in_flight)
+        metrics.set_gauge("admission.queued", self.queued)
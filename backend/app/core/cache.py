@@ -0,0 +1,418 @@
+"""
+Shared cache for responses and derived artifacts.
+
+Entries live in Redis when it is reachable, so every worker and node reuses
+the same cached work. When Redis is missing or failing, the cache degrades
+to a per-process LRU instead of erroring.
+"""
+
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is in requirements, but keep the fallback usable
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryCacheBackend:
+    """Process-local LRU with per-entry expiry"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, Optional[float]]]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        now = time.time()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    values.append(None)
+                elif entry[1] is not None and entry[1] <= now:
+                    del self._entries[key]
+                    values.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    values.append(entry[0])
+        return values
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def add(self, key: str, value: str, ttl: int) -> bool:
+        """Set only if the key is absent; used for stampede locks"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.time()):
+                return False
+            self._entries[key] = (value, time.time() + ttl)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_if(self, key: str, value: str) -> bool:
+        """Delete the key only while it still holds value; used to release owned locks"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != value:
+                return False
+            del self._entries[key]
+            return True
+
+    def incr(self, key: str) -> int:
+        # Counters are kept apart from the LRU so tag versions are never evicted
+        with self._lock:
+            value = self._counters.get(key, 0) + 1
+            self._counters[key] = value
+            return value
+
+    def get_counters(self, keys: List[str]) -> List[int]:
+        with self._lock:
+            return [self._counters.get(key, 0) for key in keys]
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisCacheBackend:
+    """Thin wrapper over a Redis client with short socket timeouts"""
+
+    name = "redis"
+
+    # Compare-and-delete, so a lock is only released by the caller that took it
+    DELETE_IF_SCRIPT = """
+    if redis.call("get", KEYS[1]) == ARGV[1] then
+        return redis.call("del", KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, url: str, socket_timeout: float = 0.25):
+        self.client = redis.Redis.from_url(
+            url,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_timeout,
+            decode_responses=True
+        )
+        self._delete_if = self.client.register_script(self.DELETE_IF_SCRIPT)
+
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        return self.client.mget(keys) if keys else []
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None):
+        self.client.set(key, value, ex=ttl or None)
+
+    def add(self, key: str, value: str, ttl: int) -> bool:
+        return bool(self.client.set(key, value, ex=ttl, nx=True))
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+    def delete_if(self, key: str, value: str) -> bool:
+        return bool(self._delete_if(keys=[key], args=[value]))
+
+    def incr(self, key: str) -> int:
+        return int(self.client.incr(key))
+
+    def get_counters(self, keys: List[str]) -> List[int]:
+        return [int(value or 0) for value in self.get_many(keys)]
+
+    def ping(self) -> bool:
+        return bool(self.client.ping())
+
+
+class CacheService:
+    """
+    Namespaced get/set over the active backend, plus:
+
+    - tag invalidation: each entry records the version of its tags when it
+      was stored, and bumping a tag's version makes all of them stale at once
+    - stampede protection: get_or_set lets one caller per key compute a
+      missing value while the others wait for it to be published
+    - hit/miss metrics per namespace
+    """
+
+    def __init__(
+        self,
+        redis_url: Optional[str] = None,
+        default_ttl: int = 300,
+        max_local_entries: int = 10000,
+        key_prefix: str = "cache",
+        lock_timeout: float = 10.0,
+        retry_interval: float = 30.0
+    ):
+        self.redis_url = redis_url
+        self.default_ttl = default_ttl
+        self.key_prefix = key_prefix
+        self.lock_timeout = lock_timeout
+        self.retry_interval = retry_interval
+        self.local = MemoryCacheBackend(max_entries=max_local_entries)
+        self._redis: Optional[RedisCacheBackend] = None
+        self._redis_down_until = 0.0
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._key_locks_guard = threading.Lock()
+
+    # Backend selection
+
+    @property
+    def backend(self):
+        """Redis while it is healthy, otherwise the local LRU"""
+        if not self.redis_url or redis is None or time.time() < self._redis_down_until:
+            return self.local
+
+        if self._redis is None:
+            try:
+                candidate = RedisCacheBackend(self.redis_url)
+                candidate.ping()
+                self._redis = candidate
+                logger.info("Cache connected to Redis")
+            except Exception as e:
+                self._mark_redis_down(e)
+                return self.local
+
+        return self._redis
+
+    def _mark_redis_down(self, error: Exception):
+        logger.warning(f"Redis cache unavailable, using in-process cache: {error}")
+        metrics.increment("cache.backend_errors")
+        self._redis = None
+        self._redis_down_until = time.time() + self.retry_interval
+
+    def _call(self, operation: str, *args):
+        """Run a backend operation, falling back to the local LRU on Redis errors"""
+        backend = self.backend
+        try:
+            return getattr(backend, operation)(*args)
+        except Exception as e:
+            if backend is self.local:
+                raise
+            self._mark_redis_down(e)
+            return getattr(self.local, operation)(*args)
+
+    # Keys and tags
+
+    def make_key(self, namespace: str, *parts: Any) -> str:
+        raw = json.dumps(parts, sort_keys=True, default=str)
+        digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        return f"{self.key_prefix}:{namespace}:{digest}"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.key_prefix}:tag:{tag}"
+
+    def tag_versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        tags = sorted(set(tags))
+        if not tags:
+            return {}
+        versions = self._call("get_counters", [self._tag_key(tag) for tag in tags])
+        return dict(zip(tags, versions))
+
+    def tag_version(self, tag: str) -> int:
+        return self.tag_versions([tag])[tag]
+
+    def invalidate_tags(self, *tags: str):
+        """Make every entry stored under any of these tags stale"""
+        for tag in set(tags):
+            self._call("incr", self._tag_key(tag))
+        metrics.increment("cache.invalidations", len(set(tags)))
+
+    def bump_tag(self, tag: str) -> int:
+        """Invalidate one tag and return its new version, for callers that key a change log by it"""
+        version = self._call("incr", self._tag_key(tag))
+        metrics.increment("cache.invalidations")
+        return version
+
+    # Core operations
+
+    def get(self, namespace: str, *parts: Any) -> Optional[Any]:
+        value, hit = self._lookup(self.make_key(namespace, *parts))
+        metrics.increment("cache.hits" if hit else "cache.misses", namespace=namespace)
+        return value
+
+    def get_many(self, namespace: str, keys: List[Tuple[Any, ...]]) -> List[Optional[Any]]:
+        """get() for several keys (each a tuple of parts) in one backend round trip"""
+        if not keys:
+            return []
+        raws = self._call("get_many", [self.make_key(namespace, *parts) for parts in keys])
+        values = []
+        for raw in raws:
+            value, hit = self._decode(raw)
+            metrics.increment("cache.hits" if hit else "cache.misses", namespace=namespace)
+            values.append(value)
+        return values
+
+    def set(
+        self,
+        namespace: str,
+        *parts: Any,
+        value: Any,
+        ttl: Optional[int] = None,
+        tags: Iterable[str] = ()
+    ):
+        envelope = {"value": value, "tags": self.tag_versions(tags)}
+        self._call("set", self.make_key(namespace, *parts), json.dumps(envelope, default=str), ttl or self.default_ttl)
+
+    def delete(self, namespace: str, *parts: Any):
+        self._call("delete", self.make_key(namespace, *parts))
+
+    def get_or_set(
+        self,
+        namespace: str,
+        *parts: Any,
+        factory: Callable[[], Any],
+        ttl: Optional[int] = None,
+        tags: Iterable[str] = ()
+    ) -> Any:
+        """
+        Cached value, or compute it with factory() and store it. Concurrent
+        misses on the same key compute it once: threads in this process share
+        a lock, and other processes wait on a short-lived lock key in the
+        backend, polling until the value appears or the lock times out.
+
+        Waiting blocks the calling thread for up to lock_timeout, so code on
+        the event loop must use aget_or_set instead.
+        """
+        key = self.make_key(namespace, *parts)
+        value, hit = self._lookup(key)
+        if hit:
+            metrics.increment("cache.hits", namespace=namespace)
+            return value
+
+        if self._on_event_loop():
+            metrics.increment("cache.loop_blocking_fills", namespace=namespace)
+            logger.warning(f"Cache fill for {namespace} is blocking the event loop; use aget_or_set")
+
+        key_lock = self._key_lock(key)
+        # A stuck holder only delays the others up to the lock timeout; then they compute it too
+        locked = key_lock.acquire(timeout=self.lock_timeout)
+        token = None
+        try:
+            value, hit = self._lookup(key)
+            if not hit:
+                token, value, hit = self._wait_for_remote_fill(key, namespace)
+            if hit:
+                metrics.increment("cache.hits", namespace=namespace)
+                return value
+
+            metrics.increment("cache.misses", namespace=namespace)
+            value = factory()
+            if value is not None:
+                self.set(namespace, *parts, value=value, ttl=ttl, tags=tags)
+            return value
+        finally:
+            if token is not None:
+                self._call("delete_if", f"{key}:lock", token)
+            if locked:
+                key_lock.release()
+
+    async def aget_or_set(
+        self,
+        namespace: str,
+        *parts: Any,
+        factory: Callable[[], Any],
+        ttl: Optional[int] = None,
+        tags: Iterable[str] = ()
+    ) -> Any:
+        """get_or_set for the event loop: the lookup, wait and factory run in a worker thread"""
+        return await asyncio.to_thread(
+            functools.partial(self.get_or_set, namespace, *parts, factory=factory, ttl=ttl, tags=tags)
+        )
+
+    def _lookup(self, key: str) -> Tuple[Optional[Any], bool]:
+        return self._decode(self._call("get_many", [key])[0])
+
+    def _decode(self, raw: Optional[str]) -> Tuple[Optional[Any], bool]:
+        if raw is None:
+            return None, False
+
+        try:
+            envelope = json.loads(raw)
+        except ValueError:
+            return None, False
+
+        stored_tags = envelope.get("tags") or {}
+        if stored_tags and self.tag_versions(stored_tags.keys()) != stored_tags:
+            return None, False
+
+        return envelope.get("value"), True
+
+    def _wait_for_remote_fill(self, key: str, namespace: str) -> Tuple[Optional[str], Optional[Any], bool]:
+        """
+        Take the fill lock, or wait for whoever holds it to publish the value.
+        Returns the lock token when this caller took the lock and must fill
+        the key, then the value and whether it was found.
+        """
+        lock_ttl = max(1, int(self.lock_timeout))
+        token = uuid.uuid4().hex
+        if self._call("add", f"{key}:lock", token, lock_ttl):
+            return token, None, False
+
+        metrics.increment("cache.lock_waits", namespace=namespace)
+        deadline = time.time() + self.lock_timeout
+        while time.time() < deadline:
+            time.sleep(0.05)
+            value, hit = self._lookup(key)
+            if hit:
+                return None, value, True
+
+        # The holder is slow or gone; compute it ourselves without touching its lock
+        return None, None, False
+
+    @staticmethod
+    def _on_event_loop() -> bool:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        return True
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._key_locks_guard:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                if len(self._key_locks) > 10000:
+                    self._key_locks.clear()
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def stats(self) -> Dict[str, Any]:
+        backend = self.backend
+        return {
+            "backend": backend.name,
+            "local_entries": self.local.size(),
+            "default_ttl": self.default_ttl
+        }
+
+
+cache = CacheService(
+    redis_url=settings.REDIS_URL if settings.CACHE_BACKEND == "redis" else None,
+    default_ttl=settings.REDIS_CACHE_TTL,
+    max_local_entries=settings.CACHE_MAX_LOCAL_ENTRIES,
+    key_prefix=settings.CACHE_KEY_PREFIX,
+    lock_timeout=settings.CACHE_LOCK_TIMEOUT
+)
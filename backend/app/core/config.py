@@ -18,6 +18,8 @@ class Settings(BaseSettings):
     # Server
     HOST: str = "0.0.0.0"
     PORT: int = 8000
+    SERVICE_WARMUP_ENABLED: bool = True  # Build and warm shared services before serving
+    EMBEDDING_BACKFILL_ENABLED: bool = True  # Re-embed stored vectors from another embedding model in the background after startup
     
     # Security
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-change-in-production-make-it-very-long-and-random")
@@ -32,16 +34,45 @@ class Settings(BaseSettings):
     # AI Services
     GOOGLE_AI_API_KEY: Optional[str] = os.getenv("GOOGLE_AI_API_KEY")
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
-    AI_MODEL: str = os.getenv("AI_MODEL", "gemini-2.5-flash")
+    AI_MODEL: str = os.getenv("AI_MODEL", "gemini-2.5-flash")  # "mock" selects the local mock provider
+    
+    # Mock LLM provider (offline load and latency testing)
+    MOCK_LLM_LATENCY_MS: float = 800.0  # Median full-response latency
+    MOCK_LLM_LATENCY_SIGMA: float = 0.3  # Log-normal spread around the median
+    MOCK_LLM_TTFT_MS: float = 250.0  # Median time to first streamed token
+    MOCK_LLM_TOKENS_PER_SECOND: float = 60.0
+    MOCK_LLM_OUTPUT_TOKENS: int = 80
+    MOCK_LLM_ERROR_RATE: float = 0.0  # Fraction of calls failing with a non-retryable error
+    MOCK_LLM_RATE_LIMIT_RATE: float = 0.0  # Fraction of calls failing with a retryable 429
+    MOCK_LLM_SEED: int = 0
+    
+    # LLM pricing for cost accounting: model -> USD per 1K "prompt", "completion" and "cached" input tokens
+    LLM_PRICING_PER_1K_TOKENS: Dict[str, Dict[str, float]] = {
+        "gemini-2.5-flash": {"prompt": 0.0003, "completion": 0.0025, "cached": 0.000075}
+    }
     
     # Vector Database
     PINECONE_API_KEY: Optional[str] = os.getenv("PINECONE_API_KEY")
     PINECONE_ENVIRONMENT: str = os.getenv("PINECONE_ENVIRONMENT", "us-east-1-aws")
     PINECONE_INDEX_NAME: str = os.getenv("PINECONE_INDEX_NAME", "chatbot-knowledge")
+    VECTOR_INDEX_MODE: str = os.getenv("VECTOR_INDEX_MODE", "memory")  # "memory" or "ondisk_ivf"
+    VECTOR_INDEX_NLIST: int = 4096  # Upper bound on IVF lists for the on-disk index
+    VECTOR_INDEX_NPROBE: int = 16  # IVF lists scanned per query
+    VECTOR_INDEX_TRAIN_SIZE: int = 200000  # Vectors sampled to train IVF centroids
+    VECTOR_INDEX_SAVE_EVERY: int = 256  # Single-entry adds between FAISS index saves; rows are persisted immediately
+    VECTOR_INDEX_ENABLED: bool = False  # FAISS index kept in sync with knowledge writes, managed under /knowledge/index
+    VECTOR_INDEX_STORAGE_DIR: str = os.getenv("VECTOR_INDEX_STORAGE_DIR", "/app/faiss_storage")
+    VECTOR_INDEX_MODEL: str = os.getenv("VECTOR_INDEX_MODEL", "all-MiniLM-L6-v2")
+    VECTOR_INDEX_MODEL_VERSION: str = "1"
     
     # Redis
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://redis:6379")
     REDIS_CACHE_TTL: int = 300  # 5 minutes
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "redis")  # "redis" or "memory"
+    CACHE_MAX_LOCAL_ENTRIES: int = 10000  # In-process LRU size when Redis is unavailable
+    CACHE_KEY_PREFIX: str = "biwoco"
+    CACHE_LOCK_TIMEOUT: int = 10  # Seconds a cache fill may hold its stampede lock
+    ANSWER_CACHE_TTL: int = 3600  # Exact-match first-turn answers
     
     # Background Jobs
     CELERY_BROKER_URL: str = os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0")
@@ -66,6 +97,69 @@ class Settings(BaseSettings):
     # Chat Settings
     MAX_CONVERSATION_LENGTH: int = 50  # Maximum messages per conversation
     AI_RESPONSE_TIMEOUT: int = 30  # seconds
+    AI_MAX_RETRIES: int = 2  # Retries on rate limits and transient upstream errors
+    AI_RETRY_BACKOFF_BASE: float = 0.5  # seconds, doubled per retry with full jitter
+    AI_HEDGE_PERCENTILE: Optional[float] = None  # e.g. 95 to hedge calls slower than p95
+    AI_CIRCUIT_FAILURE_THRESHOLD: float = 0.5  # Error rate that opens the circuit
+    AI_CIRCUIT_MIN_CALLS: int = 10  # Calls in the window before the error rate counts
+    AI_CIRCUIT_WINDOW_SECONDS: int = 60
+    AI_CIRCUIT_OPEN_SECONDS: int = 30  # Fail fast this long before probing again
+    AI_MAX_CONCURRENT_CALLS: int = 16  # Upstream LLM calls in flight per worker
+    AI_MAX_QUEUED_CALLS: int = 200  # Waiting calls beyond which new ones are rejected
+    AI_QUEUE_TIMEOUT: int = 20  # seconds a call may wait for a slot
+    AI_NATIVE_ASYNC: bool = True  # Use the SDK's async client where it exists
+    AI_EXECUTOR_MAX_WORKERS: int = 16  # Dedicated threads for blocking LLM SDK calls
+    AI_COALESCE_ENABLED: bool = True  # Identical concurrent turns share one generation
+    CHAT_PIPELINE_PREFETCH: bool = True  # Compute prompt prefix and retrieval alongside history loading
+    CHAT_PIPELINE_STAGE_TIMEOUTS: Dict[str, float] = {"history": 5.0, "prefix": 3.0, "retrieval": 3.0}  # seconds
+    CHAT_PIPELINE_MAX_WORKERS: int = 8  # Threads for prefix and retrieval prefetch, apart from the default pool
+    CONVERSATION_RECENT_MESSAGES: int = 6  # Messages always sent verbatim
+    CONVERSATION_SUMMARY_INTERVAL: int = 4  # Older messages folded into the rolling summary at a time
+    CONVERSATION_SUMMARY_MAX_WORDS: int = 200
+    CONVERSATION_SUMMARY_TTL: int = 604800  # 7 days
+    CONVERSATION_SUMMARY_MAX_CHUNK: int = 20  # Most messages folded per LLM call when catching up on a long history
+    
+    # Prompt Assembly
+    PROMPT_TEMPLATE_RELOAD_INTERVAL: float = 2.0  # seconds between template mtime checks; 0 disables reload
+    PROMPT_CUSTOM_RECHECK_SECONDS: float = 30.0  # Custom prompts re-check updated_at at most this often
+    PROMPT_TOKENIZER: str = "heuristic"  # "heuristic", "hf:<model>", "tiktoken:<encoding>", "gemini:<model>" or "provider" (AI_MODEL's own count_tokens, a network call per new text)
+    PROMPT_INPUT_TOKEN_BUDGET: int = 8000  # Default input tokens per turn
+    PROMPT_INPUT_TOKEN_BUDGETS: Dict[str, int] = {}  # Per-scenario overrides, keyed by scenario id
+    
+    # Gemini context caching of stable prompt prefixes
+    GEMINI_CONTEXT_CACHE_ENABLED: bool = False  # Register prompt prefixes as Gemini cached content
+    GEMINI_CONTEXT_CACHE_TTL: int = 3600  # seconds
+    GEMINI_CONTEXT_CACHE_MIN_TOKENS: int = 1024  # Provider minimum for cached content
+    GEMINI_CONTEXT_CACHE_MAX_SCENARIOS: int = 64  # Scenarios whose prefix registration is tracked
+    
+    # Semantic Response Cache
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92  # Minimum cosine similarity to reuse an answer
+    SEMANTIC_CACHE_EMBEDDING_MODEL: str = os.getenv("SEMANTIC_CACHE_EMBEDDING_MODEL", "")  # SentenceTransformer for paraphrase hits; empty keeps the cache exact-match only
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 1000  # Per scenario
+    SEMANTIC_CACHE_TTL: int = 3600  # seconds
+    STALE_ANSWERS_ENABLED: bool = True  # Serve the closest recent answer while the LLM is failing
+    STALE_ANSWER_THRESHOLD: float = 0.9  # Minimum cosine similarity to the stored question, which must share the turn's retrieved knowledge
+    STALE_ANSWER_UNGROUNDED_THRESHOLD: float = 0.97  # Minimum similarity when the turn's retrieval is unknown
+    STALE_ANSWER_MAX_ENTRIES: int = 500  # Per scenario
+    STALE_ANSWER_MAX_AGE: int = 86400  # seconds
+    STALE_ANSWER_MIN_KNOWLEDGE_HITS: int = 1  # Only answers grounded in at least this many retrieved entries are kept
+    
+    # Fast-path intent router (answers simple turns without the LLM)
+    INTENT_ROUTER_ENABLED: bool = True
+    INTENT_ROUTER_THRESHOLD: float = 0.45  # Minimum similarity to an intent centroid
+    INTENT_ROUTER_MARGIN: float = 0.2  # Required lead over the next closest intent, including domain questions
+    INTENT_ROUTER_FAQ_THRESHOLD: float = 0.9  # Minimum similarity to a curated FAQ question
+    INTENT_ROUTER_MAX_WORDS: int = 12  # Longer turns always go to the LLM
+    INTENT_ROUTER_REFRESH_SECONDS: int = 300  # Rebuild per-scenario centroids at most this often
+    
+    # Speculative retrieval from WebSocket typing drafts
+    SPECULATIVE_RETRIEVAL_ENABLED: bool = True
+    SPECULATIVE_RETRIEVAL_SIMILARITY: float = 0.85  # Minimum draft/final similarity to reuse results
+    SPECULATIVE_RETRIEVAL_TTL: int = 60  # seconds a draft's results stay usable
+    SPECULATIVE_RETRIEVAL_MIN_CHARS: int = 12  # Shorter drafts are not worth retrieving for
+    SPECULATIVE_RETRIEVAL_MIN_INTERVAL: float = 0.5  # seconds between retrievals per conversation
+    SPECULATIVE_RETRIEVAL_MAX_WORKERS: int = 4  # Threads for draft retrieval, apart from the default pool
     
     # Rate Limiting
     RATE_LIMIT_REQUESTS: int = 100
@@ -80,4 +80,18 @@ def get_current_active_user(
         db.commit()
         db.refresh(admin_user)
     
-    return admin_user
\ No newline at end of file
+    return admin_user
+
+
+def get_current_admin_user(
+    current_user: User = Depends(get_current_active_user),
+) -> User:
+    """
+    Get current user, requiring the admin role
+    """
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required"
+        )
+    return current_user
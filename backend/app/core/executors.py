@@ -0,0 +1,86 @@
+"""
+Dedicated, size-bounded thread pools for blocking upstream calls
+"""
+
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, TypeVar
+
+from app.core.metrics import metrics
+
+T = TypeVar("T")
+
+
+class BoundedExecutor:
+    """
+    A thread pool reserved for one kind of blocking work, so it cannot take
+    the default pool that FastAPI's threadpool and file I/O share. Work
+    beyond max_workers waits in the pool's queue; that wait and the pool's
+    occupancy are exported as saturation metrics.
+    """
+
+    def __init__(self, name: str, max_workers: int = 8):
+        self.name = name
+        self.max_workers = max_workers
+        self.active = 0
+        self.pending = 0
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-executor")
+        self._lock = threading.Lock()
+
+    async def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run fn(*args, **kwargs) on the pool without blocking the event loop"""
+        submitted_at = time.perf_counter()
+        with self._lock:
+            self.pending += 1
+            if self.active + self.pending > self.max_workers:
+                metrics.increment("executor.saturated", executor=self.name)
+            self._update_gauges()
+
+        # Shared with the worker so a cancelled, never-started call leaves the queue exactly once
+        ticket = {"started": False, "abandoned": False}
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self._pool,
+                functools.partial(self._invoke, ticket, submitted_at, fn, args, kwargs)
+            )
+        except asyncio.CancelledError:
+            with self._lock:
+                if not ticket["started"]:
+                    ticket["abandoned"] = True
+                    self.pending -= 1
+                    self._update_gauges()
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "pending": self.pending,
+            "max_workers": self.max_workers,
+            "utilization": round(self.active / self.max_workers, 3) if self.max_workers else 0.0
+        }
+
+    def shutdown(self, wait: bool = False):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+    def _invoke(self, ticket: Dict[str, bool], submitted_at: float, fn: Callable[..., T], args: tuple, kwargs: dict) -> T:
+        with self._lock:
+            ticket["started"] = True
+            if not ticket["abandoned"]:
+                self.pending -= 1
+            self.active += 1
+            self._update_gauges()
+        metrics.observe("executor.queue_wait_ms", (time.perf_counter() - submitted_at) * 1000, executor=self.name)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self._update_gauges()
+
+    def _update_gauges(self):
+        metrics.set_gauge("executor.active", self.active, executor=self.name)
+        metrics.set_gauge("executor.pending", self.pending, executor=self.name)
@@ -0,0 +1,130 @@
+"""
+In-process metrics registry for latency, throughput and cache instrumentation
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Optional, Tuple
+
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Histogram:
+    """Running count/sum/min/max plus a window of recent values for percentiles"""
+
+    def __init__(self, window_size: int = 1024):
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.recent: Deque[float] = deque(maxlen=window_size)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.recent.append(value)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Percentile (0-100) over the recent window, nearest-rank method"""
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        rank = max(1, math.ceil(pct / 100 * len(ordered)))
+        return ordered[min(rank, len(ordered)) - 1]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "avg": round(self.total / self.count, 3) if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99)
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and histograms keyed by name and labels"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[MetricKey, float] = {}
+        self._gauges: Dict[MetricKey, float] = {}
+        self._histograms: Dict[MetricKey, Histogram] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> MetricKey:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    @staticmethod
+    def _format_key(key: MetricKey) -> str:
+        name, labels = key
+        if not labels:
+            return name
+        return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+    def increment(self, name: str, value: float = 1.0, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def get_counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0.0)
+
+    def get_gauge(self, name: str, **labels) -> Optional[float]:
+        with self._lock:
+            return self._gauges.get(self._key(name, labels))
+
+    def percentile(self, name: str, pct: float, **labels) -> Optional[float]:
+        with self._lock:
+            histogram = self._histograms.get(self._key(name, labels))
+            return histogram.percentile(pct) if histogram else None
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the wall time of the block in milliseconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000, **labels)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": {self._format_key(k): v for k, v in sorted(self._counters.items())},
+                "gauges": {self._format_key(k): v for k, v in sorted(self._gauges.items())},
+                "histograms": {
+                    self._format_key(k): h.summary() for k, h in sorted(self._histograms.items())
+                }
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,260 @@
+"""
+Deadlines, retries, hedging and circuit breaking for upstream calls
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, Tuple, TypeVar
+
+from app.core.metrics import Histogram, metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Gauge values for circuit_breaker.state
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+# Upstream errors worth retrying: rate limits and transient server failures
+RETRYABLE_ERRORS = {
+    "ResourceExhausted",
+    "TooManyRequests",
+    "ServiceUnavailable",
+    "InternalServerError",
+    "DeadlineExceeded"
+}
+RETRYABLE_STATUS_CODES = {429, 500, 503}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    if type(error).__name__ in RETRYABLE_ERRORS:
+        return True
+    code = getattr(error, "code", None)
+    return code in RETRYABLE_STATUS_CODES
+
+
+class CircuitBreaker:
+    """
+    Error-rate circuit breaker over a sliding time window.
+
+    Closed: calls pass; opens when at least min_calls in the window failed
+    at failure_threshold or more. Open: calls fail fast for open_seconds.
+    Half-open: one probe call at a time; success closes, failure re-opens.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: float = 0.5,
+        min_calls: int = 10,
+        window_seconds: float = 60.0,
+        open_seconds: float = 30.0
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        metrics.set_gauge("circuit_breaker.state", BREAKER_STATES["closed"], upstream=name)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self._transition("half_open")
+
+            if self.state == "half_open":
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_in_flight = False
+                self._outcomes.clear()
+                self._transition("closed")
+                return
+            self._record(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_in_flight = False
+                self._open()
+                return
+            self._record(False)
+
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if (
+                self.state == "closed"
+                and len(self._outcomes) >= self.min_calls
+                and failures / len(self._outcomes) >= self.failure_threshold
+            ):
+                self._open()
+
+    def release(self):
+        """Give back a half-open probe slot when the call was abandoned without an outcome"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _record(self, ok: bool):
+        now = time.monotonic()
+        self._outcomes.append((now, ok))
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self._transition("open")
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        logger.warning(f"Circuit breaker '{self.name}' {self.state} -> {state}")
+        self.state = state
+        metrics.set_gauge("circuit_breaker.state", BREAKER_STATES[state], upstream=self.name)
+        metrics.increment("circuit_breaker.transitions", upstream=self.name, to=state)
+
+
+class ResilientCaller:
+    """
+    Runs an async upstream call under an overall deadline, with:
+
+    - exponential backoff with full jitter on retryable errors
+    - an optional hedged second attempt once the first has run longer than
+      the given percentile of recent successful latencies
+    - a circuit breaker that fails fast while the upstream is unhealthy
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float = 30.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        hedge_percentile: Optional[float] = None,
+        hedge_min_samples: int = 20,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker
+        self.latencies = Histogram(window_size=512)
+
+    async def call(
+        self,
+        operation: Callable[[], Awaitable[T]],
+        timeout: Optional[float] = None,
+        record_success: bool = True
+    ) -> T:
+        """
+        Result of operation(); raises CircuitOpenError without calling when
+        the circuit is open, asyncio.TimeoutError when the deadline passes,
+        or the last upstream error once retries are exhausted.
+
+        With record_success=False a successful result (e.g. an opened stream
+        whose body is still to be read) records nothing, and the caller must
+        settle the call with exactly one of breaker.record_success,
+        record_failure or release. Failures are always recorded here.
+        """
+        if self.breaker and not self.breaker.allow():
+            metrics.increment("resilience.fast_failures", upstream=self.name)
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+
+        deadline = time.monotonic() + (timeout or self.timeout)
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                start = time.monotonic()
+                result = await asyncio.wait_for(self._attempt(operation), remaining)
+                self.latencies.observe((time.monotonic() - start) * 1000)
+                if self.breaker and record_success:
+                    self.breaker.record_success()
+                return result
+            except asyncio.CancelledError:
+                if self.breaker:
+                    self.breaker.release()
+                raise
+            except asyncio.TimeoutError:
+                metrics.increment("resilience.timeouts", upstream=self.name)
+                if self.breaker:
+                    self.breaker.record_failure()
+                raise
+            except Exception as e:
+                delay = self._backoff(attempt)
+                if not is_retryable(e) or attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                    if self.breaker:
+                        self.breaker.record_failure()
+                    raise
+
+                attempt += 1
+                metrics.increment("resilience.retries", upstream=self.name)
+                logger.info(f"{self.name} call failed with {type(e).__name__}, retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def _attempt(self, operation: Callable[[], Awaitable[T]]) -> T:
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is None:
+            return await operation()
+
+        primary = asyncio.ensure_future(operation())
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        metrics.increment("resilience.hedges", upstream=self.name)
+        hedge = asyncio.ensure_future(operation())
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            metrics.increment("resilience.hedge_wins", upstream=self.name)
+                        return task.result()
+                if not pending:
+                    # Both attempts failed; surface the primary's error
+                    return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None when hedging is off or unsafe"""
+        if self.hedge_percentile is None or self.latencies.count < self.hedge_min_samples:
+            return None
+        # Extra load on a struggling upstream makes things worse
+        if self.breaker and self.breaker.state != "closed":
+            return None
+        latency_ms = self.latencies.percentile(self.hedge_percentile)
+        return latency_ms / 1000 if latency_ms else None
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
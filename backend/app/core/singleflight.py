@@ -0,0 +1,85 @@
+"""
+Single-flight coalescing of identical concurrent calls
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from app.core.metrics import metrics
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one execution: the first
+    caller (the leader) runs it, later callers wait for its result. A key
+    is only shared while the leader is in flight; nothing is cached after.
+    If the leader is cancelled, one waiting caller takes over as leader
+    and the others wait for it instead. Runs on a single event loop.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, operation: Callable[[], Awaitable[T]]) -> T:
+        # After a cancelled leader, the first waiter to wake leads and the rest join it
+        shared = self.join(key)
+        while shared is not None:
+            result = await self.wait(shared)
+            if result is not None:
+                return result
+            shared = self.join(key)
+
+        future = self.begin(key)
+        try:
+            result = await operation()
+        except BaseException as e:
+            self.end(key, future, error=e)
+            raise
+        self.end(key, future, result)
+        return result
+
+    def join(self, key: Hashable) -> Optional[asyncio.Future]:
+        """The leader's pending result for key, or None when no call is in flight"""
+        future = self._calls.get(key)
+        if future is None or future.done():
+            return None
+        metrics.increment("singleflight.coalesced", group=self.name)
+        return future
+
+    async def wait(self, future: asyncio.Future) -> Optional[Any]:
+        """Leader's result; None when the leader was cancelled and the caller should run the call itself"""
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if future.cancelled():
+                metrics.increment("singleflight.leader_cancelled", group=self.name)
+                return None
+            raise
+
+    def begin(self, key: Hashable) -> asyncio.Future:
+        """Register the caller as leader for key"""
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        metrics.increment("singleflight.executed", group=self.name)
+        return future
+
+    def end(self, key: Hashable, future: asyncio.Future, result: Any = None, error: Optional[BaseException] = None):
+        """Publish the leader's outcome to its waiting callers and release the key if it still holds it"""
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if future.done():
+            return
+        if error is None:
+            future.set_result(result)
+        elif isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            future.cancel()
+        else:
+            future.set_exception(error)
+            # Waiters observe the error; don't warn about it going unretrieved
+            future.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
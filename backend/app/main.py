@@ -2,14 +2,22 @@
 Main FastAPI application for BIWOCO AI Customer Support Chatbot
 """
 
-from fastapi import FastAPI, WebSocket
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+import asyncio
 import logging
 
 from app.api.v1.api import api_router
 from app.core.config import settings
 from app.core.database import engine, Base
+from app.core.dependencies import get_current_admin_user
+from app.core.cache import cache
+from app.core.metrics import metrics
+from app.services.container import services
+from app.services.llm_providers import llm_executor
+from app.services.usage_accounting import usage_ledger
 from app.utils.websocket import WebSocketManager
 
 # Import all models to ensure they are registered
@@ -22,13 +30,30 @@ logger = logging.getLogger(__name__)
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build and warm shared services before the worker accepts requests"""
+    if settings.SERVICE_WARMUP_ENABLED:
+        await asyncio.to_thread(services.warm)
+    app.state.services = services
+    # Stale stored embeddings are fixed up behind live traffic, not before it
+    backfill = (
+        asyncio.create_task(asyncio.to_thread(services.backfill_embeddings))
+        if settings.EMBEDDING_BACKFILL_ENABLED else None
+    )
+    yield
+    if backfill is not None and not backfill.done():
+        logger.info("Stopping the embedding backfill after its current batch; committed batches are kept")
+    services.shutdown()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="BIWOCO AI Customer Support Chatbot API",
     description="Multi-scenario AI-powered customer support assistant with real-time chat capabilities",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -71,10 +96,20 @@ async def websocket_endpoint(websocket: WebSocket, conversation_id: str):
 async def health_check():
     """Health check for monitoring"""
     return JSONResponse(
-        content={"status": "healthy", "service": "chatbot-api"},
+        content={"status": "healthy", "service": "chatbot-api", "ready": services.ready},
         status_code=200
     )
 
+@app.get("/metrics")
+async def get_metrics(current_user: User = Depends(get_current_admin_user)):
+    """In-process performance metrics for this worker (admin only)"""
+    return {
+        **metrics.snapshot(),
+        "cache": cache.stats(),
+        "llm_executor": llm_executor.stats(),
+        "llm_usage": usage_ledger.snapshot()
+    }
+
 if __name__ == "__main__":
     import uvicorn
     import os
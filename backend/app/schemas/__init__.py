@@ -5,7 +5,7 @@ Schema definitions for BIWOCO AI Customer Support Chatbot
 from .conversation import ConversationCreate, ConversationUpdate, ConversationResponse
 from .message import MessageCreate, MessageResponse, MessageUpdate
 from .user import UserCreate, UserUpdate, User, UserResponse
-from .knowledge import KnowledgeBase, KnowledgeBaseCreate, KnowledgeBaseUpdate
+from .knowledge import KnowledgeBase, KnowledgeBaseCreate, KnowledgeBaseUpdate, VectorIndexReembed
 
 # Create aliases for backward compatibility
 Conversation = ConversationResponse
@@ -26,5 +26,6 @@ __all__ = [
     "User",
     "KnowledgeBase",
     "KnowledgeBaseCreate",
-    "KnowledgeBaseUpdate"
+    "KnowledgeBaseUpdate",
+    "VectorIndexReembed"
 ]
@@ -4,7 +4,7 @@ Knowledge base schemas
 
 from typing import Optional, List, Dict, Any
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 
 
 class KnowledgeBaseBase(BaseModel):
@@ -31,10 +31,24 @@ class KnowledgeBaseInDBBase(KnowledgeBaseBase):
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
 
+    @field_validator("embedding", mode="before")
+    @classmethod
+    def unwrap_embedding(cls, value: Any) -> Any:
+        # Stored embeddings are tagged with their model: {"model_id", "model_version", "vector"}
+        if isinstance(value, dict):
+            return value.get("vector")
+        return value
+
     class Config:
         from_attributes = True
 
 
+class VectorIndexReembed(BaseModel):
+    model_name: str
+    model_version: str = "1"
+    dual_read: bool = False
+
+
 class KnowledgeBase(KnowledgeBaseInDBBase):
     pass
 
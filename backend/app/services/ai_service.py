@@ -2,135 +2,658 @@
 Enhanced AI Service with RAG and context-aware prompt generation
 """
 
-import google.generativeai as genai
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, AsyncIterator, Awaitable, Callable, Tuple
 from pydantic import BaseModel
 import asyncio
+import hashlib
+import json
 import logging
+import time
 from sqlalchemy.orm import Session
 
+from app.core.admission import AdmissionController, AdmissionRejected, Priority
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+from app.core.singleflight import SingleFlight
 from app.models.conversation import ScenarioType
-from app.services.prompt_service import PromptService
+from app.services.intent_router import intent_router
+from app.services.llm_providers import LLMProvider, LLMUsage, get_llm_provider, provider_name
+from app.services.prompt_assembler import token_counter
+from app.services.prompt_service import RETRIEVAL_LIMIT, PromptParts, PromptService
+from app.services.response_cache_service import semantic_response_cache, stale_answers
 from app.services.scenario_service import ScenarioService
+from app.services.usage_accounting import TurnUsage, usage_ledger
 
 logger = logging.getLogger(__name__)
 
-# Configure Gemini AI
-if settings.GOOGLE_AI_API_KEY:
-    genai.configure(api_key=settings.GOOGLE_AI_API_KEY)
-
 
 class AIResponse(BaseModel):
     content: str
     model: str
-    tokens_used: Optional[int] = None
+    tokens_used: Optional[int] = None  # Prompt plus completion tokens billed for this response
+    prompt_tokens: Optional[int] = None  # Provider-reported input tokens, else the assembly estimate
+    completion_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None  # Input tokens served from the provider's context cache
+    cost_usd: Optional[float] = None
+    usage_source: Optional[str] = None  # "provider" or "estimate"
     confidence: Optional[float] = None
     context_used: Optional[List[str]] = None  # Sources used in response
     knowledge_entries: Optional[List[int]] = None  # Knowledge base IDs used
+    time_to_first_token_ms: Optional[int] = None  # Streamed responses only
+    cached: bool = False  # Served from the semantic response cache
+    stale: bool = False  # A recent answer to a similar question, served while the LLM was failing
+    intent: Optional[str] = None  # Set when the intent router answered without the LLM
+
+    def usage_metadata(self) -> Dict[str, Any]:
+        """Token split and cost as stored with the assistant message"""
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cost_usd": self.cost_usd,
+            "usage_source": self.usage_source
+        }
+
+
+class AIStreamChunk(BaseModel):
+    """One incremental piece of a streamed response; the last chunk carries the full response"""
+    sequence: int
+    delta: str = ""
+    done: bool = False
+    response: Optional[AIResponse] = None
 
 
 class AIService:
-    def __init__(self):
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+    def __init__(self, provider: Optional[LLMProvider] = None):
+        self._provider = provider
         self.prompt_service = PromptService()
         self.scenario_service = ScenarioService()
     
+    @property
+    def provider(self) -> LLMProvider:
+        """The given provider, else the process's shared one (built on first use)"""
+        return self._provider or get_llm_provider()
+    
     async def generate_response(
         self,
         message: str,
         scenario_type: Union[ScenarioType, str],
         conversation_context: List[Dict[str, Any]] = None,
-        db: Session = None
+        db: Session = None,
+        conversation_summary: Optional[str] = None,
+        priority: int = Priority.STANDARD,
+        on_queue_position: Optional[Callable[[int], Awaitable[None]]] = None
     ) -> AIResponse:
         """Generate context-aware AI response using RAG"""
+        start_time = time.perf_counter()
+        scenario_id = self._scenario_id(scenario_type)
+        cacheable = not conversation_summary and self._is_cacheable(message, conversation_context)
         try:
-            # Handle both built-in ScenarioType and custom scenario strings
-            scenario_id = scenario_type.value if isinstance(scenario_type, ScenarioType) else scenario_type
+            if cacheable:
+                cached_response = await self._cached_response(scenario_id, scenario_type, message, db)
+                if cached_response:
+                    return cached_response
             
-            # Get system prompt (built-in or custom)
-            if db:
-                system_prompt = self.scenario_service.get_system_prompt(scenario_id, db)
-            else:
-                # Fallback to prompt service for built-in scenarios
-                if isinstance(scenario_type, ScenarioType):
-                    system_prompt = self.prompt_service.load_prompt_template(scenario_type)
-                else:
-                    system_prompt = "You are a helpful customer support assistant."
+            routed_response = await self._routed_response(scenario_id, message, db)
+            if routed_response:
+                return routed_response
             
-            # Get business context for this scenario
-            business_context = None
-            if db:
-                business_context = self.prompt_service.get_business_context_for_scenario(
-                    scenario_type, db
+            async def generate() -> AIResponse:
+                # Assembly queries the database and may wait on a shared cache fill, so it runs off the loop
+                prompt = await asyncio.to_thread(
+                    self._build_prompt, message, scenario_type, conversation_context, db, conversation_summary
+                )
+                
+                nonlocal led
+                led = True
+                
+                # Generate once admitted, under the deadline, retry and breaker policy
+                async with llm_admission.admit(scenario_id, priority, on_queue_position):
+                    llm_start = time.perf_counter()
+                    result = await llm_caller.call(lambda: self.provider.generate(prompt))
+                    llm_ms = (time.perf_counter() - llm_start) * 1000
+                
+                # Extract knowledge sources used
+                context_sources, knowledge_ids = await asyncio.to_thread(
+                    self._collect_knowledge_sources, message, scenario_id, db
                 )
+                
+                elapsed_ms = int((time.perf_counter() - start_time) * 1000)
+                metrics.observe("ai.generation_ms", elapsed_ms, scenario=scenario_id, mode="complete")
+                
+                usage = usage_ledger.record(
+                    scenario_id, result.model, result.usage, llm_ms,
+                    prompt.token_count, await self._completion_tokens(result.usage, result.text)
+                )
+                ai_response = AIResponse(
+                    content=result.text,
+                    model=result.model,
+                    **self._usage_fields(usage),
+                    confidence=0.9,
+                    context_used=context_sources,
+                    knowledge_entries=knowledge_ids
+                )
+                if cacheable:
+                    await self._store_cached_response(scenario_id, message, ai_response, prompt.prefix.fingerprint)
+                await self._remember_answer(scenario_id, message, ai_response)
+                return ai_response
             
-            # Build context-aware prompt using RAG
-            full_prompt = self.prompt_service.build_context_aware_prompt(
-                scenario=scenario_type,
-                user_message=message,
-                conversation_history=conversation_context,
-                business_context=business_context,
-                db=db
+            led = False
+            if not settings.AI_COALESCE_ENABLED:
+                return await generate()
+            
+            # Identical concurrent turns share one retrieval and LLM call; only the leader is billed
+            flight_key = self._flight_key(scenario_id, message, conversation_context, conversation_summary)
+            response = await llm_flights.do(flight_key, generate)
+            return response if led else self._shared_response(response)
+            
+        except (CircuitOpenError, AdmissionRejected):
+            # Upstream is unhealthy or saturated; answer immediately instead of piling on
+            return await self._grounded_fallback(scenario_type, message, db)
+        except Exception as e:
+            logger.error(f"AI service error: {e!r}")
+            metrics.increment("ai.errors", scenario=scenario_id)
+            return await self._grounded_fallback(scenario_type, message, db)
+    
+    async def stream_response(
+        self,
+        message: str,
+        scenario_type: Union[ScenarioType, str],
+        conversation_context: List[Dict[str, Any]] = None,
+        db: Session = None,
+        conversation_summary: Optional[str] = None,
+        priority: int = Priority.STANDARD,
+        on_queue_position: Optional[Callable[[int], Awaitable[None]]] = None,
+        knowledge_ids: Optional[List[int]] = None
+    ) -> AsyncIterator[AIStreamChunk]:
+        """
+        Stream a context-aware AI response as it is generated.
+        Yields numbered delta chunks, then a final chunk with done=True whose
+        response holds the complete content and metadata. If generation fails
+        part-way, the final response carries the fallback content, which
+        replaces anything streamed before it. knowledge_ids is a ranking
+        already retrieved for this turn, used instead of searching.
+        """
+        start_time = time.perf_counter()
+        scenario_id = self._scenario_id(scenario_type)
+        cacheable = not conversation_summary and self._is_cacheable(message, conversation_context)
+        
+        local_response = None
+        if cacheable:
+            local_response = await self._cached_response(scenario_id, scenario_type, message, db)
+        if local_response is None:
+            local_response = await self._routed_response(scenario_id, message, db)
+        
+        flight_key = None
+        if local_response is None and settings.AI_COALESCE_ENABLED:
+            # An identical turn already generating: wait for its answer instead of calling again
+            flight_key = self._flight_key(scenario_id, message, conversation_context, conversation_summary)
+            # A cancelled leader yields None; rejoin whichever waiter took over before leading ourselves
+            shared = llm_flights.join(flight_key)
+            while shared is not None:
+                try:
+                    local_response = await llm_flights.wait(shared)
+                    if local_response is not None:
+                        local_response = self._shared_response(local_response)
+                except Exception:
+                    local_response = await self._grounded_fallback(scenario_type, message, db, knowledge_ids)
+                shared = llm_flights.join(flight_key) if local_response is None else None
+        
+        if local_response:
+            # The whole answer is the first token
+            local_response = local_response.model_copy(
+                update={"time_to_first_token_ms": int((time.perf_counter() - start_time) * 1000)}
             )
+            yield AIStreamChunk(sequence=1, delta=local_response.content)
+            yield AIStreamChunk(sequence=2, done=True, response=local_response)
+            return
+        
+        flight = llm_flights.begin(flight_key) if flight_key is not None else None
+        generation = self._stream_generation(
+            message, scenario_type, scenario_id, conversation_context, db,
+            conversation_summary, priority, on_queue_position, start_time, cacheable, knowledge_ids
+        )
+        try:
+            async for chunk in generation:
+                if chunk.done and flight is not None:
+                    llm_flights.end(flight_key, flight, chunk.response)
+                yield chunk
+        except BaseException as e:
+            if flight is not None:
+                llm_flights.end(flight_key, flight, error=e)
+            raise
+        finally:
+            # A client that stops reading must not keep the upstream slot
+            await generation.aclose()
+    
+    async def _stream_generation(
+        self,
+        message: str,
+        scenario_type: Union[ScenarioType, str],
+        scenario_id: str,
+        conversation_context: Optional[List[Dict[str, Any]]],
+        db: Optional[Session],
+        conversation_summary: Optional[str],
+        priority: int,
+        on_queue_position: Optional[Callable[[int], Awaitable[None]]],
+        start_time: float,
+        cacheable: bool,
+        retrieved_ids: Optional[List[int]] = None
+    ) -> AsyncIterator[AIStreamChunk]:
+        """Stream a fresh generation; the last chunk carries the response (or the fallback)"""
+        sequence = 0
+        parts: List[str] = []
+        time_to_first_token_ms = None
+        usage = None
+        
+        try:
+            # Assembly queries the database and may wait on a shared cache fill, so it runs off the loop
+            prompt = await asyncio.to_thread(
+                self._build_prompt, message, scenario_type, conversation_context, db,
+                conversation_summary, retrieved_ids
+            )
+            
+            async with llm_admission.admit(scenario_id, priority, on_queue_position):
+                # Opening the stream goes through the resilience policy; chunks share its deadline
+                llm_start = time.perf_counter()
+                deadline = time.monotonic() + settings.AI_RESPONSE_TIMEOUT
+                # The call's breaker outcome is settled once, when the stream ends
+                chunks = await llm_caller.call(lambda: self.provider.open_stream(prompt), record_success=False)
+                settled = False
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(
+                                chunks.__anext__(),
+                                max(0.0, deadline - time.monotonic())
+                            )
+                        except StopAsyncIteration:
+                            break
+                        except Exception:
+                            settled = True
+                            llm_breaker.record_failure()
+                            raise
+                        
+                        # Providers report usage on the final chunk
+                        usage = chunk.usage or usage
+                        text = chunk.text
+                        if not text:
+                            continue
+                        
+                        if time_to_first_token_ms is None:
+                            time_to_first_token_ms = int((time.perf_counter() - start_time) * 1000)
+                            metrics.observe("ai.time_to_first_token_ms", time_to_first_token_ms, scenario=scenario_id)
+                        
+                        parts.append(text)
+                        sequence += 1
+                        yield AIStreamChunk(sequence=sequence, delta=text)
+                    
+                    settled = True
+                    llm_breaker.record_success()
+                finally:
+                    if not settled:
+                        # The client went away mid-stream: no verdict on the upstream
+                        llm_breaker.release()
             
-            # Generate response using Gemini
-            response = await asyncio.to_thread(
-                self.model.generate_content,
-                full_prompt
+            content = "".join(parts)
+            context_sources, knowledge_ids = await asyncio.to_thread(
+                self._collect_knowledge_sources, message, scenario_id, db, retrieved_ids
+            )
+            metrics.observe(
+                "ai.generation_ms",
+                int((time.perf_counter() - start_time) * 1000),
+                scenario=scenario_id,
+                mode="stream"
             )
             
-            # Extract knowledge sources used
-            context_sources = []
-            knowledge_ids = []
+            turn_usage = usage_ledger.record(
+                scenario_id, self.provider.model, usage, (time.perf_counter() - llm_start) * 1000,
+                prompt.token_count, await self._completion_tokens(usage, content)
+            )
+            response = AIResponse(
+                content=content,
+                model=self.provider.model,
+                **self._usage_fields(turn_usage),
+                confidence=0.9,
+                context_used=context_sources,
+                knowledge_entries=knowledge_ids,
+                time_to_first_token_ms=time_to_first_token_ms
+            )
+            if cacheable and content:
+                await self._store_cached_response(scenario_id, message, response, prompt.prefix.fingerprint)
+            await self._remember_answer(scenario_id, message, response)
             
-            if db:
-                # Get the knowledge entries that were used
-                relevant_knowledge = self.prompt_service.knowledge_service.semantic_search(
+        except Exception as e:
+            if not isinstance(e, (CircuitOpenError, AdmissionRejected)):
+                logger.error(f"AI streaming error: {e!r}")
+                metrics.increment("ai.errors", scenario=scenario_id)
+            response = await self._grounded_fallback(scenario_type, message, db, retrieved_ids)
+            if not parts:
+                # Clients that only render deltas still see the fallback text
+                sequence += 1
+                yield AIStreamChunk(sequence=sequence, delta=response.content)
+        
+        yield AIStreamChunk(sequence=sequence + 1, done=True, response=response)
+    
+    def _build_prompt(
+        self,
+        message: str,
+        scenario_type: Union[ScenarioType, str],
+        conversation_context: Optional[List[Dict[str, Any]]],
+        db: Optional[Session],
+        conversation_summary: Optional[str] = None,
+        knowledge_ids: Optional[List[int]] = None
+    ) -> PromptParts:
+        """Assemble the RAG prompt for a turn as a stable prefix and a per-turn suffix (blocking)"""
+        # System prompt and business context are shared by every turn of the scenario;
+        # the per-turn part is built with RAG and the whole prompt is kept within budget
+        start_time = time.perf_counter()
+        prompt = self.prompt_service.assemble_prompt(
+            scenario=scenario_type,
+            user_message=message,
+            conversation_history=conversation_context,
+            db=db,
+            conversation_summary=conversation_summary,
+            knowledge_ids=knowledge_ids
+        )
+        # Near zero when the turn pipeline already computed the prefix and retrieval
+        metrics.observe(
+            "ai.prompt_build_ms",
+            (time.perf_counter() - start_time) * 1000,
+            scenario=self._scenario_id(scenario_type)
+        )
+        return prompt
+    
+    def _collect_knowledge_sources(
+        self,
+        message: str,
+        scenario_id: str,
+        db: Optional[Session],
+        retrieved_ids: Optional[List[int]] = None
+    ) -> Tuple[List[str], List[int]]:
+        """Titles and ids of the knowledge entries used for a response"""
+        context_sources = []
+        knowledge_ids = []
+        
+        if db:
+            # Get the knowledge entries that were used
+            knowledge_service = self.prompt_service.knowledge_service
+            if retrieved_ids is not None:
+                relevant_knowledge = knowledge_service.get_entries_by_ids(retrieved_ids, db)
+            else:
+                relevant_knowledge = knowledge_service.semantic_search(
                     message, 
-                    limit=3, 
+                    limit=RETRIEVAL_LIMIT, 
                     db=db,
                     category=f"{scenario_id}_BUSINESS_CONTEXT"
                 )
-                
-                for knowledge in relevant_knowledge:
-                    context_sources.append(knowledge.title)
-                    knowledge_ids.append(knowledge.id)
             
-            return AIResponse(
-                content=response.text,
-                model="gemini-2.5-flash",
-                tokens_used=self._estimate_tokens(response.text),
-                confidence=0.9,
-                context_used=context_sources,
-                knowledge_entries=knowledge_ids
+            for knowledge in relevant_knowledge:
+                context_sources.append(knowledge.title)
+                knowledge_ids.append(knowledge.id)
+        
+        return context_sources, knowledge_ids
+    
+    @staticmethod
+    def _is_cacheable(message: str, conversation_context: Optional[List[Dict[str, Any]]]) -> bool:
+        """
+        Only first-turn questions are answered from the cache; once a conversation
+        has history, the answer depends on it. The context may already include the
+        current user message, which does not count as history.
+        """
+        if not settings.SEMANTIC_CACHE_ENABLED:
+            return False
+        for entry in conversation_context or []:
+            if str(entry.get("role", "")).lower() != "user" or entry.get("content") != message:
+                return False
+        return True
+    
+    async def _cached_response(
+        self,
+        scenario_id: str,
+        scenario_type: Union[ScenarioType, str],
+        message: str,
+        db: Optional[Session]
+    ) -> Optional[AIResponse]:
+        """Cached answer to a first-turn question under the scenario's current prompt prefix, if any"""
+        try:
+            # The prefix is cached per knowledge version; building it may still query the database
+            prefix = await asyncio.to_thread(self.prompt_service.get_prompt_prefix, scenario_type, db)
+            # Embedding the message and reading Redis block, so the lookup runs in a worker thread too
+            cached = await asyncio.to_thread(semantic_response_cache.lookup, scenario_id, message, prefix.fingerprint)
+        except Exception as e:
+            logger.warning(f"Semantic cache lookup failed: {e}")
+            return None
+        
+        if not cached:
+            return None
+        
+        return AIResponse(
+            content=cached["answer"],
+            model=cached["model"],
+            tokens_used=0,
+            confidence=round(cached["similarity"], 3),
+            context_used=cached["sources"],
+            knowledge_entries=cached["knowledge_ids"],
+            cached=True
+        )
+    
+    async def _routed_response(
+        self,
+        scenario_id: str,
+        message: str,
+        db: Optional[Session]
+    ) -> Optional[AIResponse]:
+        """Local answer for greetings, thanks, hand-off requests and curated FAQs"""
+        if not settings.INTENT_ROUTER_ENABLED:
+            return None
+        # Classification may read Redis, embed the message and query the database
+        match = await asyncio.to_thread(intent_router.route, scenario_id, message, db)
+        if not match:
+            return None
+        
+        return AIResponse(
+            content=match.reply,
+            model="intent-router",
+            tokens_used=0,
+            confidence=round(match.confidence, 3),
+            context_used=[match.source] if match.source else [],
+            knowledge_entries=[match.knowledge_id] if match.knowledge_id else [],
+            intent=match.intent
+        )
+    
+    async def _store_cached_response(
+        self,
+        scenario_id: str,
+        message: str,
+        response: AIResponse,
+        prefix_fingerprint: str
+    ):
+        try:
+            await asyncio.to_thread(
+                semantic_response_cache.store,
+                scenario_id,
+                message,
+                answer=response.content,
+                model=response.model,
+                knowledge_ids=response.knowledge_entries,
+                sources=response.context_used,
+                prefix_fingerprint=prefix_fingerprint
             )
-            
         except Exception as e:
-            logger.error(f"AI service error: {e}")
+            logger.warning(f"Semantic cache store failed: {e}")
+    
+    @staticmethod
+    def _flight_key(
+        scenario_id: str,
+        message: str,
+        conversation_context: Optional[List[Dict[str, Any]]],
+        conversation_summary: Optional[str]
+    ) -> Tuple[str, str, str]:
+        """Turns with this key would get the same prompt: same scenario, question and context"""
+        context = [
+            (str(entry.get("role", "")).lower(), entry.get("content"))
+            for entry in conversation_context or []
+        ]
+        fingerprint = hashlib.blake2b(
+            json.dumps([context, conversation_summary], default=str).encode("utf-8"),
+            digest_size=16
+        ).hexdigest()
+        return scenario_id, semantic_response_cache.normalize(message), fingerprint
+    
+    @staticmethod
+    def _usage_fields(usage: TurnUsage) -> Dict[str, Any]:
+        return {
+            "tokens_used": usage.total_tokens,
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "cached_tokens": usage.cached_tokens,
+            "cost_usd": usage.cost_usd,
+            "usage_source": usage.source
+        }
+    
+    @staticmethod
+    def _shared_response(response: AIResponse) -> AIResponse:
+        """A coalesced follower's copy of the leader's answer; the leader's turn carries the usage"""
+        return response.model_copy(update={
+            "tokens_used": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_tokens": 0,
+            "cost_usd": 0.0
+        })
+    
+    @staticmethod
+    def _scenario_id(scenario_type: Union[ScenarioType, str]) -> str:
+        return scenario_type.value if isinstance(scenario_type, ScenarioType) else scenario_type
+    
+    async def _grounded_fallback(
+        self,
+        scenario_type: Union[ScenarioType, str],
+        message: str,
+        db: Optional[Session],
+        retrieved_ids: Optional[List[int]] = None
+    ) -> AIResponse:
+        """
+        Fallback for a failed turn, with the knowledge it would have been
+        grounded in so a stale answer is only served for the same entries.
+        Retrieval is local, so it still works while the provider is down.
+        """
+        knowledge_ids = retrieved_ids
+        if knowledge_ids is None and db is not None and settings.STALE_ANSWERS_ENABLED:
+            try:
+                _, knowledge_ids = await asyncio.to_thread(
+                    self._collect_knowledge_sources, message, self._scenario_id(scenario_type), db
+                )
+            except Exception as e:
+                # Unknown retrieval leaves only near-exact repeats eligible
+                db.rollback()
+                logger.warning(f"Fallback retrieval failed: {e}")
+        return await self._fallback_ai_response(scenario_type, message, knowledge_ids)
+    
+    async def _fallback_ai_response(
+        self,
+        scenario_type: Union[ScenarioType, str],
+        message: Optional[str] = None,
+        knowledge_ids: Optional[List[int]] = None
+    ) -> AIResponse:
+        """
+        Closest recent answer to the question when one is close enough and was
+        grounded in the same knowledge_ids (None if unknown), else a canned apology
+        """
+        scenario_id = self._scenario_id(scenario_type)
+        stale = None
+        if message and settings.STALE_ANSWERS_ENABLED:
+            try:
+                # Embedding the question blocks, so the lookup runs in a worker thread
+                stale = await asyncio.to_thread(stale_answers.lookup, scenario_id, message, knowledge_ids)
+            except Exception as e:
+                logger.warning(f"Stale answer lookup failed: {e}")
+        
+        if stale:
             return AIResponse(
-                content=self._get_fallback_response(scenario_type),
-                model="fallback",
+                content=stale["answer"],
+                model=stale["model"],
                 tokens_used=0,
-                confidence=0.1,
-                context_used=[],
-                knowledge_entries=[]
+                confidence=round(stale["similarity"], 3),
+                context_used=stale["sources"],
+                knowledge_entries=stale["knowledge_ids"],
+                stale=True
+            )
+        
+        return AIResponse(
+            content=self._get_fallback_response(scenario_type),
+            model="fallback",
+            tokens_used=0,
+            confidence=0.1,
+            context_used=[],
+            knowledge_entries=[]
+        )
+    
+    async def _remember_answer(self, scenario_id: str, message: str, response: AIResponse):
+        """Keep a fresh LLM answer for serving while the provider is down"""
+        if not settings.STALE_ANSWERS_ENABLED:
+            return
+        try:
+            await asyncio.to_thread(
+                stale_answers.remember,
+                scenario_id,
+                message,
+                answer=response.content,
+                model=response.model,
+                knowledge_ids=response.knowledge_entries,
+                sources=response.context_used
             )
+        except Exception as e:
+            logger.warning(f"Stale answer store failed: {e}")
     
-    def _estimate_tokens(self, text: str) -> int:
-        """Estimate token count for response text"""
-        return int(len(text.split()) * 1.3)  # Rough estimation, ensure integer
+    async def _completion_tokens(self, usage: Optional[LLMUsage], text: str) -> int:
+        """Provider-reported completion tokens, else a count of the response text"""
+        if usage is not None and usage.completion_tokens is not None:
+            return usage.completion_tokens
+        return await token_counter.count_async(text)
     
-    def _get_fallback_response(self, scenario_type: ScenarioType) -> str:
+    def _get_fallback_response(self, scenario_type: Union[ScenarioType, str]) -> str:
         """Generate fallback response when AI service fails"""
         fallback_responses = {
-            ScenarioType.ECOMMERCE: "I apologize, but I'm experiencing some technical difficulties right now. Please contact our support team at support@company.com or try again in a few minutes.",
-            ScenarioType.SAAS: "I'm currently experiencing technical issues. Please check our status page or contact our technical support team for immediate assistance.",
-            ScenarioType.SERVICE_BUSINESS: "I'm sorry, but I'm having trouble processing your request right now. Please call us directly or try again shortly."
+            ScenarioType.ECOMMERCE.value: "I apologize, but I'm experiencing some technical difficulties right now. Please contact our support team at support@company.com or try again in a few minutes.",
+            ScenarioType.SAAS.value: "I'm currently experiencing technical issues. Please check our status page or contact our technical support team for immediate assistance.",
+            ScenarioType.SERVICE_BUSINESS.value: "I'm sorry, but I'm having trouble processing your request right now. Please call us directly or try again shortly."
         }
         
-        return fallback_responses.get(scenario_type, fallback_responses[ScenarioType.ECOMMERCE])
+        # Custom scenarios are plain ids; they get a message that names no particular channel
+        return fallback_responses.get(
+            self._scenario_id(scenario_type),
+            "I'm sorry, but I'm having trouble processing your request right now. Please try again in a few minutes."
+        )
+
+
+# One breaker per upstream, shared by every AIService instance in the process
+llm_breaker = CircuitBreaker(
+    provider_name(settings.AI_MODEL),
+    failure_threshold=settings.AI_CIRCUIT_FAILURE_THRESHOLD,
+    min_calls=settings.AI_CIRCUIT_MIN_CALLS,
+    window_seconds=settings.AI_CIRCUIT_WINDOW_SECONDS,
+    open_seconds=settings.AI_CIRCUIT_OPEN_SECONDS
+)
+llm_caller = ResilientCaller(
+    provider_name(settings.AI_MODEL),
+    timeout=settings.AI_RESPONSE_TIMEOUT,
+    max_retries=settings.AI_MAX_RETRIES,
+    backoff_base=settings.AI_RETRY_BACKOFF_BASE,
+    hedge_percentile=settings.AI_HEDGE_PERCENTILE,
+    breaker=llm_breaker
+)
+
+# Identical in-flight generations, shared across requests in this process
+llm_flights = SingleFlight("ai.generation")
 
+llm_admission = AdmissionController(
+    max_concurrent=settings.AI_MAX_CONCURRENT_CALLS,
+    max_queue=settings.AI_MAX_QUEUED_CALLS,
+    queue_timeout=settings.AI_QUEUE_TIMEOUT
+)
 
 class ContextAnalyzer:
     """Analyze conversation context and suggest improvements"""
@@ -2,21 +2,32 @@
 Chat service for managing conversation context and real-time messaging
 """
 
-from typing import List, Dict, Any, Optional
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
 from sqlalchemy.orm import Session
 from app.models.message import Message
-from app.models.conversation import Conversation, MessageRole
+from app.models.conversation import Conversation, ConversationStatus, MessageRole
+from app.services.intent_router import HUMAN_HANDOFF_INTENT
+from app.services.summary_service import conversation_summarizer
 
 
 class ChatService:
     def __init__(self, db: Session):
         self.db = db
     
-    async def get_conversation_context(self, conversation_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+    async def get_conversation_context(
+        self,
+        conversation_id: str,
+        limit: int = 10,
+        since: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
         """Get recent conversation messages for context"""
-        messages = self.db.query(Message).filter(
+        query = self.db.query(Message).filter(
             Message.conversation_id == conversation_id
-        ).order_by(Message.created_at.desc()).limit(limit).all()
+        )
+        if since:
+            query = query.filter(Message.created_at > since)
+        messages = query.order_by(Message.created_at.desc()).limit(limit).all()
         
         # Reverse to get chronological order
         messages.reverse()
@@ -31,6 +42,16 @@ class ChatService:
             for message in messages
         ]
     
+    async def get_prompt_context(self, conversation_id: str) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """Rolling summary of older turns, plus the recent messages it does not cover yet"""
+        summary = conversation_summarizer.get(conversation_id, self.db)
+        context = await self.get_conversation_context(
+            conversation_id,
+            limit=conversation_summarizer.context_window,
+            since=summary.covered_until if summary else None
+        )
+        return (summary.text if summary else None), context
+    
     async def get_conversation_summary(self, conversation_id: str) -> Dict[str, Any]:
         """Get conversation summary and statistics"""
         conversation = self.db.query(Conversation).filter(
@@ -48,6 +69,7 @@ class ChatService:
         assistant_messages = [m for m in messages if m.role == MessageRole.ASSISTANT]
         
         total_tokens = sum(m.tokens_used or 0 for m in assistant_messages)
+        usage = [m.msg_metadata or {} for m in assistant_messages]
         avg_response_time = sum(m.response_time or 0 for m in assistant_messages) / len(assistant_messages) if assistant_messages else 0
         
         return {
@@ -61,6 +83,9 @@ class ChatService:
             "user_message_count": len(user_messages),
             "assistant_message_count": len(assistant_messages),
             "total_tokens_used": total_tokens,
+            "total_prompt_tokens": sum(u.get("prompt_tokens") or 0 for u in usage),
+            "total_completion_tokens": sum(u.get("completion_tokens") or 0 for u in usage),
+            "total_cost_usd": round(sum(u.get("cost_usd") or 0.0 for u in usage), 6),
             "average_response_time_ms": int(avg_response_time)
         }
     
@@ -110,6 +135,19 @@ class ChatService:
             "neutral_messages": sentiment_scores.count(0)
         }
     
+    def escalate_on_handoff(self, conversation_id: str, intent: Optional[str]) -> bool:
+        """
+        Mark the conversation ESCALATED when the turn asked for a human agent,
+        so it shows up for agents as the hand-off reply promises. Committed
+        by the caller together with the assistant message.
+        """
+        if intent != HUMAN_HANDOFF_INTENT:
+            return False
+        self.db.query(Conversation).filter(Conversation.id == conversation_id).update(
+            {Conversation.status: ConversationStatus.ESCALATED}, synchronize_session=False
+        )
+        return True
+    
     async def should_escalate_conversation(self, conversation_id: str) -> Dict[str, Any]:
         """Determine if conversation should be escalated to human agent"""
         sentiment = await self.analyze_conversation_sentiment(conversation_id)
@@ -0,0 +1,188 @@
+"""
+Process-wide service instances and their FastAPI dependency providers
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from fastapi import Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal, get_db
+from app.core.metrics import metrics
+from app.models.conversation import ScenarioType
+from app.services.ai_service import AIService
+from app.services.chat_service import ChatService
+from app.services.document_parser import DocumentParser
+from app.services.faiss_embedding_service import FAISSEmbeddingService, VectorIndexUnavailable, build_vector_index
+from app.services.intent_router import intent_router
+from app.services.knowledge_service import KnowledgeService, tag_index
+from app.services.llm_providers import LLMProvider, get_llm_provider, llm_executor
+from app.services.prompt_templates import prompt_templates
+from app.services.scenario_service import ScenarioService
+from app.services.speculative_retrieval import speculative_retriever
+from app.services.turn_pipeline import turn_pipeline
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """
+    Holds one instance of each stateless service for the whole process.
+    The application's lifespan warms them before the worker starts taking
+    traffic; anything used before that (scripts, tests) is built on first
+    access instead.
+    """
+
+    def __init__(self):
+        self._instances: Dict[str, Any] = {}
+        # Reentrant: a service's factory may build the services it depends on
+        self._lock = threading.RLock()
+        self._stopping = threading.Event()
+        self.ready = False
+
+    @property
+    def ai(self) -> AIService:
+        return self._get("ai", AIService)
+
+    @property
+    def llm(self) -> LLMProvider:
+        return self._get("llm", get_llm_provider)
+
+    @property
+    def knowledge(self) -> KnowledgeService:
+        return self._get("knowledge", self._build_knowledge)
+
+    @property
+    def vector_index(self) -> FAISSEmbeddingService:
+        """Raises VectorIndexUnavailable when the index is disabled or cannot be built"""
+        return self._get("vector_index", build_vector_index)
+
+    @property
+    def scenarios(self) -> ScenarioService:
+        return self._get("scenarios", ScenarioService)
+
+    @property
+    def document_parser(self) -> DocumentParser:
+        return self._get("document_parser", DocumentParser)
+
+    def warm(self):
+        """
+        Build every service and fill the caches a first turn would otherwise
+        pay for: compiled prompt templates, the tag index, and each built-in
+        scenario's intent model and prompt prefix. Blocking; failures are
+        logged and leave that piece to be built lazily.
+        """
+        start_time = time.perf_counter()
+        ai_service = self.ai
+        self.knowledge.generate_embedding("warmup")
+        self.scenarios
+        self.document_parser
+        prompt_templates.start()
+
+        db = SessionLocal()
+        try:
+            # A provider that cannot be built (missing SDK or key) is reported here, once
+            warmups = [("LLM provider", lambda: self.llm), ("tag index", lambda: tag_index.ensure_loaded(db))]
+            for scenario in ScenarioType:
+                warmups.append((f"{scenario.value} intent model", lambda s=scenario: intent_router.warm(s.value, db)))
+                warmups.append((f"{scenario.value} prompt prefix", lambda s=scenario: ai_service.prompt_service.get_prompt_prefix(s, db)))
+            for label, warmup in warmups:
+                try:
+                    warmup()
+                except Exception as e:
+                    db.rollback()
+                    logger.warning(f"Could not warm {label}: {e}")
+        finally:
+            db.close()
+
+        self.ready = True
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        metrics.observe("services.warmup_ms", elapsed_ms)
+        logger.info(f"Services warmed in {elapsed_ms:.0f}ms")
+
+    def backfill_embeddings(self) -> int:
+        """
+        Re-embed knowledge entries whose stored vector came from another
+        embedding model or version, so retrieval stops recomputing them per
+        query. Runs in the background after startup; every worker may run it,
+        and a worker that starts later finds the finished batches already current.
+        """
+        start_time = time.perf_counter()
+        db = SessionLocal()
+        try:
+            updated = self.knowledge.bulk_update_embeddings(db, should_stop=self._stopping.is_set)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Embedding backfill failed; stale vectors are re-embedded per query until it runs: {e}")
+            return 0
+        finally:
+            db.close()
+        if updated:
+            logger.info(f"Re-embedded {updated} knowledge entries in {time.perf_counter() - start_time:.1f}s")
+        return updated
+
+    def shutdown(self):
+        self.ready = False
+        self._stopping.set()
+        prompt_templates.stop()
+        llm_executor.shutdown()
+        turn_pipeline.executor.shutdown()
+        speculative_retriever.executor.shutdown()
+        vector_index = self._instances.get("vector_index")
+        if vector_index is not None:
+            vector_index.flush()
+
+    def _build_knowledge(self) -> KnowledgeService:
+        vector_index = None
+        if settings.VECTOR_INDEX_ENABLED:
+            try:
+                vector_index = self.vector_index
+            except Exception as e:
+                logger.warning(f"Knowledge writes will not reach the vector index: {e}")
+        return KnowledgeService(vector_index=vector_index)
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    instance = self._instances[name] = factory()
+        return instance
+
+
+services = ServiceContainer()
+
+
+# Dependency providers
+
+def get_ai_service() -> AIService:
+    return services.ai
+
+
+def get_knowledge_service() -> KnowledgeService:
+    return services.knowledge
+
+
+def get_vector_index() -> FAISSEmbeddingService:
+    try:
+        return services.vector_index
+    except VectorIndexUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+
+def get_scenario_service() -> ScenarioService:
+    return services.scenarios
+
+
+def get_document_parser() -> DocumentParser:
+    return services.document_parser
+
+
+def get_chat_service(db: Session = Depends(get_db)) -> ChatService:
+    """ChatService wraps the request's session, so it is built per request"""
+    return ChatService(db)
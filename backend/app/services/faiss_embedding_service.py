@@ -3,40 +3,51 @@ FAISS-based local embedding service for vector database operations
 """
 
 import numpy as np
-import faiss
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Union
 from pathlib import Path
 import pickle
 import json
-from sentence_transformers import SentenceTransformer
+import random
+import shutil
+import threading
+from datetime import datetime
 
+from app.core.config import settings
+from app.services.knowledge_service import IndexEntryBatches, SimpleEmbeddingService
 
-class FAISSEmbeddingService:
-    """Local embedding service using FAISS and SentenceTransformers"""
-    
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        """
-        Initialize with a lightweight, fast embedding model
-        all-MiniLM-L6-v2: 384 dimensions, good quality, fast inference
-        """
-        self.model_name = model_name
+try:
+    import faiss
+except ImportError:  # pragma: no cover - the vector index is optional; knowledge search works without it
+    faiss = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # pragma: no cover - only needed for SentenceTransformer models
+    SentenceTransformer = None
+
+# Below this many training points per list IVF clustering is unreliable (FAISS guidance)
+MIN_POINTS_PER_CENTROID = 39
+# Smallest IVF worth building; smaller corpora stay on the in-memory flat index
+MIN_IVF_LISTS = 16
+
+
+class VectorIndexUnavailable(RuntimeError):
+    """The vector index is disabled or its packages are not installed"""
+
+
+class SentenceTransformerEncoder:
+    """Embedding encoder backed by a local SentenceTransformer model"""
+
+    def __init__(self, model_name: str, model_version: str = "1", embedding_dim: int = 384):
+        if SentenceTransformer is None:
+            raise VectorIndexUnavailable(
+                f"Embedding model {model_name} needs the sentence-transformers package"
+            )
+        self.model_id = model_name
+        self.model_version = model_version
         self.model = SentenceTransformer(model_name)
-        self.embedding_dim = 384  # Dimension for all-MiniLM-L6-v2
-        
-        # FAISS index for similarity search
-        self.index = None
-        self.id_to_metadata = {}  # Map FAISS index IDs to knowledge entry metadata
-        self.next_id = 0
-        
-        # Storage paths
-        self.storage_dir = Path("/app/faiss_storage")
-        self.storage_dir.mkdir(exist_ok=True)
-        self.index_path = self.storage_dir / "knowledge.index"
-        self.metadata_path = self.storage_dir / "metadata.json"
-        
-        # Load existing index if available
-        self._load_index()
-    
+        self.embedding_dim = self.model.get_sentence_embedding_dimension() or embedding_dim
+
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding using local SentenceTransformer model"""
         try:
@@ -44,205 +55,970 @@ class FAISSEmbeddingService:
             text = text.strip()
             if not text:
                 return [0.0] * self.embedding_dim
-            
+
             # Generate embedding
             embedding = self.model.encode([text], show_progress_bar=False)[0]
             return embedding.tolist()
-            
+
         except Exception as e:
             print(f"Error generating local embedding: {str(e)}")
             # Return zero vector as fallback
             return [0.0] * self.embedding_dim
-    
+
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for a batch of texts in one model call"""
+        if not texts:
+            return []
+        embeddings = self.model.encode(texts, batch_size=64, show_progress_bar=False)
+        return embeddings.tolist()
+
+
+def create_encoder(model_name: str, model_version: str = "1"):
+    """Create the encoder for a model id (simple local features or SentenceTransformer)"""
+    if model_name == SimpleEmbeddingService.model_id:
+        encoder = SimpleEmbeddingService()
+        encoder.model_version = model_version
+        return encoder
+    return SentenceTransformerEncoder(model_name, model_version)
+
+
+class AttributeBitmaps:
+    """
+    Fixed-width per-row arrays (knowledge id, active bit, category code) plus
+    one boolean mask per tag. Combined masks are handed to FAISS as an ID
+    selector so filtered rows are skipped inside the scoring kernel instead
+    of being scored and discarded. Nothing here holds a Python object per
+    row; titles and text stay in the generation's row store on disk.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.capacity = capacity
+        self.knowledge_ids = np.full(capacity, -1, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.category_codes = np.full(capacity, -1, dtype=np.int32)
+        self.categories: Dict[str, int] = {}
+        self.tags: Dict[str, np.ndarray] = {}
+
+    def append(self, knowledge_id: int, is_active: bool, category: Optional[str], tags: Optional[List[str]]) -> int:
+        """Register the attributes of a newly added row"""
+        if self.size == self.capacity:
+            self._grow()
+
+        row = self.size
+        self.size += 1
+        self.knowledge_ids[row] = knowledge_id if knowledge_id is not None else -1
+        self.active[row] = is_active
+        if category:
+            self.category_codes[row] = self.categories.setdefault(category, len(self.categories))
+        for tag in tags or []:
+            if tag not in self.tags:
+                self.tags[tag] = np.zeros(self.capacity, dtype=bool)
+            self.tags[tag][row] = True
+        return row
+
+    def set_active(self, knowledge_id: int, is_active: bool) -> List[int]:
+        """Flip the active bit for every row of a knowledge entry"""
+        rows = np.flatnonzero(self.knowledge_ids[:self.size] == knowledge_id)
+        self.active[rows] = is_active
+        return rows.tolist()
+
+    def build_mask(
+        self,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        match_all_tags: bool = False
+    ) -> np.ndarray:
+        """Combine attribute masks into the set of rows a search may score"""
+        mask = self.active[:self.size].copy()
+
+        if category:
+            code = self.categories.get(category)
+            if code is None:
+                return np.zeros(self.size, dtype=bool)
+            mask &= self.category_codes[:self.size] == code
+
+        if tags:
+            tag_masks = [self.tags.get(tag) for tag in tags]
+            if match_all_tags:
+                if any(tag_mask is None for tag_mask in tag_masks):
+                    return np.zeros(self.size, dtype=bool)
+                for tag_mask in tag_masks:
+                    mask &= tag_mask[:self.size]
+            else:
+                any_tag = np.zeros(self.size, dtype=bool)
+                for tag_mask in tag_masks:
+                    if tag_mask is not None:
+                        any_tag |= tag_mask[:self.size]
+                mask &= any_tag
+
+        return mask
+
+    def _grow(self):
+        self.capacity *= 2
+        for name, fill in (("knowledge_ids", -1), ("active", False), ("category_codes", -1)):
+            grown = np.full(self.capacity, fill, dtype=getattr(self, name).dtype)
+            grown[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, grown)
+        for key, mask in self.tags.items():
+            grown = np.zeros(self.capacity, dtype=bool)
+            grown[:self.size] = mask[:self.size]
+            self.tags[key] = grown
+
+
+def make_id_selector(mask: np.ndarray):
+    """
+    Wrap a boolean row mask as a FAISS IDSelectorBitmap. The packed bitmap is
+    returned too because FAISS only holds a raw pointer to it.
+    """
+    bitmap = np.packbits(mask, bitorder="little")
+    # FAISS takes the bitmap's length in bytes, not the number of rows
+    selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+    return selector, bitmap
+
+
+class RowStore:
+    """
+    Append-only JSON-lines file holding each row's metadata and source text.
+    Rows are written as they are added and read back by byte offset only for
+    the handful of rows a search returns, so per-row metadata never has to
+    be resident and a write never rewrites earlier rows. Activation changes
+    are appended as status lines and replayed on load.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.offsets = np.zeros(1024, dtype=np.int64)
+        self.size = 0
+
+    def append_rows(self, records: List[Dict[str, Any]]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "ab") as f:
+            for record in records:
+                if self.size == len(self.offsets):
+                    self.offsets = np.resize(self.offsets, len(self.offsets) * 2)
+                self.offsets[self.size] = f.tell()
+                f.write(json.dumps(record).encode("utf-8") + b"\n")
+                self.size += 1
+
+    def append_status(self, knowledge_id: int, is_active: bool):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "ab") as f:
+            f.write(json.dumps({"knowledge_id": knowledge_id, "is_active": is_active}).encode("utf-8") + b"\n")
+
+    def read(self, row: int) -> Dict[str, Any]:
+        if row < 0 or row >= self.size:
+            return {}
+        with open(self.path, "rb") as f:
+            f.seek(int(self.offsets[row]))
+            return json.loads(f.readline())
+
+    def scan(self):
+        """Yield (record, is_row) in file order, rebuilding the row offsets"""
+        self.offsets = np.zeros(1024, dtype=np.int64)
+        self.size = 0
+        if not self.path.exists():
+            return
+        with open(self.path, "rb") as f:
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                if not line.endswith(b"\n"):
+                    # A write interrupted mid-line; drop it and everything after
+                    f.truncate(offset)
+                    break
+                record = json.loads(line)
+                is_row = "row" in record
+                if is_row:
+                    if self.size == len(self.offsets):
+                        self.offsets = np.resize(self.offsets, len(self.offsets) * 2)
+                    self.offsets[self.size] = offset
+                    self.size += 1
+                yield record, is_row
+
+
+class IndexGeneration:
+    """
+    One generation of the vector index: a FAISS index, its row store and the
+    encoder that produced its vectors. Every generation is tagged with the model
+    id and version so vectors from different models are never mixed.
+
+    The index is either an in-memory flat index ("flat") or an IVF index whose
+    inverted lists live in a memory-mapped file ("ivf_ondisk"). In the on-disk
+    mode only the coarse centroids are resident; the posting lists of the
+    probed clusters are paged in by the OS on demand.
+
+    Rows reach the row store as soon as they are added, but the FAISS index
+    file is only rewritten by save(). Rows added after the last save are
+    re-embedded from the row store when the generation is loaded.
+    """
+
+    def __init__(self, name: str, encoder, storage_dir: Path, nprobe: int = 16):
+        self.name = name
+        self.encoder = encoder
+        self.model_id = encoder.model_id
+        self.model_version = encoder.model_version
+        self.embedding_dim = encoder.embedding_dim
+        self.index = faiss.IndexFlatIP(self.embedding_dim)  # Inner Product for cosine similarity
+        self.index_type = "flat"
+        self.nlist = 0
+        self.nprobe = nprobe
+        self.next_id = 0
+        self.unsaved_rows = 0
+        self.bitmaps = AttributeBitmaps()
+
+        self.storage_dir = storage_dir
+        self.index_path = storage_dir / "knowledge.index"
+        self.ivfdata_path = storage_dir / "knowledge.ivfdata"
+        self.metadata_path = storage_dir / "metadata.json"
+        self.rows = RowStore(storage_dir / "rows.jsonl")
+
+    def init_ondisk_ivf(self, training_embeddings, nlist: int):
+        """Train IVF centroids and attach memory-mapped inverted lists"""
+        training_array = np.array(training_embeddings, dtype=np.float32)
+        faiss.normalize_L2(training_array)
+
+        quantizer = faiss.IndexFlatIP(self.embedding_dim)
+        index = faiss.IndexIVFFlat(quantizer, self.embedding_dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(training_array)
+
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        invlists = faiss.OnDiskInvertedLists(nlist, index.code_size, str(self.ivfdata_path))
+        index.replace_invlists(invlists, True)
+        invlists.this.disown()  # The index owns the lists from here on
+
+        self.index = index
+        self.index_type = "ivf_ondisk"
+        self.nlist = nlist
+
+    def search_params(self, selector):
+        """FAISS search parameters carrying the pre-filter and, for IVF, nprobe"""
+        if self.index_type == "ivf_ondisk":
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        return faiss.SearchParameters(sel=selector)
+
+    def add_embeddings(self, embeddings: List[List[float]], metadata: List[Dict[str, Any]]) -> List[int]:
+        """Normalize and append vectors; their metadata goes to the row store"""
+        if not embeddings:
+            return []
+
+        embeddings_array = np.array(embeddings, dtype=np.float32)
+        faiss.normalize_L2(embeddings_array)  # Normalize for cosine similarity
+        self.index.add(embeddings_array)
+
+        faiss_ids = list(range(self.next_id, self.next_id + len(metadata)))
+        self.rows.append_rows([
+            {**entry_metadata, "row": faiss_id}
+            for faiss_id, entry_metadata in zip(faiss_ids, metadata)
+        ])
+        for entry_metadata in metadata:
+            self._register_bitmaps(entry_metadata)
+        self.next_id += len(faiss_ids)
+        self.unsaved_rows += len(faiss_ids)
+        return faiss_ids
+
+    def set_entry_active(self, knowledge_id: int, is_active: bool) -> bool:
+        """Include or exclude all rows of a knowledge entry from searches"""
+        rows = self.bitmaps.set_active(knowledge_id, is_active)
+        if rows:
+            self.rows.append_status(knowledge_id, is_active)
+        return bool(rows)
+
+    def row_metadata(self, row: int) -> Dict[str, Any]:
+        """Metadata of one row, read from the row store, with a text preview"""
+        metadata = self.rows.read(row)
+        text = metadata.get("text") or ""
+        return {
+            **metadata,
+            "text": text[:500] + "..." if len(text) > 500 else text,
+            "is_active": bool(self.bitmaps.active[row]) if row < self.bitmaps.size else False,
+            "model_id": self.model_id,
+            "model_version": self.model_version
+        }
+
+    def _register_bitmaps(self, entry_metadata: Dict[str, Any]):
+        self.bitmaps.append(
+            entry_metadata.get("knowledge_id"),
+            entry_metadata.get("is_active", True),
+            entry_metadata.get("category"),
+            entry_metadata.get("tags")
+        )
+
+    def describe(self) -> Dict[str, Any]:
+        """Manifest entry for this generation"""
+        return {
+            "model_id": self.model_id,
+            "model_version": self.model_version,
+            "embedding_dim": self.embedding_dim,
+            "index_type": self.index_type,
+            "nlist": self.nlist
+        }
+
+    def save(self):
+        """Save the FAISS index and the small metadata header; rows are already on disk"""
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        faiss.write_index(self.index, str(self.index_path))
+
+        tmp_path = self.metadata_path.with_suffix(".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({"next_id": self.next_id, **self.describe()}, f, indent=2)
+        tmp_path.replace(self.metadata_path)
+        self.unsaved_rows = 0
+
+    def load(self):
+        """Load the FAISS index, then rebuild the resident arrays from the row store"""
+        data: Dict[str, Any] = {}
+        if self.metadata_path.exists():
+            with open(self.metadata_path, 'r') as f:
+                data = json.load(f)
+                self.index_type = data.get("index_type", "flat")
+                self.nlist = data.get("nlist", 0)
+
+        if self.index_path.exists():
+            if self.index_type == "ivf_ondisk":
+                # Map the inverted lists from this directory instead of loading them
+                self.index = faiss.read_index(str(self.index_path), faiss.IO_FLAG_ONDISK_SAME_DIR)
+            else:
+                self.index = faiss.read_index(str(self.index_path))
+
+        if "id_to_metadata" in data and not self.rows.path.exists():
+            # Older layout kept every row's metadata in the JSON header
+            legacy = data["id_to_metadata"]
+            self.rows.append_rows([
+                {**legacy.get(str(row), {}), "row": row} for row in range(data.get("next_id", 0))
+            ])
+
+        self.bitmaps = AttributeBitmaps(capacity=max(1024, self.index.ntotal))
+        self.next_id = 0
+        for record, is_row in self.rows.scan():
+            if is_row:
+                self._register_bitmaps(record)
+                self.next_id += 1
+            else:
+                self.bitmaps.set_active(record["knowledge_id"], record["is_active"])
+
+        self._recover_unsaved_rows()
+        if "id_to_metadata" in data:
+            self.save()
+
+    def _recover_unsaved_rows(self):
+        """Re-embed rows that reached the row store after the index was last saved"""
+        missing = range(self.index.ntotal, self.next_id)
+        if not missing:
+            return
+        for start in range(missing.start, missing.stop, 256):
+            texts = [self.rows.read(row).get("text") or "" for row in range(start, min(start + 256, missing.stop))]
+            embeddings_array = np.array(self.encoder.generate_embeddings(texts), dtype=np.float32)
+            faiss.normalize_L2(embeddings_array)
+            self.index.add(embeddings_array)
+        self.save()
+
+    def delete_files(self):
+        """Remove this generation's files from disk"""
+        if self.storage_dir.name == self.name:
+            shutil.rmtree(self.storage_dir, ignore_errors=True)
+        else:
+            # Legacy layout keeps the index directly in the storage root
+            for path in (self.index_path, self.metadata_path, self.rows.path):
+                if path.exists():
+                    path.unlink()
+
+
+class FAISSEmbeddingService:
+    """Local embedding service using FAISS and SentenceTransformers"""
+
+    def __init__(
+        self,
+        model_name: str = "all-MiniLM-L6-v2",
+        model_version: str = "1",
+        index_mode: Optional[str] = None,
+        storage_dir: Optional[Path] = None
+    ):
+        """
+        Initialize with a lightweight, fast embedding model
+        all-MiniLM-L6-v2: 384 dimensions, good quality, fast inference
+
+        index_mode: "memory" (flat, fully resident) or "ondisk_ivf" (IVF with
+        memory-mapped inverted lists for corpora larger than RAM)
+        """
+        if faiss is None:
+            raise VectorIndexUnavailable("The vector index needs the faiss-cpu package")
+        self.model_name = model_name
+        self.model_version = model_version
+        self.index_mode = index_mode or settings.VECTOR_INDEX_MODE
+        self.nlist = settings.VECTOR_INDEX_NLIST
+        self.nprobe = settings.VECTOR_INDEX_NPROBE
+        self.train_size = settings.VECTOR_INDEX_TRAIN_SIZE
+        self.save_every = settings.VECTOR_INDEX_SAVE_EVERY
+
+        # Storage paths
+        self.storage_dir = Path(storage_dir or "/app/faiss_storage")
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self.generations_dir = self.storage_dir / "generations"
+        self.manifest_path = self.storage_dir / "manifest.json"
+
+        # The active generation serves reads; a staged generation is built in the
+        # background during re-embedding and swapped in atomically when ready
+        self._lock = threading.RLock()
+        self._active: Optional[IndexGeneration] = None
+        self._staged: Optional[IndexGeneration] = None
+        self._pending_writes: List[Dict[str, Any]] = []
+        self.dual_read = False
+        self.dual_read_stats = {"queries": 0, "mean_overlap": 0.0}
+        self.reembed_status: Dict[str, Any] = {"state": "idle"}
+
+        # Load existing index if available
+        self._load_index()
+
+    @property
+    def model(self):
+        return self._active.encoder
+
+    @property
+    def embedding_dim(self) -> int:
+        return self._active.embedding_dim
+
+    @property
+    def index(self):
+        return self._active.index
+
+    @property
+    def serving_model(self) -> str:
+        """Model id and version of the serving generation"""
+        generation = self._active
+        return f"{generation.model_id}:v{generation.model_version}"
+
+    @property
+    def size(self) -> int:
+        """Rows in the serving generation, including masked-out ones"""
+        return self._active.index.ntotal
+
+    def generate_embedding(self, text: str) -> List[float]:
+        """Generate embedding with the model of the active index generation"""
+        return self._active.encoder.generate_embedding(text)
+
     def add_to_index(
-        self, 
-        text: str, 
+        self,
+        text: str,
         knowledge_id: int,
         title: str,
-        category: Optional[str] = None
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None
     ) -> int:
         """Add text embedding to FAISS index"""
-        
-        # Generate embedding
-        embedding = self.generate_embedding(text)
-        embedding_array = np.array([embedding], dtype=np.float32)
-        
-        # Initialize index if not exists
-        if self.index is None:
-            self.index = faiss.IndexFlatIP(self.embedding_dim)  # Inner Product for cosine similarity
-        
-        # Add to index
-        faiss_id = self.next_id
-        self.index.add(embedding_array)
-        
-        # Store metadata
-        self.id_to_metadata[faiss_id] = {
-            "knowledge_id": knowledge_id,
-            "title": title,
-            "category": category,
-            "text": text[:500] + "..." if len(text) > 500 else text  # Store truncated text for preview
-        }
-        
-        self.next_id += 1
-        
-        # Save index and metadata
-        self._save_index()
-        
+
+        with self._lock:
+            generation = self._active
+            embedding = generation.encoder.generate_embedding(text)
+            faiss_id = generation.add_embeddings(
+                [embedding],
+                [self._entry_metadata(knowledge_id, title, category, text, tags)]
+            )[0]
+
+            # Writes that land while a new generation is being built are replayed
+            # into it before the swap so nothing is lost
+            if self.reembed_status.get("state") in ("building", "ready"):
+                self._pending_writes.append({
+                    "op": "add",
+                    "id": knowledge_id,
+                    "title": title,
+                    "category": category,
+                    "tags": tags,
+                    "content": text
+                })
+
+            # The row is already in the row store; rewriting the FAISS index on
+            # every write would cost O(corpus), so it is saved in batches
+            if generation.unsaved_rows >= self.save_every:
+                self._save_generation(generation)
+
         return faiss_id
-    
+
+    def flush(self):
+        """Save the serving generation's FAISS index if rows were added since the last save"""
+        with self._lock:
+            if self._active.unsaved_rows:
+                self._save_generation(self._active)
+
     def search_similar(
-        self, 
-        query: str, 
+        self,
+        query: str,
         limit: int = 5,
         category: Optional[str] = None,
-        min_score: float = 0.3
+        min_score: float = 0.3,
+        tags: Optional[List[str]] = None,
+        match_all_tags: bool = False
     ) -> List[Dict[str, Any]]:
         """Search for similar texts using FAISS"""
-        
-        if self.index is None or self.index.ntotal == 0:
+
+        # Take one reference so a concurrent swap can't change the generation mid-query
+        generation = self._active
+        hits = self._search(generation, query, limit, category, min_score, tags, match_all_tags)
+
+        results = []
+        for row, score in hits:
+            metadata = generation.row_metadata(row)
+            results.append({
+                "knowledge_id": metadata.get("knowledge_id"),
+                "title": metadata.get("title", "Unknown"),
+                "text": metadata["text"],
+                "category": metadata.get("category"),
+                "tags": metadata.get("tags") or [],
+                "similarity_score": score,
+                "model_id": generation.model_id,
+                "model_version": generation.model_version
+            })
+        return results
+
+    def search_ids(
+        self,
+        query: str,
+        limit: int = 5,
+        category: Optional[str] = None,
+        min_score: float = 0.3,
+        tags: Optional[List[str]] = None,
+        match_all_tags: bool = False
+    ) -> List[Tuple[int, float]]:
+        """
+        (knowledge_id, score) pairs, best first, without touching the row
+        store; callers load the entries themselves from the database
+        """
+        generation = self._active
+        hits = self._search(generation, query, limit, category, min_score, tags, match_all_tags)
+        return [(int(generation.bitmaps.knowledge_ids[row]), score) for row, score in hits]
+
+    def _search(
+        self,
+        generation: IndexGeneration,
+        query: str,
+        limit: int,
+        category: Optional[str],
+        min_score: float,
+        tags: Optional[List[str]],
+        match_all_tags: bool
+    ) -> List[Tuple[int, float]]:
+        filters = {"category": category, "tags": tags, "match_all_tags": match_all_tags}
+        hits = self._search_generation(generation, query, limit, filters, min_score)
+
+        staged = self._staged
+        if self.dual_read and staged is not None and self.reembed_status.get("state") == "ready":
+            shadow_hits = self._search_generation(staged, query, limit, filters, min_score)
+            self._record_dual_read(
+                [generation.bitmaps.knowledge_ids[row] for row, _ in hits],
+                [staged.bitmaps.knowledge_ids[row] for row, _ in shadow_hits]
+            )
+
+        return hits
+
+    def _search_generation(
+        self,
+        generation: IndexGeneration,
+        query: str,
+        limit: int,
+        filters: Dict[str, Any],
+        min_score: float
+    ) -> List[Tuple[int, float]]:
+        """Run a similarity search against a single index generation; returns (row, score) pairs"""
+
+        if generation.index is None or generation.index.ntotal == 0:
             return []
-        
+
         try:
+            # Pre-filter: only rows passing every attribute filter are scored
+            mask = generation.bitmaps.build_mask(**filters)
+            candidate_count = int(mask.sum())
+            if candidate_count == 0:
+                return []
+
             # Generate query embedding
-            query_embedding = self.generate_embedding(query)
+            query_embedding = generation.encoder.generate_embedding(query)
             query_array = np.array([query_embedding], dtype=np.float32)
-            
+
             # Normalize for cosine similarity
             faiss.normalize_L2(query_array)
-            
+
             # Search
-            search_limit = min(limit * 2, self.index.ntotal)  # Search more, filter later
-            scores, indices = self.index.search(query_array, search_limit)
-            
+            selector, _bitmap = make_id_selector(mask)
+            search_limit = min(limit, candidate_count)
+            scores, indices = generation.index.search(
+                query_array, search_limit, params=generation.search_params(selector)
+            )
+
             # Process results
             results = []
             for score, idx in zip(scores[0], indices[0]):
                 if idx == -1:  # FAISS returns -1 for missing results
                     continue
-                
-                metadata = self.id_to_metadata.get(idx, {})
-                
-                # Filter by category if specified
-                if category and metadata.get("category") != category:
-                    continue
-                
+
                 # Filter by minimum score
                 if score < min_score:
                     continue
-                
-                results.append({
-                    "knowledge_id": metadata.get("knowledge_id"),
-                    "title": metadata.get("title", "Unknown"),
-                    "text": metadata.get("text", ""),
-                    "category": metadata.get("category"),
-                    "similarity_score": float(score)
-                })
-                
+
+                results.append((int(idx), float(score)))
+
                 if len(results) >= limit:
                     break
-            
+
             return results
-            
+
         except Exception as e:
             print(f"Error in FAISS search: {str(e)}")
             return []
-    
+
+    def _record_dual_read(self, primary: List[int], shadow: List[int]):
+        """Track how closely the staged generation agrees with the serving one"""
+        primary_ids = set(primary)
+        shadow_ids = set(shadow)
+        union = primary_ids | shadow_ids
+        overlap = len(primary_ids & shadow_ids) / len(union) if union else 1.0
+
+        with self._lock:
+            stats = self.dual_read_stats
+            stats["queries"] += 1
+            stats["mean_overlap"] += (overlap - stats["mean_overlap"]) / stats["queries"]
+
     def remove_from_index(self, knowledge_id: int):
         """Remove entries for a specific knowledge ID"""
-        # Note: FAISS doesn't support efficient deletion
-        # In production, you might want to rebuild the index periodically
-        # or use a more sophisticated indexing strategy
-        pass
-    
-    def rebuild_index(self, knowledge_entries: List[Dict[str, Any]]):
+        # FAISS doesn't support efficient deletion, so the rows are masked out of
+        # the active bitmap and dropped for good on the next rebuild
+        self.set_entry_active(knowledge_id, False)
+
+    def set_entry_active(self, knowledge_id: int, is_active: bool) -> bool:
+        """Include or exclude a knowledge entry from search results"""
+        with self._lock:
+            changed = self._active.set_entry_active(knowledge_id, is_active)
+            if self._staged is not None:
+                self._staged.set_entry_active(knowledge_id, is_active)
+            # Queued like adds: the generation being built read the entry before this
+            # change, and the change must also follow any add still waiting to replay
+            if self.reembed_status.get("state") in ("building", "ready"):
+                self._pending_writes.append({"op": "set_active", "id": knowledge_id, "is_active": is_active})
+        return changed
+
+    def rebuild_index(self, knowledge_entries: Union[IndexEntryBatches, List[Dict[str, Any]]]):
         """Rebuild the entire FAISS index from knowledge entries"""
-        
-        # Create new index
-        self.index = faiss.IndexFlatIP(self.embedding_dim)
-        self.id_to_metadata = {}
-        self.next_id = 0
-        
-        # Add all entries
-        embeddings = []
-        for entry in knowledge_entries:
-            embedding = self.generate_embedding(entry["content"])
-            embeddings.append(embedding)
-            
-            # Store metadata
-            self.id_to_metadata[self.next_id] = {
-                "knowledge_id": entry["id"],
-                "title": entry["title"],
-                "category": entry.get("category"),
-                "text": entry["content"][:500] + "..." if len(entry["content"]) > 500 else entry["content"]
+
+        with self._lock:
+            old_generation = self._active
+            generation = self._build_generation(
+                self._as_batches(knowledge_entries),
+                old_generation.encoder,
+                self._new_generation_name(old_generation.encoder)
+            )
+            self._publish(generation, old_generation)
+
+    def start_reembedding(
+        self,
+        knowledge_entries: Union[IndexEntryBatches, List[Dict[str, Any]]],
+        model_name: str,
+        model_version: str = "1",
+        dual_read: bool = False
+    ) -> str:
+        """
+        Build a new index generation with another embedding model in the
+        background while the current generation keeps serving searches.
+        Call swap_generation() once reembed_status reports "ready".
+
+        Pass IndexEntryBatches to stream the corpus from the database; a
+        list is held in memory for the duration of the build.
+        """
+        entries = self._as_batches(knowledge_entries)
+        with self._lock:
+            if self.reembed_status.get("state") == "building":
+                raise RuntimeError("A re-embedding job is already running")
+
+            encoder = create_encoder(model_name, model_version)
+            name = self._new_generation_name(encoder)
+            self._staged = None
+            self._pending_writes = []
+            self.dual_read = dual_read
+            self.dual_read_stats = {"queries": 0, "mean_overlap": 0.0}
+            self.reembed_status = {
+                "state": "building",
+                "generation": name,
+                "model_id": encoder.model_id,
+                "model_version": encoder.model_version,
+                "total": len(entries),
+                "processed": 0,
+                "started_at": datetime.utcnow().isoformat()
             }
-            
-            self.next_id += 1
-        
-        # Add all embeddings to index at once
-        if embeddings:
-            embeddings_array = np.array(embeddings, dtype=np.float32)
-            faiss.normalize_L2(embeddings_array)  # Normalize for cosine similarity
-            self.index.add(embeddings_array)
-        
-        # Save index
-        self._save_index()
-    
+
+        thread = threading.Thread(
+            target=self._run_reembedding,
+            args=(entries, encoder, name),
+            daemon=True
+        )
+        thread.start()
+        return name
+
+    def _run_reembedding(self, knowledge_entries: IndexEntryBatches, encoder, name: str):
+        """Background worker for start_reembedding"""
+        try:
+            generation = self._build_generation(knowledge_entries, encoder, name)
+            with self._lock:
+                if self.reembed_status.get("generation") != name:
+                    # Cancelled (or superseded) while building
+                    generation.delete_files()
+                    return
+                self._staged = generation
+                self.reembed_status["state"] = "ready"
+                self.reembed_status["finished_at"] = datetime.utcnow().isoformat()
+        except Exception as e:
+            print(f"Error re-embedding FAISS index: {str(e)}")
+            with self._lock:
+                if self.reembed_status.get("generation") == name:
+                    self.reembed_status["state"] = "failed"
+                    self.reembed_status["error"] = str(e)
+
+    def swap_generation(self) -> bool:
+        """
+        Atomically switch searches to the staged generation. The old
+        generation's vectors are garbage-collected only after the swap.
+        """
+        with self._lock:
+            staged = self._staged
+            if staged is None or self.reembed_status.get("state") != "ready":
+                return False
+
+            # Catch up on writes that arrived while the new generation was built
+            self._replay_pending_writes(staged)
+
+            self._publish(staged, self._active)
+            self._staged = None
+            self.dual_read = False
+            self.reembed_status = {
+                "state": "idle",
+                "last_swap": {
+                    "generation": staged.name,
+                    "model_id": staged.model_id,
+                    "model_version": staged.model_version,
+                    "swapped_at": datetime.utcnow().isoformat()
+                }
+            }
+
+        return True
+
+    def _replay_pending_writes(self, generation: IndexGeneration):
+        """Apply queued adds and (de)activations to a generation in arrival order"""
+        adds: List[Dict[str, Any]] = []
+        for write in self._pending_writes:
+            if write["op"] == "add":
+                adds.append(write)
+                continue
+            # Consecutive adds are embedded as one batch before the next status change
+            if adds:
+                self._add_entries(generation, adds)
+                adds = []
+            generation.set_entry_active(write["id"], write["is_active"])
+        if adds:
+            self._add_entries(generation, adds)
+        self._pending_writes = []
+
+    def cancel_reembedding(self):
+        """Discard a staged generation without touching the serving one"""
+        with self._lock:
+            if self._staged is not None:
+                self._staged.delete_files()
+            self._staged = None
+            self._pending_writes = []
+            self.dual_read = False
+            self.reembed_status = {"state": "idle"}
+
+    def _build_generation(self, knowledge_entries: IndexEntryBatches, encoder, name: str) -> IndexGeneration:
+        """Embed all entries into a fresh generation, one source batch at a time, and persist it"""
+        generation = IndexGeneration(name, encoder, self.generations_dir / name, nprobe=self.nprobe)
+
+        nlist = self._choose_nlist(len(knowledge_entries))
+        if self.index_mode == "ondisk_ivf" and nlist:
+            # Centroids are trained on a sample; the full corpus is then streamed
+            # into the on-disk lists batch by batch
+            generation.init_ondisk_ivf(self._training_sample(knowledge_entries, encoder), nlist)
+
+        processed = 0
+        for batch in knowledge_entries:
+            self._add_entries(generation, batch)
+            processed += len(batch)
+            with self._lock:
+                if self.reembed_status.get("generation") == name:
+                    self.reembed_status["processed"] = processed
+        generation.save()
+        return generation
+
+    def _training_sample(self, knowledge_entries: IndexEntryBatches, encoder) -> np.ndarray:
+        """
+        Embeddings of a uniform sample of at most train_size entries. Only the
+        sampled positions are drawn up front; texts are read and embedded
+        one source batch at a time.
+        """
+        chosen = None
+        if len(knowledge_entries) > self.train_size:
+            chosen = set(random.Random(0).sample(range(len(knowledge_entries)), self.train_size))
+
+        parts = []
+        position = 0
+        for batch in knowledge_entries:
+            texts = [
+                entry["content"]
+                for offset, entry in enumerate(batch)
+                if chosen is None or position + offset in chosen
+            ]
+            position += len(batch)
+            if texts:
+                parts.append(np.asarray(encoder.generate_embeddings(texts), dtype=np.float32))
+        return np.vstack(parts) if parts else np.zeros((0, encoder.embedding_dim), dtype=np.float32)
+
+    @staticmethod
+    def _as_batches(knowledge_entries: Union[IndexEntryBatches, List[Dict[str, Any]]]) -> IndexEntryBatches:
+        if isinstance(knowledge_entries, IndexEntryBatches):
+            return knowledge_entries
+        return IndexEntryBatches.from_entries(list(knowledge_entries))
+
+    def _choose_nlist(self, entry_count: int) -> int:
+        """Number of IVF lists for a corpus size, or 0 if a flat index is the better fit"""
+        nlist = min(self.nlist, min(entry_count, self.train_size) // MIN_POINTS_PER_CENTROID)
+        return nlist if nlist >= MIN_IVF_LISTS else 0
+
+    def _add_entries(self, generation: IndexGeneration, knowledge_entries: List[Dict[str, Any]], batch_size: int = 256):
+        """Embed and add entries to a generation in batches"""
+        for start in range(0, len(knowledge_entries), batch_size):
+            batch = knowledge_entries[start:start + batch_size]
+            embeddings = generation.encoder.generate_embeddings([entry["content"] for entry in batch])
+            generation.add_embeddings(embeddings, [
+                self._entry_metadata(
+                    entry["id"],
+                    entry["title"],
+                    entry.get("category"),
+                    entry["content"],
+                    entry.get("tags"),
+                    entry.get("is_active", True)
+                )
+                for entry in batch
+            ])
+
+    def _publish(self, generation: IndexGeneration, old_generation: Optional[IndexGeneration]):
+        """Make a generation the serving one, then drop the previous generation"""
+        generation.save()
+        self._active = generation
+        self._write_manifest(generation)
+
+        if old_generation is not None and old_generation.storage_dir != generation.storage_dir:
+            old_generation.delete_files()
+
+    def _entry_metadata(
+        self,
+        knowledge_id: int,
+        title: str,
+        category: Optional[str],
+        text: str,
+        tags: Optional[List[str]] = None,
+        is_active: bool = True
+    ) -> Dict[str, Any]:
+        return {
+            "knowledge_id": knowledge_id,
+            "title": title,
+            "category": category,
+            "tags": list(tags or []),
+            "is_active": is_active,
+            # The full text lives in the on-disk row store so rows added after the
+            # last index save can be re-embedded; results carry a preview
+            "text": text
+        }
+
+    def _new_generation_name(self, encoder) -> str:
+        model_slug = encoder.model_id.replace("/", "_")
+        return f"{model_slug}-v{encoder.model_version}-{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')}"
+
     def get_index_stats(self) -> Dict[str, Any]:
         """Get statistics about the FAISS index"""
+        generation = self._active
         return {
-            "total_vectors": self.index.ntotal if self.index else 0,
-            "embedding_dimension": self.embedding_dim,
-            "model_name": self.model_name,
+            "total_vectors": generation.index.ntotal if generation.index else 0,
+            "embedding_dimension": generation.embedding_dim,
+            "model_name": generation.model_id,
+            "model_version": generation.model_version,
+            "generation": generation.name,
+            "index_type": generation.index_type,
+            "nlist": generation.nlist,
+            "nprobe": generation.nprobe if generation.index_type == "ivf_ondisk" else None,
             "storage_size_mb": self._get_storage_size(),
-            "categories": list(set(
-                metadata.get("category") 
-                for metadata in self.id_to_metadata.values() 
-                if metadata.get("category")
-            ))
+            "active_vectors": int(generation.bitmaps.active[:generation.bitmaps.size].sum()),
+            "categories": list(generation.bitmaps.categories.keys()),
+            "tags": list(generation.bitmaps.tags.keys()),
+            "reembedding": self.get_reembed_status(),
+            "dual_read": dict(self.dual_read_stats) if self.dual_read else None
         }
-    
-    def _save_index(self):
-        """Save FAISS index and metadata to disk"""
+
+    def get_reembed_status(self) -> Dict[str, Any]:
+        """Snapshot of the re-embedding job; the background build updates it under the lock"""
+        with self._lock:
+            return dict(self.reembed_status)
+
+    def _save_generation(self, generation: IndexGeneration):
+        """Save a generation's index and metadata to disk"""
         try:
-            if self.index:
-                faiss.write_index(self.index, str(self.index_path))
-            
-            with open(self.metadata_path, 'w') as f:
-                json.dump({
-                    "id_to_metadata": self.id_to_metadata,
-                    "next_id": self.next_id
-                }, f, indent=2)
-                
+            generation.save()
         except Exception as e:
             print(f"Error saving FAISS index: {str(e)}")
-    
+
+    def _write_manifest(self, generation: IndexGeneration):
+        """Point the manifest at the serving generation"""
+        try:
+            tmp_path = self.manifest_path.with_suffix(".tmp")
+            with open(tmp_path, 'w') as f:
+                json.dump({"active": generation.name, **generation.describe()}, f, indent=2)
+            tmp_path.replace(self.manifest_path)
+        except Exception as e:
+            print(f"Error saving FAISS manifest: {str(e)}")
+
     def _load_index(self):
-        """Load FAISS index and metadata from disk"""
+        """Load the serving index generation from disk"""
         try:
-            if self.index_path.exists():
-                self.index = faiss.read_index(str(self.index_path))
-            
-            if self.metadata_path.exists():
-                with open(self.metadata_path, 'r') as f:
-                    data = json.load(f)
-                    self.id_to_metadata = {int(k): v for k, v in data.get("id_to_metadata", {}).items()}
-                    self.next_id = data.get("next_id", 0)
-                    
+            if self.manifest_path.exists():
+                with open(self.manifest_path, 'r') as f:
+                    manifest = json.load(f)
+                encoder = create_encoder(manifest["model_id"], manifest.get("model_version", "1"))
+                generation = IndexGeneration(
+                    manifest["active"], encoder, self.generations_dir / manifest["active"], nprobe=self.nprobe
+                )
+            else:
+                # Legacy layout: a single untagged index in the storage root
+                encoder = create_encoder(self.model_name, self.model_version)
+                generation = IndexGeneration("legacy", encoder, self.storage_dir, nprobe=self.nprobe)
+
+            generation.load()
+            self._active = generation
+
+            if (generation.model_id, generation.model_version) != (self.model_name, self.model_version):
+                print(
+                    f"FAISS index was built with {generation.model_id} v{generation.model_version}; "
+                    f"start_reembedding() to move it to {self.model_name} v{self.model_version}"
+                )
+
         except Exception as e:
             print(f"Error loading FAISS index: {str(e)}")
             # Initialize empty index
-            self.index = faiss.IndexFlatIP(self.embedding_dim)
-            self.id_to_metadata = {}
-            self.next_id = 0
-    
+            encoder = create_encoder(self.model_name, self.model_version)
+            self._active = IndexGeneration("legacy", encoder, self.storage_dir, nprobe=self.nprobe)
+
     def _get_storage_size(self) -> float:
         """Get storage size in MB"""
         try:
-            total_size = 0
-            if self.index_path.exists():
-                total_size += self.index_path.stat().st_size
-            if self.metadata_path.exists():
-                total_size += self.metadata_path.stat().st_size
+            total_size = sum(
+                path.stat().st_size for path in self.storage_dir.rglob("*") if path.is_file()
+            )
             return round(total_size / (1024 * 1024), 2)
         except:
-            return 0.0
\ No newline at end of file
+            return 0.0
+
+
+def build_vector_index() -> FAISSEmbeddingService:
+    """The configured vector index; raises VectorIndexUnavailable when it is turned off"""
+    if not settings.VECTOR_INDEX_ENABLED:
+        raise VectorIndexUnavailable("The vector index is disabled; set VECTOR_INDEX_ENABLED=true")
+    return FAISSEmbeddingService(
+        model_name=settings.VECTOR_INDEX_MODEL,
+        model_version=settings.VECTOR_INDEX_MODEL_VERSION,
+        storage_dir=Path(settings.VECTOR_INDEX_STORAGE_DIR)
+    )
@@ -0,0 +1,334 @@
+"""
+Fast-path intent router that answers simple turns without calling the LLM
+"""
+
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.knowledge import KnowledgeBase
+from app.services.knowledge_service import KnowledgeService, tag_index
+from app.services.scenario_service import ScenarioService
+
+logger = logging.getLogger(__name__)
+
+# Conversational intents answered from templates. "domain" is not in this
+# table: it is built per scenario from its sample queries and stands for
+# "a real question for the LLM".
+SMALL_TALK_INTENTS: Dict[str, Dict[str, Any]] = {
+    "greeting": {
+        "examples": [
+            "hi", "hello", "hey", "hey there", "hello there", "hi there", "good morning",
+            "good afternoon", "good evening", "greetings", "hiya", "howdy"
+        ],
+        "reply": "Hello! How can I help you today?"
+    },
+    "thanks": {
+        "examples": [
+            "thanks", "thank you", "thanks a lot", "thank you so much", "many thanks",
+            "thanks for your help", "thank you for the help", "great thanks", "perfect thank you",
+            "awesome thanks", "cheers"
+        ],
+        "reply": "You're welcome! Is there anything else I can help you with?"
+    },
+    "goodbye": {
+        "examples": [
+            "bye", "goodbye", "bye bye", "see you", "see you later", "that's all",
+            "that is all for now", "have a nice day", "talk to you later"
+        ],
+        "reply": "Thanks for reaching out. Have a great day!"
+    },
+    "human_handoff": {
+        "examples": [
+            "talk to a human", "speak to a human", "talk to a person", "speak to someone",
+            "i want to talk to a real person", "connect me to an agent", "human agent please",
+            "can i speak to a representative", "transfer me to customer service",
+            "i need a real person", "let me talk to support staff", "live agent"
+        ],
+        "reply": (
+            "I understand you'd like to speak with a member of our team. I've noted your request, "
+            "and a support agent will follow up with you here as soon as possible."
+        )
+    }
+}
+
+# Words that pad small talk without changing it ("thank you so much", "hi again").
+# A turn is only routed to a small-talk intent when every word is one of these
+# or appears in the intents' examples; anything else carries a request.
+SMALL_TALK_FILLER = {
+    "a", "again", "all", "and", "everyone", "folks", "guys", "just", "much", "now",
+    "oh", "ok", "okay", "please", "really", "so", "the", "very", "well", "you"
+}
+
+FAQ_TAG = "faq"
+
+# Routed turns with this intent escalate their conversation to a human agent
+HUMAN_HANDOFF_INTENT = "human_handoff"
+
+
+class IntentMatch(BaseModel):
+    intent: str  # A small-talk intent name, or "faq"
+    confidence: float
+    reply: str
+    knowledge_id: Optional[int] = None
+    source: Optional[str] = None  # Title of the FAQ entry that answered
+
+
+class ScenarioIntentModel:
+    """
+    Nearest-centroid classifier for one scenario: one centroid per small-talk
+    intent plus a "domain" centroid from the scenario's sample queries, and
+    the individual questions of its curated FAQ entries. Small-talk intents
+    only match turns made entirely of small-talk words.
+    """
+
+    def __init__(
+        self,
+        embed,
+        sample_queries: List[str],
+        faq_entries: List[Dict[str, Any]]
+    ):
+        self.exact: Dict[str, Tuple[str, Optional[int]]] = {}
+        self.labels: List[str] = []
+        self.small_talk_words = set(SMALL_TALK_FILLER)
+        centroids = []
+
+        for intent, spec in SMALL_TALK_INTENTS.items():
+            for example in spec["examples"]:
+                self.exact[normalize(example)] = (intent, None)
+                self.exact.setdefault(strip_filler(example), (intent, None))
+                self.small_talk_words.update(normalize(example).split())
+            centroid = self._centroid([embed(example) for example in spec["examples"]])
+            if centroid is not None:
+                self.labels.append(intent)
+                centroids.append(centroid)
+
+        domain = self._centroid([embed(query) for query in sample_queries])
+        if domain is not None:
+            self.labels.append("domain")
+            centroids.append(domain)
+        self.centroids = np.vstack(centroids) if centroids else None
+
+        self.faq_entries = faq_entries
+        self.faq_rows: List[int] = []  # faq_matrix row -> faq_entries index
+        faq_vectors = []
+        for index, entry in enumerate(faq_entries):
+            self.exact[normalize(entry["title"])] = ("faq", index)
+            vector = self._unit(embed(entry["title"]))
+            if vector is not None:
+                self.faq_rows.append(index)
+                faq_vectors.append(vector)
+        self.faq_matrix = np.vstack(faq_vectors) if faq_vectors else None
+
+    def classify(
+        self,
+        message: str,
+        embedding: List[float],
+        threshold: float,
+        margin: float,
+        faq_threshold: float
+    ) -> Optional[IntentMatch]:
+        exact = self.exact.get(normalize(message)) or (
+            self.is_small_talk(message) and self.exact.get(strip_filler(message))
+        )
+        if exact:
+            return self._match(exact[0], 1.0, exact[1])
+
+        vector = self._unit(embedding)
+        if vector is None:
+            return None
+
+        if self.faq_matrix is not None:
+            similarities = self.faq_matrix @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= faq_threshold:
+                return self._match("faq", float(similarities[best]), self.faq_rows[best])
+
+        # "thanks but the item is broken" is a complaint, not thanks: any word
+        # outside small-talk vocabulary sends the turn to the LLM
+        if self.centroids is None or not self.is_small_talk(message):
+            return None
+        similarities = self.centroids @ vector
+        ranked = np.argsort(similarities)[::-1]
+        label, score = self.labels[ranked[0]], float(similarities[ranked[0]])
+        runner_up = float(similarities[ranked[1]]) if len(ranked) > 1 else 0.0
+        # Ambiguous turns, and anything closest to the scenario's own questions, go to the LLM
+        if label == "domain" or score < threshold or score - runner_up < margin:
+            return None
+        return self._match(label, score, None)
+
+    def is_small_talk(self, message: str) -> bool:
+        words = normalize(message).split()
+        return bool(words) and all(word in self.small_talk_words for word in words)
+
+    def _match(self, intent: str, confidence: float, faq_index: Optional[int]) -> IntentMatch:
+        if intent == "faq":
+            entry = self.faq_entries[faq_index]
+            return IntentMatch(
+                intent="faq",
+                confidence=confidence,
+                reply=entry["content"],
+                knowledge_id=entry["id"],
+                source=entry["title"]
+            )
+        return IntentMatch(intent=intent, confidence=confidence, reply=SMALL_TALK_INTENTS[intent]["reply"])
+
+    @classmethod
+    def _centroid(cls, embeddings: List[List[float]]) -> Optional[np.ndarray]:
+        vectors = [vector for vector in (cls._unit(embedding) for embedding in embeddings) if vector is not None]
+        if not vectors:
+            return None
+        return cls._unit(np.mean(vectors, axis=0))
+
+    @staticmethod
+    def _unit(embedding) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0:
+            return None
+        return vector / norm
+
+
+def normalize(message: str) -> str:
+    """Lowercase words only, so punctuation and spacing don't change the match"""
+    return " ".join(re.findall(r"[a-z0-9']+", message.lower()))
+
+
+def strip_filler(message: str) -> str:
+    """Normalized message without filler words, so padded small talk still finds its example"""
+    return " ".join(word for word in normalize(message).split() if word not in SMALL_TALK_FILLER)
+
+
+class IntentRouter:
+    """
+    Answers high-confidence greetings, thanks, goodbyes, hand-off requests
+    and curated FAQ questions locally in a few milliseconds. Everything
+    else falls through to the LLM. Per-scenario models are built lazily
+    and rebuilt when the scenario's knowledge changes or they grow old.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.45,
+        margin: float = 0.2,
+        faq_threshold: float = 0.9,
+        max_words: int = 12,
+        refresh_seconds: int = 300
+    ):
+        self.threshold = threshold
+        self.margin = margin
+        self.faq_threshold = faq_threshold
+        self.max_words = max_words
+        self.refresh_seconds = refresh_seconds
+        self.knowledge_service = KnowledgeService()
+        self.scenario_service = ScenarioService()
+        # scenario -> (model, knowledge version, built at)
+        self._models: Dict[str, Tuple[ScenarioIntentModel, int, float]] = {}
+        self._lock = threading.Lock()
+
+    def route(self, scenario_id: str, message: str, db: Optional[Session] = None) -> Optional[IntentMatch]:
+        """A local answer for the turn, or None when it needs the LLM"""
+        start_time = time.perf_counter()
+        match = None
+        try:
+            if len(message.split()) <= self.max_words:
+                model = self._model_for(scenario_id, db)
+                match = model.classify(
+                    message,
+                    self.knowledge_service.generate_embedding(message),
+                    self.threshold,
+                    self.margin,
+                    self.faq_threshold
+                )
+        except Exception as e:
+            logger.warning(f"Intent routing failed for scenario {scenario_id}: {e}")
+
+        metrics.observe("intent_router.classify_ms", (time.perf_counter() - start_time) * 1000)
+        if match:
+            metrics.increment("intent_router.handled", scenario=scenario_id, intent=match.intent)
+        else:
+            metrics.increment("intent_router.passed", scenario=scenario_id)
+        self._update_handled_fraction(scenario_id)
+        return match
+
+    def warm(self, scenario_id: str, db: Optional[Session] = None):
+        """Build the scenario's model ahead of its first turn"""
+        self._model_for(scenario_id, db)
+
+    def invalidate(self, scenario_id: Optional[str] = None):
+        with self._lock:
+            if scenario_id:
+                self._models.pop(scenario_id, None)
+            else:
+                self._models.clear()
+
+    def _model_for(self, scenario_id: str, db: Optional[Session]) -> ScenarioIntentModel:
+        version = self.knowledge_service.get_knowledge_version(f"{scenario_id}_BUSINESS_CONTEXT")
+        with self._lock:
+            cached = self._models.get(scenario_id)
+        if cached and cached[1] == version and time.time() - cached[2] < self.refresh_seconds:
+            return cached[0]
+
+        model = ScenarioIntentModel(
+            self.knowledge_service.generate_embedding,
+            self._sample_queries(scenario_id, db),
+            self._faq_entries(scenario_id, db)
+        )
+        with self._lock:
+            self._models[scenario_id] = (model, version, time.time())
+        return model
+
+    def _sample_queries(self, scenario_id: str, db: Optional[Session]) -> List[str]:
+        if db is None:
+            return []
+        config = self.scenario_service.get_scenario_config(scenario_id, db)
+        return list((config or {}).get("sample_queries") or [])
+
+    def _faq_entries(self, scenario_id: str, db: Optional[Session]) -> List[Dict[str, Any]]:
+        """Active knowledge entries tagged "faq" in the scenario's category; the title is the question"""
+        if db is None:
+            return []
+        tag_index.ensure_loaded(db)
+        ids = tag_index.lookup([FAQ_TAG])
+        if not ids:
+            return []
+        entries = (
+            db.query(KnowledgeBase.id, KnowledgeBase.title, KnowledgeBase.content)
+            .filter(
+                KnowledgeBase.id.in_(ids),
+                KnowledgeBase.category == f"{scenario_id}_BUSINESS_CONTEXT",
+                KnowledgeBase.is_active == True
+            )
+            .all()
+        )
+        return [
+            {"id": knowledge_id, "title": title, "content": content}
+            for knowledge_id, title, content in entries
+            if title and content
+        ]
+
+    def _update_handled_fraction(self, scenario_id: str):
+        handled = sum(
+            metrics.get_counter("intent_router.handled", scenario=scenario_id, intent=intent)
+            for intent in [*SMALL_TALK_INTENTS, "faq"]
+        )
+        passed = metrics.get_counter("intent_router.passed", scenario=scenario_id)
+        if handled + passed:
+            metrics.set_gauge("intent_router.handled_fraction", handled / (handled + passed), scenario=scenario_id)
+
+
+intent_router = IntentRouter(
+    threshold=settings.INTENT_ROUTER_THRESHOLD,
+    margin=settings.INTENT_ROUTER_MARGIN,
+    faq_threshold=settings.INTENT_ROUTER_FAQ_THRESHOLD,
+    max_words=settings.INTENT_ROUTER_MAX_WORDS,
+    refresh_seconds=settings.INTENT_ROUTER_REFRESH_SECONDS
+)
@@ -3,19 +3,36 @@ Knowledge base service with simple local embeddings
 """
 
 import numpy as np
-from typing import List, Optional, Dict, Any
+import threading
+import zlib
+from typing import Callable, Iterator, List, Optional, Dict, Any, Set, Tuple
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from app.core.config import settings
+from app.core.cache import cache
+from app.core.metrics import metrics
 from app.models.knowledge import KnowledgeBase
 
 
 class SimpleEmbeddingService:
     """Simple local embedding service using basic text features"""
     
+    # Identifies the vectors this service produces so stored embeddings can be
+    # matched to the model that generated them
+    model_id = "simple-hashed-features"
+    # v1 bucketed features with the built-in hash(), which is salted per process,
+    # so its vectors only matched queries embedded by the same process
+    model_version = "2"
+    embedding_dim = 300
+    
     def __init__(self):
         pass
     
+    @staticmethod
+    def _bucket(feature: str, buckets: int) -> int:
+        """Stable feature bucket; identical across processes and restarts"""
+        return zlib.crc32(feature.encode("utf-8")) % buckets
+    
     def generate_embedding(self, text: str) -> List[float]:
         """Generate improved embedding using TF-IDF-like features"""
         try:
@@ -32,20 +49,20 @@ class SimpleEmbeddingService:
             # Add word features
             for word in words:
                 if len(word) > 2:  # Skip very short words
-                    feature_index = abs(hash(word)) % (vocab_size // 3)
+                    feature_index = self._bucket(word, vocab_size // 3)
                     feature_vector[feature_index] += 1.0
             
             # Add bigram features
             for i in range(len(words) - 1):
                 bigram = f"{words[i]}_{words[i+1]}"
-                feature_index = abs(hash(bigram)) % (vocab_size // 3) + (vocab_size // 3)
+                feature_index = self._bucket(bigram, vocab_size // 3) + (vocab_size // 3)
                 feature_vector[feature_index] += 0.5
             
             # Add character 3-gram features
             clean_text = ''.join(words)
             for i in range(len(clean_text) - 2):
                 trigram = clean_text[i:i+3]
-                feature_index = abs(hash(trigram)) % (vocab_size // 3) + (2 * vocab_size // 3)
+                feature_index = self._bucket(trigram, vocab_size // 3) + (2 * vocab_size // 3)
                 feature_vector[feature_index] += 0.25
             
             # Normalize using L2 norm for better cosine similarity
@@ -58,16 +75,237 @@ class SimpleEmbeddingService:
         except Exception as e:
             print(f"Error generating improved embedding: {str(e)}")
             return [0.0] * 300
+    
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for a batch of texts"""
+        return [self.generate_embedding(text) for text in texts]
+
+
+class TagIndex:
+    """
+    In-memory inverted index from normalized tag to active knowledge entry ids.
+    Tag lookups touch only the posting lists of the requested tags, so their
+    cost follows the number of matches rather than the size of the corpus.
+
+    Workers follow each other's writes through a change log in the shared
+    cache: every write publishes the entry's id under the next version of
+    TAG_INDEX_CHANGES_TAG, and a worker that is behind re-reads only those
+    entries. The whole index is reloaded on first use, when the log has a
+    gap (expired records, or more than max_replay changes behind), and when
+    an admin asks for it through invalidate().
+    """
+
+    def __init__(self, max_replay: int = 1000, change_ttl: int = 3600):
+        self.max_replay = max_replay
+        self.change_ttl = change_ttl
+        self._postings: Dict[str, Set[int]] = {}
+        self._entry_tags: Dict[int, Set[str]] = {}
+        # (reload version, last change applied) from the shared cache
+        self._versions: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(tag: str) -> str:
+        return tag.strip().lower()
+
+    def ensure_loaded(self, db: Session):
+        """Build the index on first use, then catch up with writes made on any worker"""
+        shared = cache.tag_versions([TAG_INDEX_RELOAD_TAG, TAG_INDEX_CHANGES_TAG])
+        versions = (shared[TAG_INDEX_RELOAD_TAG], shared[TAG_INDEX_CHANGES_TAG])
+        if versions == self._versions:
+            return
+
+        # Held across the query and the swap: an upsert or remove that arrives
+        # meanwhile waits and is applied to the new index instead of being lost
+        with self._lock:
+            if versions == self._versions:
+                return
+            if not (
+                self._versions is not None
+                and self._versions[0] == versions[0]
+                and self._replay(db, self._versions[1], versions[1])
+            ):
+                self._reload(db)
+            # The versions read before the query: a write committed during it is applied next time
+            self._versions = versions
+
+    def publish(self, knowledge_id: int):
+        """Record a write to an entry's tags or status for the other workers; call after upsert or remove"""
+        version = cache.bump_tag(TAG_INDEX_CHANGES_TAG)
+        cache.set("tag_index_change", version, value=knowledge_id, ttl=self.change_ttl)
+        with self._lock:
+            # This worker already applied its own write
+            if self._versions is not None and self._versions[1] == version - 1:
+                self._versions = (self._versions[0], version)
+
+    def _replay(self, db: Session, applied: int, current: int) -> bool:
+        """Re-read the entries changed since applied; False when the change log cannot cover the gap"""
+        if not 0 < current - applied <= self.max_replay:
+            return False
+        changed = cache.get_many("tag_index_change", [(version,) for version in range(applied + 1, current + 1)])
+        if any(knowledge_id is None for knowledge_id in changed):
+            return False
+
+        ids = set(changed)
+        rows = (
+            db.query(KnowledgeBase.id, KnowledgeBase.tags)
+            .filter(KnowledgeBase.id.in_(ids), KnowledgeBase.is_active == True)
+            .all()
+        )
+        active = dict(rows)
+        for knowledge_id in ids:
+            self._drop(knowledge_id)
+            if knowledge_id in active:
+                self._add(knowledge_id, active[knowledge_id])
+        metrics.increment("tag_index.replayed_changes", len(changed))
+        return True
+
+    def _reload(self, db: Session):
+        # Only ids and tags are loaded, never full entry rows
+        rows = (
+            db.query(KnowledgeBase.id, KnowledgeBase.tags)
+            .filter(KnowledgeBase.is_active == True)
+            .all()
+        )
+        self._postings = {}
+        self._entry_tags = {}
+        for knowledge_id, tags in rows:
+            self._add(knowledge_id, tags)
+        metrics.increment("tag_index.reloads")
+
+    def upsert(self, knowledge_id: int, tags: Optional[List[str]]):
+        """Index (or re-index) the tags of an active entry"""
+        with self._lock:
+            self._drop(knowledge_id)
+            self._add(knowledge_id, tags)
+
+    def remove(self, knowledge_id: int):
+        """Drop an entry that was deleted or deactivated"""
+        with self._lock:
+            self._drop(knowledge_id)
+
+    def invalidate(self):
+        """Reload the index from the database on every worker at its next lookup"""
+        cache.invalidate_tags(TAG_INDEX_RELOAD_TAG)
+        self._versions = None
+
+    def lookup(self, tags: List[str], match_all: bool = False) -> List[int]:
+        """Return matching entry ids in ascending order"""
+        normalized = [self.normalize(tag) for tag in tags if tag]
+        if not normalized:
+            return []
+
+        with self._lock:
+            # Intersect starting from the rarest tag to keep the working set small
+            postings = sorted(
+                (self._postings.get(tag, set()) for tag in normalized),
+                key=len
+            )
+            if match_all:
+                matches = set(postings[0])
+                for posting in postings[1:]:
+                    matches &= posting
+            else:
+                matches = set().union(*postings)
+
+        return sorted(matches)
+
+    def _add(self, knowledge_id: int, tags: Optional[List[str]]):
+        normalized = {self.normalize(tag) for tag in tags or [] if tag}
+        self._entry_tags[knowledge_id] = normalized
+        for tag in normalized:
+            self._postings.setdefault(tag, set()).add(knowledge_id)
+
+    def _drop(self, knowledge_id: int):
+        for tag in self._entry_tags.pop(knowledge_id, set()):
+            posting = self._postings.get(tag)
+            if posting is not None:
+                posting.discard(knowledge_id)
+                if not posting:
+                    del self._postings[tag]
+
+
+def knowledge_cache_tag(category: Optional[str]) -> str:
+    """
+    Cache tag for everything derived from a knowledge category (retrieval
+    results, rendered context, cached answers). Its version in the shared
+    cache moves on every write to the category, across all workers.
+    """
+    return f"knowledge:{category or ''}"
+
+
+# Tag for derived data that spans all categories
+ALL_KNOWLEDGE_TAG = "knowledge:*"
+
+# Versions the tag index follows: one per knowledge write, and one per requested full reload
+TAG_INDEX_CHANGES_TAG = "knowledge:tag-index:changes"
+TAG_INDEX_RELOAD_TAG = "knowledge:tag-index:reload"
+
+
+class IndexEntryBatches:
+    """
+    Knowledge entries for building a vector index generation, as a source of
+    batches that can be iterated more than once: the build reads it once for
+    the IVF training sample and again to add every entry, without holding
+    the corpus in memory.
+    """
+
+    def __init__(self, batches: Callable[[], Iterator[List[Dict[str, Any]]]], total: int):
+        self._batches = batches
+        self.total = total
+
+    def __iter__(self) -> Iterator[List[Dict[str, Any]]]:
+        return iter(self._batches())
+
+    def __len__(self) -> int:
+        return self.total
+
+    @classmethod
+    def from_entries(cls, entries: List[Dict[str, Any]], batch_size: int = 256) -> "IndexEntryBatches":
+        return cls(
+            lambda: (entries[start:start + batch_size] for start in range(0, len(entries), batch_size)),
+            len(entries)
+        )
+
+
+# Shared by every KnowledgeService instance in the process
+tag_index = TagIndex()
 
 
 class KnowledgeService:
-    def __init__(self):
+    def __init__(self, vector_index=None):
         self.embedding_service = SimpleEmbeddingService()
+        # Optional FAISSEmbeddingService kept in sync with entry writes
+        self.vector_index = vector_index
 
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding for text using simple local method"""
         return self.embedding_service.generate_embedding(text)
 
+    def embedding_tag(self) -> Dict[str, str]:
+        """Model id and version stored next to every persisted embedding"""
+        return {
+            "model_id": self.embedding_service.model_id,
+            "model_version": self.embedding_service.model_version
+        }
+
+    def embed_for_storage(self, text: str) -> Dict[str, Any]:
+        """Embedding in its stored form: the vector tagged with the model that produced it"""
+        return {**self.embedding_tag(), "vector": self.generate_embedding(text)}
+
+    def stored_vector(self, embedding: Any) -> Optional[List[float]]:
+        """
+        The vector of a stored embedding if the current model produced it.
+        Untagged (legacy) vectors and vectors from another model or version
+        are not comparable with fresh query embeddings, so they yield None.
+        """
+        if not isinstance(embedding, dict) or not embedding.get("vector"):
+            return None
+        tag = self.embedding_tag()
+        if embedding.get("model_id") != tag["model_id"] or embedding.get("model_version") != tag["model_version"]:
+            return None
+        return embedding["vector"]
+
     def add_knowledge_entry(
         self, 
         title: str, 
@@ -80,7 +318,7 @@ class KnowledgeService:
         """Add a new knowledge base entry with local embeddings"""
         
         # Generate embedding locally
-        embedding = self.generate_embedding(f"{title} {content}")
+        embedding = self.embed_for_storage(f"{title} {content}")
         
         knowledge_entry = KnowledgeBase(
             title=title,
@@ -96,9 +334,90 @@ class KnowledgeService:
             db.add(knowledge_entry)
             db.commit()
             db.refresh(knowledge_entry)
+            self.refresh_entry_indexes(knowledge_entry)
         
         return knowledge_entry
 
+    def refresh_entry_indexes(self, entry: KnowledgeBase, previous_category: Optional[str] = None):
+        """Sync in-memory indexes after an entry is created, updated or deactivated"""
+        if entry.id is None:
+            return
+        
+        if entry.is_active:
+            tag_index.upsert(entry.id, entry.tags)
+        else:
+            tag_index.remove(entry.id)
+        tag_index.publish(entry.id)
+        
+        if self.vector_index is not None:
+            self._sync_vector_index(entry)
+        
+        self.invalidate_category(entry.category)
+        if previous_category and previous_category != entry.category:
+            self.invalidate_category(previous_category)
+    
+    def _sync_vector_index(self, entry: KnowledgeBase):
+        """Mirror an entry write into the vector index"""
+        try:
+            # Index rows are append-only: the entry's old rows are masked out
+            # and an active entry is added again with its current content
+            self.vector_index.set_entry_active(entry.id, False)
+            if entry.is_active:
+                self.vector_index.add_to_index(entry.content, entry.id, entry.title, entry.category, entry.tags)
+        except Exception as e:
+            print(f"Error syncing entry {entry.id} to the vector index: {str(e)}")
+    
+    def index_entry_batches(self, db: Session, batch_size: int = 500) -> IndexEntryBatches:
+        """
+        Active entries in the shape the vector index builds generations from,
+        read in id order a batch at a time. Each pass opens its own session on
+        db's engine, since the build outlives the request that started it.
+        """
+        total = db.query(func.count(KnowledgeBase.id)).filter(KnowledgeBase.is_active == True).scalar() or 0
+        bind = db.get_bind()
+        
+        def batches() -> Iterator[List[Dict[str, Any]]]:
+            session = Session(bind=bind)
+            try:
+                last_id = None
+                while True:
+                    # Keyset pagination: each batch is an index range scan, however deep
+                    query = (
+                        session.query(
+                            KnowledgeBase.id,
+                            KnowledgeBase.title,
+                            KnowledgeBase.content,
+                            KnowledgeBase.category,
+                            KnowledgeBase.tags
+                        )
+                        .filter(KnowledgeBase.is_active == True)
+                    )
+                    if last_id is not None:
+                        query = query.filter(KnowledgeBase.id > last_id)
+                    rows = query.order_by(KnowledgeBase.id).limit(batch_size).all()
+                    if not rows:
+                        return
+                    yield [
+                        {"id": knowledge_id, "title": title, "content": content, "category": category, "tags": tags}
+                        for knowledge_id, title, content, category, tags in rows
+                    ]
+                    last_id = rows[-1][0]
+            finally:
+                session.close()
+        
+        return IndexEntryBatches(batches, total)
+    
+    def invalidate_category(self, category: Optional[str]):
+        """Mark cached data derived from a category as stale on every worker"""
+        try:
+            cache.invalidate_tags(knowledge_cache_tag(category), ALL_KNOWLEDGE_TAG)
+        except Exception as e:
+            print(f"Error invalidating knowledge cache for {category}: {str(e)}")
+    
+    def get_knowledge_version(self, category: Optional[str]) -> int:
+        """Current version of a knowledge category"""
+        return cache.tag_version(knowledge_cache_tag(category))
+
     def semantic_search(
         self, 
         query: str, 
@@ -112,6 +431,73 @@ class KnowledgeService:
         if not db:
             return []
         
+        # Ranking scans every entry in the category, so the ranked ids are
+        # cached and shared across workers until the category changes
+        ranked: Dict[int, KnowledgeBase] = {}
+        
+        def rank_ids() -> List[int]:
+            entries = self._rank_entries(query, limit, db, category, min_similarity)
+            ranked.update((entry.id, entry) for entry in entries)
+            return [entry.id for entry in entries]
+        
+        ids = cache.get_or_set(
+            "retrieval",
+            *self._retrieval_key(query, limit, category, min_similarity),
+            factory=rank_ids,
+            tags=[knowledge_cache_tag(category) if category else ALL_KNOWLEDGE_TAG]
+        )
+        
+        if not ids:
+            return []
+        if not ranked:
+            return self.get_entries_by_ids(ids, db)
+        
+        return [ranked[knowledge_id] for knowledge_id in ids if knowledge_id in ranked]
+
+    def get_entries_by_ids(self, knowledge_ids: List[int], db: Session) -> List[KnowledgeBase]:
+        """Active entries for ranked ids, in the given order"""
+        if not knowledge_ids:
+            return []
+        entries = (
+            db.query(KnowledgeBase)
+            .filter(KnowledgeBase.id.in_(knowledge_ids), KnowledgeBase.is_active == True)
+            .all()
+        )
+        by_id = {entry.id: entry for entry in entries}
+        return [by_id[knowledge_id] for knowledge_id in knowledge_ids if knowledge_id in by_id]
+
+    def _retrieval_key(self, query: str, limit: int, category: Optional[str], min_similarity: float) -> tuple:
+        return (
+            self._ranking_model(),
+            category,
+            " ".join(query.lower().split()),
+            limit,
+            min_similarity
+        )
+
+    def _ranking_model(self) -> str:
+        """What produces the ranking, so cached results never cross models"""
+        if self._use_vector_index():
+            return f"faiss:{self.vector_index.serving_model}"
+        return f"{self.embedding_service.model_id}:v{self.embedding_service.model_version}"
+
+    def _use_vector_index(self) -> bool:
+        return self.vector_index is not None and self.vector_index.size > 0
+
+    def _rank_entries(
+        self,
+        query: str,
+        limit: int,
+        db: Session,
+        category: Optional[str],
+        min_similarity: float
+    ) -> List[KnowledgeBase]:
+        """Score every active entry against the query and keep the best matches"""
+        if self._use_vector_index():
+            # The index returns ids only; content is loaded from the database
+            hits = self.vector_index.search_ids(query, limit=limit, category=category, min_score=min_similarity)
+            return self.get_entries_by_ids([knowledge_id for knowledge_id, _ in hits], db)
+        
         # Generate query embedding
         query_embedding = self.generate_embedding(query)
         
@@ -128,14 +514,25 @@ class KnowledgeService:
         
         # Calculate similarities
         similarities = []
+        stale = 0
         for entry in knowledge_entries:
-            if entry.embedding:
-                # Calculate cosine similarity
-                similarity = self._calculate_similarity(
-                    query_embedding, 
-                    entry.embedding
-                )
-                similarities.append((entry, similarity))
+            entry_embedding = self.stored_vector(entry.embedding)
+            if entry_embedding is None:
+                # Vectors from a different embedding model (or untagged ones) are
+                # not comparable; score a fresh embedding until the startup
+                # backfill (or the admin refresh) stores a current one
+                entry_embedding = self.generate_embedding(f"{entry.title} {entry.content}")
+                stale += 1
+            
+            # Calculate cosine similarity
+            similarity = self._calculate_similarity(
+                query_embedding, 
+                entry_embedding
+            )
+            similarities.append((entry, similarity))
+        
+        if stale:
+            metrics.increment("knowledge.stale_embeddings", stale)
         
         # Sort by similarity and filter by minimum threshold
         similarities.sort(key=lambda x: x[1], reverse=True)
@@ -163,37 +560,54 @@ class KnowledgeService:
             return False
         
         # Generate new embedding locally
-        new_embedding = self.generate_embedding(f"{knowledge.title} {knowledge.content}")
-        knowledge.embedding = new_embedding
+        knowledge.embedding = self.embed_for_storage(f"{knowledge.title} {knowledge.content}")
         
         db.add(knowledge)
         db.commit()
+        self.invalidate_category(knowledge.category)
         
         return True
 
-    def bulk_update_embeddings(self, db: Session) -> int:
-        """Update embeddings for all knowledge entries"""
-        
-        entries_without_embeddings = (
-            db.query(KnowledgeBase)
-            .filter(
-                KnowledgeBase.is_active == True,
-                KnowledgeBase.embedding.is_(None)
-            )
-            .all()
-        )
-        
+    def bulk_update_embeddings(
+        self,
+        db: Session,
+        batch_size: int = 200,
+        should_stop: Optional[Callable[[], bool]] = None
+    ) -> int:
+        """
+        Embed entries that have no embedding or one from another model or
+        version. Entries are read in id order a batch at a time and each
+        batch is committed before the next is loaded, so memory stays flat
+        and an interrupted run keeps the batches it finished. should_stop is
+        checked between batches.
+        """
         updated_count = 0
-        for entry in entries_without_embeddings:
-            try:
-                embedding = self.generate_embedding(f"{entry.title} {entry.content}")
-                entry.embedding = embedding
-                db.add(entry)
-                updated_count += 1
-            except Exception as e:
-                print(f"Error updating embedding for entry {entry.id}: {str(e)}")
+        categories = set()
+        last_id = None
+        while not (should_stop and should_stop()):
+            # Keyset pagination: each batch is an index range scan, however deep
+            query = db.query(KnowledgeBase).filter(KnowledgeBase.is_active == True)
+            if last_id is not None:
+                query = query.filter(KnowledgeBase.id > last_id)
+            batch = query.order_by(KnowledgeBase.id).limit(batch_size).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+            
+            for entry in batch:
+                if self.stored_vector(entry.embedding) is not None:
+                    continue
+                try:
+                    entry.embedding = self.embed_for_storage(f"{entry.title} {entry.content}")
+                    db.add(entry)
+                    updated_count += 1
+                    categories.add(entry.category)
+                except Exception as e:
+                    print(f"Error updating embedding for entry {entry.id}: {str(e)}")
+            db.commit()
         
-        db.commit()
+        for category in categories:
+            self.invalidate_category(category)
         return updated_count
 
     def get_related_entries(
@@ -245,22 +659,30 @@ class KnowledgeService:
         self, 
         tags: List[str], 
         db: Session,
-        limit: int = 20
+        limit: int = 20,
+        offset: int = 0,
+        match_all: bool = False
     ) -> List[KnowledgeBase]:
-        """Search knowledge entries by tags"""
+        """Search knowledge entries by tags (any tag by default, or all with match_all)"""
+        
+        tag_index.ensure_loaded(db)
+        page_ids = tag_index.lookup(tags, match_all=match_all)[offset:offset + limit]
+        
+        if not page_ids:
+            return []
         
-        results = []
-        knowledge_entries = (
+        # Fetch only the rows on the requested page
+        entries = (
             db.query(KnowledgeBase)
-            .filter(KnowledgeBase.is_active == True)
+            .filter(
+                KnowledgeBase.id.in_(page_ids),
+                KnowledgeBase.is_active == True
+            )
             .all()
         )
         
-        for entry in knowledge_entries:
-            if entry.tags and any(tag in entry.tags for tag in tags):
-                results.append(entry)
-        
-        return results[:limit]
+        entries_by_id = {entry.id: entry for entry in entries}
+        return [entries_by_id[knowledge_id] for knowledge_id in page_ids if knowledge_id in entries_by_id]
 
     def _calculate_similarity(self, embedding1: List[float], embedding2: List[float]) -> float:
         """Calculate cosine similarity between two embeddings"""
@@ -299,7 +721,6 @@ class KnowledgeService:
         )
         
         # Get category distribution
-        from sqlalchemy import func
         category_stats = (
             db.query(
                 KnowledgeBase.category, 
@@ -315,5 +736,6 @@ class KnowledgeService:
             "entries_with_embeddings": entries_with_embeddings,
             "embedding_coverage": (entries_with_embeddings / total_entries * 100) if total_entries > 0 else 0,
             "categories": [{"name": cat, "count": count} for cat, count in category_stats],
-            "embedding_type": "Simple local embeddings"
+            "embedding_type": "Simple local embeddings",
+            "embedding_model": self.embedding_tag()
         }
\ No newline at end of file
@@ -0,0 +1,392 @@
+"""
+LLM provider interface with Gemini and deterministic local mock implementations
+"""
+
+import asyncio
+import datetime
+import hashlib
+import logging
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Optional, Tuple, Union
+
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.core.executors import BoundedExecutor
+from app.core.metrics import metrics
+
+try:
+    import google.generativeai as genai
+except ImportError:  # pragma: no cover - the SDK is in requirements; the mock provider runs without it
+    genai = None
+
+logger = logging.getLogger(__name__)
+
+# Configure Gemini AI
+if genai is not None and settings.GOOGLE_AI_API_KEY:
+    genai.configure(api_key=settings.GOOGLE_AI_API_KEY)
+
+
+class LLMProviderUnavailable(RuntimeError):
+    """The configured provider cannot be built in this environment"""
+
+
+class LLMUsage(BaseModel):
+    """Token counts reported by the provider for one call"""
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    total_tokens: Optional[int] = None
+
+
+class LLMResult(BaseModel):
+    text: str
+    model: str
+    usage: Optional[LLMUsage] = None
+
+
+class LLMChunk(BaseModel):
+    """Streamed text; the provider may attach usage to any chunk, usually the last"""
+    text: str = ""
+    usage: Optional[LLMUsage] = None
+
+
+class LLMProvider:
+    """
+    Interface every LLM backend implements. A prompt is either plain text
+    or a PromptParts (stable prefix plus per-turn suffix), which providers
+    with prefix caching can exploit; others just send prompt.text.
+    """
+
+    name = "base"
+    model = "unknown"
+
+    async def generate(self, prompt: Union[str, Any]) -> LLMResult:
+        raise NotImplementedError
+
+    async def open_stream(self, prompt: Union[str, Any]) -> AsyncIterator[LLMChunk]:
+        """Start a streamed generation; returns once the provider has accepted the request"""
+        raise NotImplementedError
+
+    @staticmethod
+    def prompt_text(prompt: Union[str, Any]) -> str:
+        return prompt if isinstance(prompt, str) else prompt.text
+
+
+class GeminiContextCache:
+    """
+    Registers each scenario's canonical prompt prefix (system prompt plus
+    untrimmed business context) as Gemini cached content, so each turn
+    only uploads its suffix and the provider skips re-processing the prefix.
+
+    One registration is kept per scenario: a new fingerprint (the scenario's
+    prompt or knowledge changed) replaces the old one, and the one-off
+    prefixes of turns trimmed to fit the budget are sent in full rather than
+    registered. Registrations and failures expire with the provider's TTL,
+    and at most max_scenarios are tracked.
+    """
+
+    def __init__(self, model_name: str, ttl: int = 3600, min_tokens: int = 1024, max_scenarios: int = 64):
+        self.model_name = model_name
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.max_scenarios = max_scenarios
+        # scenario id -> (fingerprint, model or None after a failure, expiry), least recently used first
+        self._models: "OrderedDict[str, Tuple[str, Optional[Any], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def model_for(self, prefix: Any) -> Optional[Any]:
+        """A model bound to the cached prefix, or None to send the full prompt"""
+        # Rough size check; the provider rejects cached content below its minimum
+        if not prefix.canonical or len(prefix.text) / 4 < self.min_tokens:
+            return None
+
+        now = time.time()
+        with self._lock:
+            cached = self._models.get(prefix.scenario_id)
+            if cached and cached[0] == prefix.fingerprint and cached[2] > now:
+                self._models.move_to_end(prefix.scenario_id)
+                # None while a failed registration backs off
+                return cached[1]
+
+        try:
+            model = self._register(prefix)
+        except Exception as e:
+            logger.warning(f"Gemini context cache registration failed: {e}")
+            metrics.increment("ai.context_cache_errors", scenario=prefix.scenario_id)
+            self._put(prefix, None, now + self.ttl)
+            return None
+
+        metrics.increment("ai.context_cache_registrations", scenario=prefix.scenario_id)
+        # Renew a little before the provider expires the content
+        self._put(prefix, model, now + self.ttl * 0.9)
+        return model
+
+    def _register(self, prefix: Any) -> Any:
+        from google.generativeai import caching
+        cached_content = caching.CachedContent.create(
+            model=f"models/{self.model_name}",
+            display_name=f"prefix-{prefix.scenario_id}-{prefix.fingerprint[:12]}",
+            system_instruction=prefix.text,
+            ttl=datetime.timedelta(seconds=self.ttl)
+        )
+        return genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+
+    def _put(self, prefix: Any, model: Optional[Any], expires_at: float):
+        with self._lock:
+            self._models[prefix.scenario_id] = (prefix.fingerprint, model, expires_at)
+            self._models.move_to_end(prefix.scenario_id)
+            while len(self._models) > self.max_scenarios:
+                self._models.popitem(last=False)
+
+
+class GeminiProvider(LLMProvider):
+    """
+    Gemini through the SDK's async client. Where the async client is not
+    available (or native_async is off), blocking SDK calls run on a
+    dedicated executor instead of the event loop's shared default pool.
+    """
+
+    name = "gemini"
+
+    def __init__(
+        self,
+        model: str = "gemini-2.5-flash",
+        context_cache: Optional[GeminiContextCache] = None,
+        executor: Optional[BoundedExecutor] = None,
+        native_async: bool = True
+    ):
+        if genai is None:
+            raise LLMProviderUnavailable(
+                f"AI_MODEL={model} needs the google-generativeai package; install it or set AI_MODEL=mock"
+            )
+        self.model = model
+        self.client = genai.GenerativeModel(model)
+        self.context_cache = context_cache
+        self.executor = executor or BoundedExecutor("llm")
+        self.native_async = native_async
+
+    async def generate(self, prompt: Union[str, Any]) -> LLMResult:
+        client, contents = await self._target(prompt)
+        if self._use_async(client):
+            response = await client.generate_content_async(contents)
+        else:
+            response = await self.executor.run(client.generate_content, contents)
+        return LLMResult(text=response.text, model=self.model, usage=self._usage(response))
+
+    async def open_stream(self, prompt: Union[str, Any]) -> AsyncIterator[LLMChunk]:
+        client, contents = await self._target(prompt)
+        if self._use_async(client):
+            stream = await client.generate_content_async(contents, stream=True)
+            return self._iterate_async(stream)
+        stream = await self.executor.run(client.generate_content, contents, stream=True)
+        return self._iterate(iter(stream))
+
+    async def _iterate_async(self, stream) -> AsyncIterator[LLMChunk]:
+        async for chunk in stream:
+            yield LLMChunk(text=self._chunk_text(chunk), usage=self._usage(chunk))
+
+    async def _iterate(self, chunks) -> AsyncIterator[LLMChunk]:
+        while True:
+            # Each network read blocks, so pull chunks off the event loop
+            chunk = await self.executor.run(next, chunks, None)
+            if chunk is None:
+                return
+            yield LLMChunk(text=self._chunk_text(chunk), usage=self._usage(chunk))
+
+    async def _target(self, prompt: Union[str, Any]) -> Tuple[Any, str]:
+        """Client and contents to send: the suffix alone when the prefix is cached upstream"""
+        if self.context_cache and not isinstance(prompt, str):
+            cached_client = await self.executor.run(self.context_cache.model_for, prompt.prefix)
+            if cached_client is not None:
+                return cached_client, prompt.suffix
+        return self.client, self.prompt_text(prompt)
+
+    def _use_async(self, client: Any) -> bool:
+        return self.native_async and hasattr(client, "generate_content_async")
+
+    @staticmethod
+    def _chunk_text(chunk: Any) -> str:
+        """Text of a streamed chunk; chunks without text parts (e.g. the final one) raise in the SDK"""
+        try:
+            return chunk.text or ""
+        except ValueError:
+            return ""
+
+    @staticmethod
+    def _usage(response: Any) -> Optional[LLMUsage]:
+        usage = getattr(response, "usage_metadata", None)
+        if not usage or not getattr(usage, "total_token_count", 0):
+            return None
+        return LLMUsage(
+            prompt_tokens=getattr(usage, "prompt_token_count", None),
+            completion_tokens=getattr(usage, "candidates_token_count", None),
+            cached_tokens=getattr(usage, "cached_content_token_count", None),
+            total_tokens=getattr(usage, "total_token_count", None)
+        )
+
+
+class ResourceExhausted(Exception):
+    """Injected rate-limit error; shares its name with the SDK's 429 so retry policies treat it the same"""
+    code = 429
+
+
+class MockLLMProvider(LLMProvider):
+    """
+    Offline provider for load and latency testing. Replies are a pure
+    function of the prompt and seed, so runs are reproducible. Latency
+    follows a log-normal distribution around a median with time to first
+    token and a token rate for streaming, and failures or rate limits can
+    be injected at fixed rates.
+    """
+
+    name = "mock"
+
+    VOCABULARY = (
+        "order", "shipping", "account", "refund", "update", "team", "details", "support",
+        "policy", "request", "help", "today", "confirm", "check", "available", "option"
+    )
+
+    def __init__(
+        self,
+        model: str = "mock",
+        latency_ms: float = 800.0,
+        latency_sigma: float = 0.3,
+        ttft_ms: float = 250.0,
+        tokens_per_second: float = 60.0,
+        output_tokens: int = 80,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        seed: int = 0
+    ):
+        self.model = model
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.ttft_ms = ttft_ms
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.seed = seed
+        # Failures and latency jitter follow one seeded sequence per process
+        self._random = random.Random(seed)
+
+    async def generate(self, prompt: Union[str, Any]) -> LLMResult:
+        text = self.prompt_text(prompt)
+        self._maybe_fail()
+        await asyncio.sleep(self._sample_latency(self.latency_ms) / 1000)
+        reply = self._reply(text)
+        return LLMResult(text=reply, model=self.model, usage=self._usage(text, reply))
+
+    async def open_stream(self, prompt: Union[str, Any]) -> AsyncIterator[LLMChunk]:
+        text = self.prompt_text(prompt)
+        self._maybe_fail()
+        await asyncio.sleep(self._sample_latency(self.ttft_ms) / 1000)
+        return self._stream(text)
+
+    async def _stream(self, text: str) -> AsyncIterator[LLMChunk]:
+        reply = self._reply(text)
+        words = reply.split(" ")
+        for index, word in enumerate(words):
+            if index:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            last = index == len(words) - 1
+            yield LLMChunk(
+                text=word if index == 0 else f" {word}",
+                usage=self._usage(text, reply) if last else None
+            )
+
+    def _maybe_fail(self):
+        roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            raise ResourceExhausted("Mock rate limit")
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise RuntimeError("Mock upstream error")
+
+    def _sample_latency(self, median_ms: float) -> float:
+        return median_ms * math.exp(self._random.gauss(0, self.latency_sigma)) if median_ms > 0 else 0.0
+
+    def _reply(self, prompt: str) -> str:
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode("utf-8")).digest()
+        rng = random.Random(digest)
+        question = prompt.rsplit("Customer: ", 1)[-1].split("\n", 1)[0].strip()[:120]
+        words = [rng.choice(self.VOCABULARY) for _ in range(max(0, self.output_tokens - 12))]
+        return f"Thanks for asking about \"{question}\". " + " ".join(words) + "."
+
+    @staticmethod
+    def _usage(prompt: str, reply: str) -> LLMUsage:
+        prompt_tokens = len(prompt.split())
+        completion_tokens = len(reply.split())
+        return LLMUsage(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens
+        )
+
+
+def provider_name(model: str) -> str:
+    """Name of the provider create_llm_provider builds for a model, without building it"""
+    return MockLLMProvider.name if model == "mock" or model.startswith("mock:") else GeminiProvider.name
+
+
+def tokenizer_spec(model: str) -> str:
+    """Tokenizer spec counting like the provider for a model; heuristic for the mock or without an API key"""
+    if provider_name(model) == GeminiProvider.name and genai is not None and settings.GOOGLE_AI_API_KEY:
+        return f"gemini:{model}"
+    return "heuristic"
+
+
+def create_llm_provider(model: str) -> LLMProvider:
+    """Provider for a Settings.AI_MODEL value: "mock" or "mock:<name>" for the local mock, otherwise Gemini"""
+    if provider_name(model) == MockLLMProvider.name:
+        return MockLLMProvider(
+            model=model,
+            latency_ms=settings.MOCK_LLM_LATENCY_MS,
+            latency_sigma=settings.MOCK_LLM_LATENCY_SIGMA,
+            ttft_ms=settings.MOCK_LLM_TTFT_MS,
+            tokens_per_second=settings.MOCK_LLM_TOKENS_PER_SECOND,
+            output_tokens=settings.MOCK_LLM_OUTPUT_TOKENS,
+            error_rate=settings.MOCK_LLM_ERROR_RATE,
+            rate_limit_rate=settings.MOCK_LLM_RATE_LIMIT_RATE,
+            seed=settings.MOCK_LLM_SEED
+        )
+
+    context_cache = None
+    if settings.GEMINI_CONTEXT_CACHE_ENABLED:
+        context_cache = GeminiContextCache(
+            model_name=model,
+            ttl=settings.GEMINI_CONTEXT_CACHE_TTL,
+            min_tokens=settings.GEMINI_CONTEXT_CACHE_MIN_TOKENS,
+            max_scenarios=settings.GEMINI_CONTEXT_CACHE_MAX_SCENARIOS
+        )
+    return GeminiProvider(
+        model=model,
+        context_cache=context_cache,
+        executor=llm_executor,
+        native_async=settings.AI_NATIVE_ASYNC
+    )
+
+
+# Blocking LLM SDK calls never compete with the default thread pool
+llm_executor = BoundedExecutor("llm", max_workers=settings.AI_EXECUTOR_MAX_WORKERS)
+
+_llm_provider: Optional[LLMProvider] = None
+_llm_provider_lock = threading.Lock()
+
+
+def get_llm_provider() -> LLMProvider:
+    """
+    The provider for Settings.AI_MODEL, shared by every service in the
+    process. Built on first use, so a missing SDK or key fails that call
+    with LLMProviderUnavailable instead of every import of this module.
+    """
+    global _llm_provider
+    if _llm_provider is None:
+        with _llm_provider_lock:
+            if _llm_provider is None:
+                _llm_provider = create_llm_provider(settings.AI_MODEL)
+    return _llm_provider
@@ -0,0 +1,117 @@
+"""
+Token-budgeted prompt assembly
+"""
+
+from typing import Dict, List, Tuple
+
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.services.llm_providers import tokenizer_spec
+from app.utils.tokens import TokenCounter
+
+# Separator between rendered sections of a prompt
+SECTION_SEPARATOR = "\n\n"
+
+
+class PromptSection(BaseModel):
+    """
+    One block of a prompt. Sections with a lower priority are trimmed
+    first; trim decides how: "oldest" drops items from the front (history),
+    "weakest" drops items from the back (ranked search hits), "truncate"
+    shortens the last item, and "none" never trims.
+    """
+    name: str
+    items: List[str]
+    header: str = ""
+    footer: str = ""
+    separator: str = "\n"
+    priority: int = 0
+    trim: str = "none"
+
+    def render(self) -> str:
+        if not self.items:
+            return ""
+        return f"{self.header}{self.separator.join(self.items)}{self.footer}"
+
+
+class PromptAssembler:
+    """Fits a list of sections into an input token budget"""
+
+    def __init__(self, counter: TokenCounter):
+        self.counter = counter
+
+    def total_tokens(self, sections: List[PromptSection]) -> int:
+        return self.counter.count(self.render(sections))
+
+    @staticmethod
+    def render(sections: List[PromptSection]) -> str:
+        return SECTION_SEPARATOR.join(text for text in (s.render() for s in sections) if text)
+
+    def fit(self, sections: List[PromptSection], budget: int) -> Tuple[List[PromptSection], int, Dict[str, int]]:
+        """
+        Trim sections until the rendered prompt fits the budget.
+        Returns the trimmed sections, the estimated total and the tokens removed per section.
+
+        Each header, footer, separator and item is counted once; a section's
+        count is the sum of its pieces, so dropping an item is a subtraction
+        rather than a recount of the whole section (a provider round trip
+        when the tokenizer is remote).
+        """
+        sections = [section.model_copy(deep=True) for section in sections]
+        item_counts = [[self.counter.count(item) for item in section.items] for section in sections]
+        frames = [self.counter.count(section.header) + self.counter.count(section.footer) for section in sections]
+        item_separators = [self.counter.count(section.separator) for section in sections]
+        separator_tokens = self.counter.count(SECTION_SEPARATOR) or 1
+        trimmed: Dict[str, int] = {}
+
+        def section_tokens(i: int) -> int:
+            if not item_counts[i]:
+                return 0
+            return frames[i] + sum(item_counts[i]) + item_separators[i] * (len(item_counts[i]) - 1)
+
+        def total() -> int:
+            counts = [section_tokens(i) for i in range(len(sections))]
+            return sum(counts) + separator_tokens * max(0, sum(1 for c in counts if c) - 1)
+
+        order = sorted(
+            (i for i, section in enumerate(sections) if section.trim != "none"),
+            key=lambda i: sections[i].priority
+        )
+        for i in order:
+            if total() <= budget:
+                break
+
+            section = sections[i]
+            before = section_tokens(i)
+
+            if section.trim in ("oldest", "weakest"):
+                while section.items and total() > budget:
+                    index = 0 if section.trim == "oldest" else -1
+                    section.items.pop(index)
+                    item_counts[i].pop(index)
+            elif section.trim == "truncate" and section.items:
+                allowed = max(0, item_counts[i][-1] - (total() - budget))
+                section.items[-1] = self.counter.truncate(section.items[-1], allowed)
+                if section.items[-1]:
+                    item_counts[i][-1] = self.counter.count(section.items[-1])
+                else:
+                    section.items.pop()
+                    item_counts[i].pop()
+
+            if before > section_tokens(i):
+                trimmed[section.name] = before - section_tokens(i)
+
+        return sections, total(), trimmed
+
+
+def input_token_budget(scenario_id: str) -> int:
+    """Input token budget for a scenario; per-scenario overrides win over the default"""
+    return settings.PROMPT_INPUT_TOKEN_BUDGETS.get(scenario_id, settings.PROMPT_INPUT_TOKEN_BUDGET)
+
+
+# Shared by every prompt built in the process, so repeated pieces are counted once
+token_counter = TokenCounter(
+    spec=tokenizer_spec(settings.AI_MODEL) if settings.PROMPT_TOKENIZER == "provider" else settings.PROMPT_TOKENIZER
+)
+prompt_assembler = PromptAssembler(token_counter)
@@ -2,43 +2,93 @@
 Enhanced Prompt Service for dynamic, context-aware prompt generation
 """
 
+import hashlib
 import os
-from typing import Dict, List, Optional, Any, Union
-from pathlib import Path
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Tuple, Union
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
+from app.core.cache import cache
+from app.core.metrics import metrics
 from app.models.conversation import ScenarioType
-from app.services.knowledge_service import KnowledgeService
+from app.services.knowledge_service import KnowledgeService, knowledge_cache_tag
+from app.services.prompt_assembler import PromptSection, input_token_budget, prompt_assembler
+from app.services.prompt_templates import prompt_templates
+from app.services.summary_service import conversation_summarizer
+
+# Knowledge entries retrieved per turn. Prefetchers (the turn pipeline, speculative
+# retrieval) search with the same limit so assembly finds their cached ranking
+RETRIEVAL_LIMIT = 3
+
+
+class PromptPrefix(BaseModel):
+    """Stable leading part of a prompt; the fingerprint identifies its exact text"""
+    scenario_id: str
+    text: str
+    fingerprint: str
+    system_prompt: str = ""
+    business_context: Optional[str] = None
+    canonical: bool = True  # False for a turn's one-off prefix with trimmed business context
+
+
+class PromptParts(BaseModel):
+    """A prompt split into the reusable prefix and the per-turn suffix"""
+    prefix: PromptPrefix
+    suffix: str
+    token_count: Optional[int] = None  # Estimated input tokens of the whole prompt
+    trimmed_tokens: Dict[str, int] = {}  # Tokens removed per section to fit the budget
+    
+    @property
+    def text(self) -> str:
+        return f"{self.prefix.text}\n\n{self.suffix}"
+
+
+class PromptPrefixCache:
+    """Rendered prefixes per (scenario, knowledge version), oldest evicted first"""
+    
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], PromptPrefix]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, scenario_id: str, version: int) -> Optional[PromptPrefix]:
+        with self._lock:
+            prefix = self._entries.get((scenario_id, version))
+            if prefix is not None:
+                self._entries.move_to_end((scenario_id, version))
+        metrics.increment("prompt.prefix_cache_hits" if prefix else "prompt.prefix_cache_misses", scenario=scenario_id)
+        return prefix
+    
+    def put(self, scenario_id: str, version: int, prefix: PromptPrefix):
+        with self._lock:
+            self._entries[(scenario_id, version)] = prefix
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared by every PromptService instance in the process
+prompt_prefixes = PromptPrefixCache()
 
 
 class PromptService:
     def __init__(self):
-        self.prompts_dir = Path(__file__).parent.parent / "prompts"
+        self.prompts_dir = prompt_templates.prompts_dir
         self.knowledge_service = KnowledgeService()
     
     def load_prompt_template(self, scenario: Union[ScenarioType, str]) -> str:
-        """Load scenario-specific prompt template"""
-        # Handle built-in scenarios
-        if isinstance(scenario, ScenarioType):
-            scenario_map = {
-                ScenarioType.ECOMMERCE: "ecommerce",
-                ScenarioType.SAAS: "saas", 
-                ScenarioType.SERVICE_BUSINESS: "service"
-            }
-            
-            # Load base prompt
-            base_prompt_path = self.prompts_dir / "base" / "system_base.md"
-            base_prompt = self._load_file(base_prompt_path)
-            
-            # Load scenario-specific prompt
-            scenario_dir = scenario_map.get(scenario, "ecommerce")
-            scenario_prompt_path = self.prompts_dir / scenario_dir / "system.md"
-            scenario_prompt = self._load_file(scenario_prompt_path)
-            
-            return f"{base_prompt}\n\n{scenario_prompt}"
-        else:
-            # For custom scenarios, return a basic prompt - the ScenarioService will handle the custom prompt
-            return "You are a helpful customer support assistant."
+        """Scenario-specific prompt template, compiled in memory by the template registry"""
+        # Custom scenarios need a session; see get_system_prompt
+        return prompt_templates.system_prompt(scenario)
+    
+    def get_system_prompt(self, scenario: Union[ScenarioType, str], db: Optional[Session] = None) -> str:
+        """System prompt for a built-in or (with a session) custom scenario"""
+        return prompt_templates.system_prompt(scenario, db)
     
     def build_context_aware_prompt(
         self,
@@ -49,76 +99,164 @@ class PromptService:
         db: Session = None
     ) -> str:
         """Build a complete, context-aware prompt"""
+        prefix = self.build_prompt_prefix(scenario, business_context)
+        return self.assemble_prompt(scenario, user_message, conversation_history, db, prefix=prefix).text
+    
+    def assemble_prompt(
+        self,
+        scenario: Union[ScenarioType, str],
+        user_message: str,
+        conversation_history: List[Dict[str, Any]] = None,
+        db: Session = None,
+        prefix: Optional[PromptPrefix] = None,
+        max_tokens: Optional[int] = None,
+        conversation_summary: Optional[str] = None,
+        knowledge_ids: Optional[List[int]] = None
+    ) -> PromptParts:
+        """
+        Build the prompt for a turn within the scenario's input token budget.
+        Over budget, sections are trimmed in order: oldest history first,
+        then the weakest knowledge matches, the conversation summary, the
+        business context, and only as a last resort the customer's message.
+
+        knowledge_ids, when given, is a ranking already retrieved for this
+        turn (e.g. from the typing draft) and replaces the search.
+        """
+        scenario_id = scenario.value if hasattr(scenario, 'value') else str(scenario)
+        prefix = prefix or self.get_prompt_prefix(scenario, db)
+        budget = max_tokens or input_token_budget(scenario_id)
         
-        # 1. Load base prompt template
-        system_prompt = self.load_prompt_template(scenario)
-        
-        # 2. Add business context from uploaded documents
-        context_sections = []
-        
-        if business_context:
-            context_sections.append(f"## Business Context\n{business_context}")
-        
-        # 3. Perform RAG search for relevant knowledge
-        if db:
-            # Search for top 3 most relevant context pieces
-            scenario_category = scenario.value if hasattr(scenario, 'value') else str(scenario)
+        relevant_knowledge = []
+        if db and knowledge_ids is not None:
+            relevant_knowledge = self.knowledge_service.get_entries_by_ids(knowledge_ids, db)
+        elif db:
+            # Search for the most relevant context pieces
             relevant_knowledge = self.knowledge_service.semantic_search(
                 user_message, 
-                limit=3, 
+                limit=RETRIEVAL_LIMIT, 
                 db=db,
-                category=f"{scenario_category}_BUSINESS_CONTEXT"
+                category=f"{scenario_id}_BUSINESS_CONTEXT"
             )
-            
-            if relevant_knowledge:
-                knowledge_context = "## Relevant Business Context (Top 3 Matches)\n"
-                for i, knowledge in enumerate(relevant_knowledge, 1):
-                    knowledge_context += f"\n**Source {i}: {knowledge.title}**\n{knowledge.content}\n"
-                    if i < len(relevant_knowledge):
-                        knowledge_context += "\n---\n"
-                context_sections.append(knowledge_context)
         
-        # 4. Add conversation history
-        if conversation_history:
-            history_context = self._format_conversation_history(conversation_history)
-            context_sections.append(f"## Previous Conversation\n{history_context}")
+        sections = [
+            PromptSection(name="system", items=[prefix.system_prompt]),
+            PromptSection(
+                name="business_context",
+                header="## Business Context\n",
+                items=[prefix.business_context] if prefix.business_context else [],
+                priority=3,
+                trim="truncate"
+            ),
+            PromptSection(
+                name="knowledge",
+                header="## Relevant Business Context (Top 3 Matches)\n",
+                items=[f"\n**Source {i}: {k.title}**\n{k.content}\n" for i, k in enumerate(relevant_knowledge, 1)],
+                separator="\n---\n",
+                priority=1,
+                trim="weakest"
+            ),
+            PromptSection(
+                name="summary",
+                header="## Conversation Summary\n",
+                items=[conversation_summary] if conversation_summary else [],
+                priority=2,
+                trim="truncate"
+            ),
+            PromptSection(
+                name="history",
+                header="## Previous Conversation\n",
+                items=self._conversation_lines(conversation_history or []),
+                priority=0,
+                trim="oldest"
+            ),
+            PromptSection(
+                name="query",
+                header="## Current Customer Query\nCustomer: ",
+                items=[user_message],
+                footer="\n\nPlease provide a helpful, accurate response based on the above context. If you don't have enough information to provide a complete answer, say so and suggest next steps.",
+                priority=4,
+                trim="truncate"
+            )
+        ]
         
-        # 5. Combine all context
-        full_context = "\n\n".join(context_sections) if context_sections else ""
+        sections, token_count, trimmed = prompt_assembler.fit(sections, budget)
         
-        # 6. Build final prompt
-        final_prompt = f"""{system_prompt}
-
-{full_context}
-
-## Current Customer Query
-Customer: {user_message}
-
-Please provide a helpful, accurate response based on the above context. If you don't have enough information to provide a complete answer, say so and suggest next steps."""
+        business = sections[1].items[0] if sections[1].items else None
+        if business != prefix.business_context:
+            # Only trimmed turns pay for a one-off prefix; the cached one stays intact
+            prefix = self.build_prompt_prefix(scenario, business, system_prompt=prefix.system_prompt, canonical=False)
         
-        return final_prompt
+        for section_name, removed in trimmed.items():
+            metrics.increment("prompt.trimmed_tokens", removed, scenario=scenario_id, section=section_name)
+        metrics.observe("prompt.input_tokens", token_count, scenario=scenario_id)
+        
+        return PromptParts(
+            prefix=prefix,
+            suffix=prompt_assembler.render(sections[2:]),
+            token_count=token_count,
+            trimmed_tokens=trimmed
+        )
     
-    def _load_file(self, file_path: Path) -> str:
-        """Load content from a file"""
-        try:
-            if file_path.exists():
-                return file_path.read_text(encoding='utf-8')
-            else:
-                return f"# Prompt file not found: {file_path}"
-        except Exception as e:
-            return f"# Error loading prompt: {str(e)}"
+    def get_prompt_prefix(
+        self,
+        scenario: Union[ScenarioType, str],
+        db: Optional[Session] = None
+    ) -> PromptPrefix:
+        """
+        Rendered stable prefix for a scenario, reused across turns and
+        conversations until the scenario's business context changes
+        """
+        scenario_id = scenario.value if hasattr(scenario, 'value') else str(scenario)
+        version = self.knowledge_service.get_knowledge_version(f"{scenario_id}_BUSINESS_CONTEXT") if db else 0
+        
+        system_prompt = self.get_system_prompt(scenario, db)
+        
+        prefix = prompt_prefixes.get(scenario_id, version)
+        if prefix is None or prefix.system_prompt != system_prompt:
+            # Also rebuilt when a template file or custom scenario prompt was edited
+            business_context = self.get_business_context_for_scenario(scenario, db) if db else None
+            prefix = self.build_prompt_prefix(scenario, business_context, system_prompt=system_prompt)
+            prompt_prefixes.put(scenario_id, version, prefix)
+        return prefix
+    
+    def build_prompt_prefix(
+        self,
+        scenario: Union[ScenarioType, str],
+        business_context: Optional[str] = None,
+        system_prompt: Optional[str] = None,
+        canonical: bool = True
+    ) -> PromptPrefix:
+        """System prompt plus business context: identical for every turn of a scenario"""
+        scenario_id = scenario.value if hasattr(scenario, 'value') else str(scenario)
+        system_prompt = system_prompt if system_prompt is not None else self.load_prompt_template(scenario)
+        sections = [system_prompt]
+        
+        if business_context:
+            sections.append(f"## Business Context\n{business_context}")
+        
+        text = "\n\n".join(sections)
+        return PromptPrefix(
+            scenario_id=scenario_id,
+            text=text,
+            fingerprint=hashlib.sha256(text.encode("utf-8")).hexdigest(),
+            system_prompt=system_prompt,
+            business_context=business_context,
+            canonical=canonical
+        )
     
     def _format_conversation_history(self, history: List[Dict[str, Any]]) -> str:
         """Format conversation history for prompt context"""
-        if not history:
-            return ""
-        
+        return "\n".join(self._conversation_lines(history))
+    
+    def _conversation_lines(self, history: List[Dict[str, Any]]) -> List[str]:
+        """One line per recent message, oldest first"""
         formatted_messages = []
-        for msg in history[-6:]:  # Limit to last 6 messages for context
+        # Older turns reach the prompt through the rolling summary
+        for msg in history[-conversation_summarizer.context_window:]:
             role = "Customer" if msg["role"] in ["USER", "user"] else "Assistant"
             formatted_messages.append(f"{role}: {msg['content']}")
         
-        return "\n".join(formatted_messages)
+        return formatted_messages
     
     def get_business_context_for_scenario(
         self, 
@@ -130,20 +268,31 @@ Please provide a helpful, accurate response based on the above context. If you d
             # Search for business context documents
             # Handle both ScenarioType enum and custom scenario strings
             scenario_id = scenario.value if hasattr(scenario, 'value') else str(scenario)
-            business_docs = self.knowledge_service.get_knowledge_by_category(
-                category=f"{scenario_id}_BUSINESS_CONTEXT",
-                db=db,
-                limit=3
-            )
+            category = f"{scenario_id}_BUSINESS_CONTEXT"
             
-            if business_docs:
-                context_parts = []
-                for doc in business_docs:
-                    context_parts.append(f"**{doc.title}**\n{doc.content}")
+            def render_context() -> Optional[str]:
+                business_docs = self.knowledge_service.get_knowledge_by_category(
+                    category=category,
+                    db=db,
+                    limit=3
+                )
+                
+                if business_docs:
+                    context_parts = []
+                    for doc in business_docs:
+                        context_parts.append(f"**{doc.title}**\n{doc.content}")
+                    
+                    return "\n\n".join(context_parts)
                 
-                return "\n\n".join(context_parts)
+                return None
             
-            return None
+            # Same for every turn in the scenario until its knowledge changes
+            return cache.get_or_set(
+                "business_context",
+                category,
+                factory=render_context,
+                tags=[knowledge_cache_tag(category)]
+            )
         except Exception:
             return None
     
@@ -156,9 +305,4 @@ Please provide a helpful, accurate response based on the above context. If you d
             "service/system.md"
         ]
         
-        validation_results = {}
-        for file_path in required_files:
-            full_path = self.prompts_dir / file_path
-            validation_results[file_path] = full_path.exists()
-        
-        return validation_results
\ No newline at end of file
+        return {file_path: prompt_templates.exists(file_path) for file_path in required_files}
\ No newline at end of file
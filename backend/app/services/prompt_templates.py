@@ -0,0 +1,192 @@
+"""
+In-memory registry of system prompt templates with file-change reload
+"""
+
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.conversation import ScenarioType
+from app.models.scenario import CustomScenario
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful customer support assistant."
+
+BASE_TEMPLATE = "base/system_base.md"
+
+# Template directory of each built-in scenario
+SCENARIO_TEMPLATE_DIRS = {
+    ScenarioType.ECOMMERCE: "ecommerce",
+    ScenarioType.SAAS: "saas",
+    ScenarioType.SERVICE_BUSINESS: "service"
+}
+
+
+class PromptTemplateRegistry:
+    """
+    Loads every prompt file once and composes each built-in scenario's
+    system prompt (base plus scenario template) up front, so lookups are
+    dictionary reads with no filesystem access. A background thread polls
+    file mtimes and swaps in a freshly compiled set when anything changes.
+
+    Custom scenario prompts come from the database and are cached with the
+    row's updated_at; after recheck_seconds only updated_at is re-read, and
+    the text is reloaded when it moved.
+    """
+
+    def __init__(
+        self,
+        prompts_dir: Path,
+        reload_interval: float = 2.0,
+        recheck_seconds: float = 30.0
+    ):
+        self.prompts_dir = prompts_dir
+        self.reload_interval = reload_interval
+        self.recheck_seconds = recheck_seconds
+        self._templates: Dict[str, str] = {}
+        self._compiled: Dict[ScenarioType, str] = {}
+        self._mtimes: Dict[str, float] = {}
+        # scenario id -> (updated_at, system prompt, checked at)
+        self._custom: Dict[str, Tuple[Any, str, float]] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._watcher: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def load(self):
+        """Read and compile every template; called on first use and on file changes"""
+        templates, mtimes = {}, {}
+        for path in sorted(self.prompts_dir.rglob("*.md")):
+            relative = path.relative_to(self.prompts_dir).as_posix()
+            try:
+                mtimes[relative] = path.stat().st_mtime
+                templates[relative] = path.read_text(encoding="utf-8")
+            except OSError as e:
+                logger.error(f"Could not load prompt template {path}: {e}")
+
+        base = templates.get(BASE_TEMPLATE, f"# Prompt file not found: {self.prompts_dir / BASE_TEMPLATE}")
+        compiled = {}
+        for scenario, directory in SCENARIO_TEMPLATE_DIRS.items():
+            name = f"{directory}/system.md"
+            scenario_prompt = templates.get(name, f"# Prompt file not found: {self.prompts_dir / name}")
+            compiled[scenario] = f"{base}\n\n{scenario_prompt}"
+
+        with self._lock:
+            self._templates = templates
+            self._compiled = compiled
+            self._mtimes = mtimes
+            self._loaded = True
+        metrics.increment("prompt_templates.loads")
+
+    def start(self):
+        """Load templates if needed and start watching them for changes"""
+        self._ensure_loaded()
+        with self._lock:
+            if self.reload_interval <= 0 or (self._watcher and self._watcher.is_alive()):
+                return
+            self._stopped.clear()
+            self._watcher = threading.Thread(target=self._watch, name="prompt-template-watcher", daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def template(self, name: str) -> Optional[str]:
+        """Raw template by path relative to the prompts directory, e.g. "saas/system.md" """
+        self._ensure_loaded()
+        return self._templates.get(name)
+
+    def system_prompt(self, scenario: Union[ScenarioType, str], db: Optional[Session] = None) -> str:
+        """System prompt for a built-in scenario, or a custom one when a session is given"""
+        self._ensure_loaded()
+        scenario_id = scenario.value if hasattr(scenario, "value") else str(scenario)
+        try:
+            return self._compiled[ScenarioType(scenario_id)]
+        except (ValueError, KeyError):
+            pass
+
+        if db is None:
+            return DEFAULT_SYSTEM_PROMPT
+        return self._custom_prompt(scenario_id, db)
+
+    def invalidate_custom(self, scenario_id: Optional[str] = None):
+        """Drop cached custom prompts after a scenario is edited or deleted"""
+        with self._lock:
+            if scenario_id:
+                self._custom.pop(scenario_id, None)
+            else:
+                self._custom.clear()
+
+    def exists(self, name: str) -> bool:
+        self._ensure_loaded()
+        return name in self._templates
+
+    def _custom_prompt(self, scenario_id: str, db: Session) -> str:
+        now = time.time()
+        cached = self._custom.get(scenario_id)
+        if cached and now - cached[2] < self.recheck_seconds:
+            return cached[1]
+
+        if cached:
+            row = (
+                db.query(CustomScenario.updated_at)
+                .filter(CustomScenario.id == scenario_id, CustomScenario.is_active == True)
+                .first()
+            )
+            if row is not None and row[0] == cached[0]:
+                with self._lock:
+                    self._custom[scenario_id] = (cached[0], cached[1], now)
+                return cached[1]
+
+        row = (
+            db.query(CustomScenario.system_prompt, CustomScenario.updated_at)
+            .filter(CustomScenario.id == scenario_id, CustomScenario.is_active == True)
+            .first()
+        )
+        if row is None:
+            self.invalidate_custom(scenario_id)
+            return DEFAULT_SYSTEM_PROMPT
+
+        system_prompt = row[0] or DEFAULT_SYSTEM_PROMPT
+        with self._lock:
+            self._custom[scenario_id] = (row[1], system_prompt, now)
+        metrics.increment("prompt_templates.custom_loads", scenario=scenario_id)
+        return system_prompt
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+            self.start()
+
+    def _watch(self):
+        while not self._stopped.wait(self.reload_interval):
+            try:
+                if self._changed():
+                    logger.info("Prompt templates changed on disk, reloading")
+                    self.load()
+            except Exception as e:
+                logger.error(f"Prompt template reload failed: {e}")
+
+    def _changed(self) -> bool:
+        current = {}
+        for path in self.prompts_dir.rglob("*.md"):
+            try:
+                current[path.relative_to(self.prompts_dir).as_posix()] = path.stat().st_mtime
+            except OSError:
+                continue
+        return current != self._mtimes
+
+
+# backend/prompts, next to the app package
+prompt_templates = PromptTemplateRegistry(
+    Path(__file__).resolve().parents[2] / "prompts",
+    reload_interval=settings.PROMPT_TEMPLATE_RELOAD_INTERVAL,
+    recheck_seconds=settings.PROMPT_CUSTOM_RECHECK_SECONDS
+)
@@ -0,0 +1,322 @@
+"""
+Exact and semantic response caches for repeated customer questions
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.cache import cache
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.knowledge_service import KnowledgeService, knowledge_cache_tag
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticAnswerIndex:
+    """
+    Bounded per-scenario store of payloads indexed by query embedding.
+    Each scenario keeps a ring buffer of unit vectors, so a lookup is one
+    matrix-vector product and the oldest entries are overwritten first.
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._matrices: Dict[str, np.ndarray] = {}
+        self._payloads: Dict[str, List[Optional[Dict[str, Any]]]] = {}
+        self._cursors: Dict[str, int] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, scenario_id: str, embedding: List[float], payload: Dict[str, Any]):
+        vector = self._unit(embedding)
+        if vector is None:
+            return
+
+        with self._lock:
+            matrix = self._matrices.get(scenario_id)
+            if matrix is None or matrix.shape[1] != len(vector):
+                # First entry, or the embedding model changed: start over
+                matrix = self._matrices[scenario_id] = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                self._payloads[scenario_id] = [None] * self.max_entries
+                self._cursors[scenario_id] = 0
+                self._counts[scenario_id] = 0
+
+            slot = self._cursors[scenario_id]
+            matrix[slot] = vector
+            self._payloads[scenario_id][slot] = payload
+            self._cursors[scenario_id] = (slot + 1) % self.max_entries
+            self._counts[scenario_id] = min(self._counts[scenario_id] + 1, self.max_entries)
+
+    def nearest(self, scenario_id: str, embedding: List[float]) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Most similar stored payload for the scenario and its cosine similarity"""
+        vector = self._unit(embedding)
+        if vector is None:
+            return None
+
+        with self._lock:
+            matrix = self._matrices.get(scenario_id)
+            count = self._counts.get(scenario_id, 0)
+            if matrix is None or count == 0 or matrix.shape[1] != len(vector):
+                return None
+
+            similarities = matrix[:count] @ vector
+            best = int(np.argmax(similarities))
+            return self._payloads[scenario_id][best], float(similarities[best])
+
+    def invalidate(self, scenario_id: Optional[str] = None):
+        with self._lock:
+            scenario_ids = [scenario_id] if scenario_id else list(self._matrices.keys())
+            for key in scenario_ids:
+                self._matrices.pop(key, None)
+                self._payloads.pop(key, None)
+                self._cursors.pop(key, None)
+                self._counts.pop(key, None)
+
+    def size(self, scenario_id: str) -> int:
+        return self._counts.get(scenario_id, 0)
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0:
+            return None
+        return vector / norm
+
+
+class SemanticResponseCache:
+    """
+    Serves a previous answer when a new first-turn question repeats one
+    already answered for the same scenario and prompt prefix, and the
+    scenario's knowledge has not changed since that answer was generated.
+    The prefix fingerprint is part of the key, so editing a scenario's
+    system prompt or business context retires its cached answers.
+
+    Exact repeats (after normalize) are checked in the shared cache, so an
+    answer generated on one worker is reused by all of them. Paraphrase
+    matching needs a sentence embedding model (embedding_model). The hashed
+    features knowledge search uses put everyday paraphrases far below the
+    threshold ("What is your refund policy?" vs "What's your refund
+    policy?" scores about 0.76), so without a model the cache is exact-match
+    only and skips the embedding index entirely.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.92,
+        max_entries: int = 1000,
+        ttl: int = 3600,
+        embedding_model: Optional[str] = None,
+        encoder: Optional[Any] = None
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.embedding_model = embedding_model
+        self.index = SemanticAnswerIndex(max_entries=max_entries)
+        self.knowledge_service = KnowledgeService()
+        self._encoder = encoder
+        self._encoder_failed = False
+        self._encoder_lock = threading.Lock()
+
+    @property
+    def encoder(self) -> Optional[Any]:
+        """Sentence encoder for paraphrase matching, or None for an exact-only cache"""
+        if self._encoder is None and self.embedding_model and not self._encoder_failed:
+            with self._encoder_lock:
+                if self._encoder is None and not self._encoder_failed:
+                    # Local import: the FAISS module imports the knowledge service too
+                    from app.services.faiss_embedding_service import create_encoder
+                    try:
+                        self._encoder = create_encoder(self.embedding_model)
+                    except Exception as e:
+                        self._encoder_failed = True
+                        logger.warning(f"Semantic cache is exact-match only: {e}")
+        return self._encoder
+
+    def lookup(self, scenario_id: str, message: str, prefix_fingerprint: str = "") -> Optional[Dict[str, Any]]:
+        """Cached answer payload for a repeated or paraphrased question, or None"""
+        start_time = time.perf_counter()
+        payload = self._lookup_exact(scenario_id, message, prefix_fingerprint)
+        if payload:
+            metrics.increment("semantic_cache.exact_hits", scenario=scenario_id)
+
+        encoder = self.encoder
+        match = None
+        if payload is None and encoder is not None:
+            match = self.index.nearest(scenario_id, encoder.generate_embedding(self.normalize(message)))
+
+        if match is not None:
+            candidate, similarity = match
+            if (
+                similarity >= self.threshold
+                and candidate["prefix_fingerprint"] == prefix_fingerprint
+                and time.time() - candidate["stored_at"] <= self.ttl
+                and candidate["knowledge_version"] == self._knowledge_version(scenario_id)
+            ):
+                payload = {**candidate, "similarity": similarity}
+                metrics.increment("semantic_cache.paraphrase_hits", scenario=scenario_id)
+
+        metrics.increment("semantic_cache.hits" if payload else "semantic_cache.misses", scenario=scenario_id)
+        metrics.observe("semantic_cache.lookup_ms", (time.perf_counter() - start_time) * 1000)
+        self._update_hit_rate(scenario_id)
+        return payload
+
+    def store(
+        self,
+        scenario_id: str,
+        message: str,
+        answer: str,
+        model: str,
+        knowledge_ids: Optional[List[int]] = None,
+        sources: Optional[List[str]] = None,
+        prefix_fingerprint: str = ""
+    ):
+        """Remember an answer for repeats (and, with a sentence model, paraphrases) of the question"""
+        payload = {
+            "question": message,
+            "answer": answer,
+            "knowledge_ids": list(knowledge_ids or []),
+            "sources": list(sources or []),
+            "model": model,
+            "prefix_fingerprint": prefix_fingerprint,
+            "knowledge_version": self._knowledge_version(scenario_id),
+            "stored_at": time.time()
+        }
+        cache.set(
+            "answer",
+            scenario_id,
+            prefix_fingerprint,
+            self.normalize(message),
+            value=payload,
+            ttl=settings.ANSWER_CACHE_TTL,
+            tags=[knowledge_cache_tag(f"{scenario_id}_BUSINESS_CONTEXT")]
+        )
+
+        encoder = self.encoder
+        if encoder is not None:
+            self.index.add(scenario_id, encoder.generate_embedding(self.normalize(message)), payload)
+
+    @staticmethod
+    def normalize(message: str) -> str:
+        """Case, whitespace and trailing punctuation don't change the question"""
+        return " ".join(message.lower().split()).rstrip("?!. ")
+
+    def _lookup_exact(self, scenario_id: str, message: str, prefix_fingerprint: str) -> Optional[Dict[str, Any]]:
+        try:
+            payload = cache.get("answer", scenario_id, prefix_fingerprint, self.normalize(message))
+        except Exception:
+            return None
+        return {**payload, "similarity": 1.0} if payload else None
+
+    def _knowledge_version(self, scenario_id: str) -> int:
+        return self.knowledge_service.get_knowledge_version(f"{scenario_id}_BUSINESS_CONTEXT")
+
+    def _update_hit_rate(self, scenario_id: str):
+        hits = metrics.get_counter("semantic_cache.hits", scenario=scenario_id)
+        misses = metrics.get_counter("semantic_cache.misses", scenario=scenario_id)
+        if hits + misses:
+            metrics.set_gauge("semantic_cache.hit_rate", hits / (hits + misses), scenario=scenario_id)
+
+
+class StaleAnswerStore:
+    """
+    Rolling per-scenario store of recent LLM answers that were grounded in
+    at least min_knowledge_hits retrieved entries, indexed by question
+    embedding. While the provider is failing or its
+    circuit is open, the closest past answer is served in place of a canned
+    apology, but only if it was grounded in the same knowledge entries the
+    failed turn retrieved and its question is at least threshold similar.
+    Questions that differ in one detail ("refund policy for electronics"
+    vs "... for clothing") share most features, so similarity alone is not
+    enough. When the turn's retrieval is unknown, the much stricter
+    ungrounded_threshold applies instead.
+
+    Lookups are local, so serving them adds no upstream load; knowledge
+    changes are not checked, which is why the answer is flagged as stale.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        ungrounded_threshold: float = 0.97,
+        max_entries: int = 500,
+        max_age: int = 86400,
+        min_knowledge_hits: int = 1
+    ):
+        self.threshold = threshold
+        self.ungrounded_threshold = ungrounded_threshold
+        self.max_age = max_age
+        self.min_knowledge_hits = min_knowledge_hits
+        self.index = SemanticAnswerIndex(max_entries=max_entries)
+        self.knowledge_service = KnowledgeService()
+
+    def remember(
+        self,
+        scenario_id: str,
+        message: str,
+        answer: str,
+        model: str,
+        knowledge_ids: Optional[List[int]] = None,
+        sources: Optional[List[str]] = None
+    ):
+        # An answer no knowledge backed is the model's guess; replaying it during an outage compounds the risk
+        if not answer or len(knowledge_ids or []) < self.min_knowledge_hits:
+            return
+        self.index.add(scenario_id, self._embed(message), {
+            "question": message,
+            "answer": answer,
+            "model": model,
+            "knowledge_ids": list(knowledge_ids or []),
+            "sources": list(sources or []),
+            "stored_at": time.time()
+        })
+
+    def lookup(
+        self,
+        scenario_id: str,
+        message: str,
+        knowledge_ids: Optional[List[int]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Closest recent answer for the question, with its similarity, or None.
+        knowledge_ids is what the failed turn retrieved; None if unknown.
+        """
+        match = self.index.nearest(scenario_id, self._embed(message))
+        payload = None
+        if match is not None:
+            candidate, similarity = match
+            if knowledge_ids is None:
+                grounded = similarity >= self.ungrounded_threshold
+            else:
+                grounded = (
+                    similarity >= self.threshold
+                    and sorted(candidate["knowledge_ids"]) == sorted(knowledge_ids)
+                )
+            if grounded and time.time() - candidate["stored_at"] <= self.max_age:
+                payload = {**candidate, "similarity": similarity}
+        metrics.increment("stale_answers.served" if payload else "stale_answers.missed", scenario=scenario_id)
+        return payload
+
+    def _embed(self, message: str) -> List[float]:
+        # Case, spacing and trailing punctuation would otherwise cost a repeat ~0.2 similarity
+        return self.knowledge_service.generate_embedding(SemanticResponseCache.normalize(message))
+
+
+semantic_response_cache = SemanticResponseCache(
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+    max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+    ttl=settings.SEMANTIC_CACHE_TTL,
+    embedding_model=settings.SEMANTIC_CACHE_EMBEDDING_MODEL or None
+)
+stale_answers = StaleAnswerStore(
+    threshold=settings.STALE_ANSWER_THRESHOLD,
+    ungrounded_threshold=settings.STALE_ANSWER_UNGROUNDED_THRESHOLD,
+    max_entries=settings.STALE_ANSWER_MAX_ENTRIES,
+    max_age=settings.STALE_ANSWER_MAX_AGE,
+    min_knowledge_hits=settings.STALE_ANSWER_MIN_KNOWLEDGE_HITS
+)
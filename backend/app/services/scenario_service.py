@@ -17,19 +17,40 @@ class ScenarioService:
                 "name": "E-Commerce Store",
                 "description": "Customer support for online retail business",
                 "icon": "ShoppingCart",
-                "color_gradient": "from-green-500 to-emerald-600"
+                "color_gradient": "from-green-500 to-emerald-600",
+                "sample_queries": [
+                    "Where is my order?",
+                    "How do I return an item?",
+                    "What payment methods do you accept?",
+                    "How long does shipping take?",
+                    "Is this product in stock?"
+                ]
             },
             ScenarioType.SAAS: {
                 "name": "SaaS Platform", 
                 "description": "Technical support for software services",
                 "icon": "Monitor",
-                "color_gradient": "from-blue-500 to-cyan-600"
+                "color_gradient": "from-blue-500 to-cyan-600",
+                "sample_queries": [
+                    "How do I reset my password?",
+                    "Why was I charged twice?",
+                    "How do I set up the API integration?",
+                    "Can I upgrade my plan?",
+                    "The dashboard is not loading"
+                ]
             },
             ScenarioType.SERVICE_BUSINESS: {
                 "name": "Service Business",
                 "description": "Support for service-based businesses",
                 "icon": "Briefcase", 
-                "color_gradient": "from-purple-500 to-pink-600"
+                "color_gradient": "from-purple-500 to-pink-600",
+                "sample_queries": [
+                    "Can I book an appointment for tomorrow?",
+                    "How much does the service cost?",
+                    "What are your opening hours?",
+                    "Can I reschedule my booking?",
+                    "Do you offer home visits?"
+                ]
             }
         }
     
@@ -115,27 +136,9 @@ class ScenarioService:
         db: Session
     ) -> str:
         """Get system prompt for a scenario (built-in or custom)"""
-        
-        # For built-in scenarios, use the prompt service
-        try:
-            scenario_type = ScenarioType(scenario_id)
-            from app.services.prompt_service import PromptService
-            prompt_service = PromptService()
-            return prompt_service.load_prompt_template(scenario_type)
-        except ValueError:
-            pass
-        
-        # For custom scenarios, get from database
-        custom_scenario = db.query(CustomScenario).filter(
-            CustomScenario.id == scenario_id,
-            CustomScenario.is_active == True
-        ).first()
-        
-        if custom_scenario:
-            return custom_scenario.system_prompt
-        
-        # Fallback to default
-        return "You are a helpful customer support assistant."
+        # Built-in templates are compiled in memory; custom prompts are cached by updated_at
+        from app.services.prompt_templates import prompt_templates
+        return prompt_templates.system_prompt(scenario_id, db)
     
     def is_valid_scenario(self, scenario_id: str, db: Session) -> bool:
         """Check if a scenario ID is valid (built-in or custom)"""
@@ -0,0 +1,201 @@
+"""
+Speculative retrieval from typing-indicator drafts
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.executors import BoundedExecutor
+from app.core.metrics import metrics
+from app.services.knowledge_service import KnowledgeService
+from app.services.prompt_service import RETRIEVAL_LIMIT
+
+logger = logging.getLogger(__name__)
+
+
+class SpeculativeRetriever:
+    """
+    Runs knowledge retrieval for a conversation's partial draft while the
+    customer is still typing. When the final message arrives and is close
+    enough to the last draft, the draft's ranked ids are handed to that
+    turn's prompt assembly, so retrieval latency is hidden behind typing
+    time. They are never written to the shared retrieval cache, where they
+    would answer other customers' searches for the final message.
+
+    Retrieval runs on its own bounded pool, as at most one background task
+    per conversation, so the WebSocket receive loop never waits for it.
+    One speculation is kept per conversation, in this process: WebSocket
+    connections stay on the worker that accepted them.
+    """
+
+    def __init__(
+        self,
+        similarity: float = 0.85,
+        ttl: int = 60,
+        min_chars: int = 12,
+        min_interval: float = 0.5,
+        max_conversations: int = 10000,
+        max_workers: int = 4
+    ):
+        self.similarity = similarity
+        self.ttl = ttl
+        self.min_chars = min_chars
+        self.min_interval = min_interval
+        self.max_conversations = max_conversations
+        self.knowledge_service = KnowledgeService()
+        self.executor = BoundedExecutor("speculative_retrieval", max_workers=max_workers)
+        self._speculations: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Background prefetches by conversation; only touched on the event loop
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # Bumped when a conversation's speculation is claimed or discarded, so a
+        # prefetch still running for an older draft does not store its result
+        self._epochs: "OrderedDict[str, int]" = OrderedDict()
+
+    def schedule_prefetch(self, conversation_id: str, scenario_id: str, draft: str) -> bool:
+        """
+        Start retrieval for a draft in the background, with its own session.
+        Call from the event loop; skipped while the conversation's previous
+        prefetch is still running.
+        """
+        running = self._tasks.get(conversation_id)
+        if running is not None and not running.done():
+            return False
+
+        epoch = self._epochs.get(conversation_id, 0)
+        task = asyncio.create_task(
+            self.executor.run(self._prefetch_in_session, conversation_id, scenario_id, draft, epoch)
+        )
+        self._tasks[conversation_id] = task
+        task.add_done_callback(lambda done: self._forget_task(conversation_id, done))
+        return True
+
+    def prefetch(self, conversation_id: str, scenario_id: str, draft: str, db: Session, epoch: Optional[int] = None) -> bool:
+        """Retrieve for a draft; skipped for short drafts and while the previous one is fresh (blocking)"""
+        draft = " ".join(draft.split())
+        if len(draft) < self.min_chars:
+            return False
+
+        with self._lock:
+            previous = self._speculations.get(conversation_id)
+        if previous and (previous["draft"] == draft or time.time() - previous["at"] < self.min_interval):
+            return False
+
+        category = f"{scenario_id}_BUSINESS_CONTEXT"
+        try:
+            start_time = time.perf_counter()
+            entries = self.knowledge_service.semantic_search(draft, limit=RETRIEVAL_LIMIT, db=db, category=category)
+            speculation = {
+                "draft": draft,
+                "category": category,
+                "embedding": self._unit(self.knowledge_service.generate_embedding(draft)),
+                "knowledge_ids": [entry.id for entry in entries],
+                "knowledge_version": self.knowledge_service.get_knowledge_version(category),
+                "at": time.time()
+            }
+        except Exception as e:
+            logger.warning(f"Speculative retrieval failed for conversation {conversation_id}: {e}")
+            return False
+
+        metrics.increment("speculative_retrieval.prefetches", scenario=scenario_id)
+        metrics.observe("speculative_retrieval.prefetch_ms", (time.perf_counter() - start_time) * 1000)
+        with self._lock:
+            if epoch is not None and self._epochs.get(conversation_id, 0) != epoch:
+                # The message was sent (or the connection closed) while retrieving
+                return False
+            self._speculations[conversation_id] = speculation
+            self._speculations.move_to_end(conversation_id)
+            while len(self._speculations) > self.max_conversations:
+                self._speculations.popitem(last=False)
+        return True
+
+    def claim(self, conversation_id: str, scenario_id: str, message: str) -> Optional[List[int]]:
+        """
+        Reuse the conversation's speculation for its final message when the
+        draft is similar enough, still fresh, and the knowledge is unchanged.
+        Returns the draft's ranked knowledge ids for this turn only, or None
+        when the turn must retrieve for itself.
+        """
+        with self._lock:
+            self._bump_epoch(conversation_id)
+            speculation = self._speculations.pop(conversation_id, None)
+        if speculation is None:
+            return None
+
+        category = f"{scenario_id}_BUSINESS_CONTEXT"
+        reused = None
+        try:
+            vector = self._unit(self.knowledge_service.generate_embedding(message))
+            if (
+                speculation["category"] == category
+                and time.time() - speculation["at"] <= self.ttl
+                and vector is not None
+                and speculation["embedding"] is not None
+                and float(speculation["embedding"] @ vector) >= self.similarity
+                and speculation["knowledge_version"] == self.knowledge_service.get_knowledge_version(category)
+            ):
+                reused = list(speculation["knowledge_ids"])
+        except Exception as e:
+            logger.warning(f"Could not reuse speculative retrieval for conversation {conversation_id}: {e}")
+
+        metrics.increment(
+            "speculative_retrieval.hits" if reused is not None else "speculative_retrieval.misses",
+            scenario=scenario_id
+        )
+        return reused
+
+    def discard(self, conversation_id: str):
+        task = self._tasks.pop(conversation_id, None)
+        if task is not None:
+            task.cancel()
+        with self._lock:
+            self._speculations.pop(conversation_id, None)
+            self._bump_epoch(conversation_id)
+
+    def _bump_epoch(self, conversation_id: str):
+        # Caller holds the lock. Forgetting the oldest epochs only lets a very late
+        # prefetch store a speculation, which claim still checks before reusing
+        self._epochs[conversation_id] = self._epochs.get(conversation_id, 0) + 1
+        self._epochs.move_to_end(conversation_id)
+        while len(self._epochs) > self.max_conversations:
+            self._epochs.popitem(last=False)
+
+    def _prefetch_in_session(self, conversation_id: str, scenario_id: str, draft: str, epoch: int) -> bool:
+        # The connection's session belongs to the event loop; a worker thread needs its own
+        db = SessionLocal()
+        try:
+            return self.prefetch(conversation_id, scenario_id, draft, db, epoch=epoch)
+        finally:
+            db.close()
+
+    def _forget_task(self, conversation_id: str, task: asyncio.Task):
+        if self._tasks.get(conversation_id) is task:
+            del self._tasks[conversation_id]
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Speculative retrieval failed for conversation {conversation_id}: {task.exception()}")
+
+    @staticmethod
+    def _unit(embedding) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0:
+            return None
+        return vector / norm
+
+
+speculative_retriever = SpeculativeRetriever(
+    similarity=settings.SPECULATIVE_RETRIEVAL_SIMILARITY,
+    ttl=settings.SPECULATIVE_RETRIEVAL_TTL,
+    min_chars=settings.SPECULATIVE_RETRIEVAL_MIN_CHARS,
+    min_interval=settings.SPECULATIVE_RETRIEVAL_MIN_INTERVAL,
+    max_workers=settings.SPECULATIVE_RETRIEVAL_MAX_WORKERS
+)
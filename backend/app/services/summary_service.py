@@ -0,0 +1,233 @@
+"""
+Rolling conversation summaries that keep prompt size bounded in long sessions
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import List, Optional, Set
+
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from app.core.admission import Priority
+from app.core.cache import cache
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.message import Message
+from app.models.conversation import MessageRole
+from app.services.llm_providers import get_llm_provider
+from app.services.prompt_assembler import token_counter
+from app.services.usage_accounting import usage_ledger
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationSummary(BaseModel):
+    text: str
+    message_count: int  # Messages folded into the summary so far
+    covered_until: datetime  # created_at of the newest summarized message
+    updated_at: datetime
+
+
+class ConversationSummarizer:
+    """
+    Maintains an incremental summary per conversation. Once enough messages
+    have aged out of the verbatim window, they are folded into the previous
+    summary in a background task, so a turn's prompt is a compact summary
+    plus the last few messages however long the conversation gets.
+
+    The summary is stored in the metadata of the newest message it covers,
+    so it lives as long as the conversation; the cache only saves the
+    lookup. A long backlog is folded max_chunk messages at a time.
+    """
+
+    METADATA_KEY = "conversation_summary"
+
+    def __init__(
+        self,
+        recent_messages: int = 6,
+        interval: int = 4,
+        max_words: int = 200,
+        ttl: int = 604800,
+        max_chunk: int = 20
+    ):
+        self.recent_messages = recent_messages
+        self.interval = interval
+        self.max_words = max_words
+        self.ttl = ttl
+        self.max_chunk = max(max_chunk, interval)
+        self._in_flight: Set[str] = set()
+        # Keeps background refreshes referenced until they finish
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def context_window(self) -> int:
+        """Most messages a prompt needs verbatim: the recent window plus those awaiting summarization"""
+        return self.recent_messages + self.interval
+
+    def get(self, conversation_id: str, db: Optional[Session] = None) -> Optional[ConversationSummary]:
+        """The conversation's summary: cached, else loaded from its messages when a session is given"""
+        try:
+            data = cache.get("conversation_summary", conversation_id)
+        except Exception as e:
+            logger.warning(f"Could not load summary for conversation {conversation_id}: {e}")
+            data = None
+        if data:
+            return ConversationSummary(**data)
+        if db is None:
+            return None
+
+        summary = self._load(conversation_id, db)
+        if summary:
+            self._cache(conversation_id, summary)
+        return summary
+
+    def schedule_refresh(self, conversation_id: str):
+        """Refresh the summary in the background; never blocks the turn"""
+        if conversation_id in self._in_flight:
+            return
+        self._in_flight.add(conversation_id)
+        task = asyncio.create_task(self._refresh_in_background(conversation_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh_in_background(self, conversation_id: str):
+        from app.core.database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            await self.refresh(conversation_id, db)
+        except Exception as e:
+            logger.error(f"Summary refresh failed for conversation {conversation_id}: {e}")
+            metrics.increment("summary.errors")
+        finally:
+            db.close()
+            self._in_flight.discard(conversation_id)
+
+    async def refresh(self, conversation_id: str, db: Session) -> Optional[ConversationSummary]:
+        """Fold messages older than the recent window into the summary, if enough have accumulated"""
+        summary = self.get(conversation_id, db)
+
+        pending = self._unsummarized(conversation_id, summary, db).count() - self.recent_messages
+        if pending < self.interval:
+            return summary
+
+        while pending > 0:
+            older = (
+                self._unsummarized(conversation_id, summary, db)
+                .order_by(Message.created_at.asc())
+                .limit(min(pending, self.max_chunk))
+                .all()
+            )
+            if not older:
+                break
+
+            with metrics.timer("summary.refresh_ms"):
+                text = await self._summarize(summary.text if summary else None, older)
+
+            summary = ConversationSummary(
+                text=text,
+                message_count=(summary.message_count if summary else 0) + len(older),
+                covered_until=older[-1].created_at,
+                updated_at=datetime.utcnow()
+            )
+            self._persist(older[-1], summary, db)
+            self._cache(conversation_id, summary)
+            metrics.increment("summary.refreshes")
+            pending -= len(older)
+        return summary
+
+    @staticmethod
+    def _unsummarized(conversation_id: str, summary: Optional[ConversationSummary], db: Session):
+        query = db.query(Message).filter(Message.conversation_id == conversation_id)
+        if summary:
+            query = query.filter(Message.created_at > summary.covered_until)
+        return query
+
+    def _persist(self, message: Message, summary: ConversationSummary, db: Session):
+        # Reassigned rather than mutated in place, so the JSON column is marked dirty
+        message.msg_metadata = {**(message.msg_metadata or {}), self.METADATA_KEY: summary.model_dump(mode="json")}
+        db.commit()
+
+    def _load(self, conversation_id: str, db: Session) -> Optional[ConversationSummary]:
+        """Newest summary stored on the conversation's messages"""
+        messages = (
+            db.query(Message)
+            .filter(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at.desc())
+            .yield_per(50)
+        )
+        for message in messages:
+            data = (message.msg_metadata or {}).get(self.METADATA_KEY)
+            if data:
+                return ConversationSummary(**data)
+        return None
+
+    def _cache(self, conversation_id: str, summary: ConversationSummary):
+        try:
+            cache.set(
+                "conversation_summary",
+                conversation_id,
+                value=summary.model_dump(mode="json"),
+                ttl=self.ttl
+            )
+        except Exception as e:
+            logger.warning(f"Could not cache summary for conversation {conversation_id}: {e}")
+
+    async def _summarize(self, previous: Optional[str], messages: List[Message]) -> str:
+        transcript = "\n".join(
+            f"{'Customer' if message.role == MessageRole.USER else 'Assistant'}: {message.content}"
+            for message in messages
+        )
+        prompt = f"""You maintain a running summary of a customer support conversation.
+
+## Summary So Far
+{previous or "(none)"}
+
+## New Messages
+{transcript}
+
+Rewrite the summary to include the new messages in at most {self.max_words} words. Keep the customer's goal, key facts (order numbers, products, account details), what has been tried or promised, and open questions. Reply with the summary only."""
+
+        # ai_service imports this module through prompt_service
+        from app.services.ai_service import llm_admission, llm_caller
+
+        try:
+            # Same admission and resilience policy as chat turns, behind live traffic
+            async with llm_admission.admit("conversation_summary", Priority.BATCH):
+                start_time = time.perf_counter()
+                result = await llm_caller.call(lambda: get_llm_provider().generate(prompt))
+            # Summaries are billed like turns; tracked as their own bucket
+            usage_ledger.record(
+                "conversation_summary", result.model, result.usage,
+                (time.perf_counter() - start_time) * 1000,
+                await token_counter.count_async(prompt), await token_counter.count_async(result.text)
+            )
+            text = result.text.strip()
+            if text:
+                return text
+        except Exception as e:
+            logger.warning(f"LLM summarization failed, using extractive summary: {e}")
+
+        return self._extractive_summary(previous, messages)
+
+    def _extractive_summary(self, previous: Optional[str], messages: List[Message]) -> str:
+        """First sentence of each customer message; keeps the summary bounded without the LLM"""
+        points = [
+            message.content.split(".")[0].strip()[:160]
+            for message in messages
+            if message.role == MessageRole.USER and message.content.strip()
+        ]
+        words = " ".join(filter(None, [previous, "Customer asked: " + "; ".join(points) if points else None])).split()
+        return " ".join(words[-self.max_words:])
+
+
+conversation_summarizer = ConversationSummarizer(
+    recent_messages=settings.CONVERSATION_RECENT_MESSAGES,
+    interval=settings.CONVERSATION_SUMMARY_INTERVAL,
+    max_words=settings.CONVERSATION_SUMMARY_MAX_WORDS,
+    ttl=settings.CONVERSATION_SUMMARY_TTL,
+    max_chunk=settings.CONVERSATION_SUMMARY_MAX_CHUNK
+)
@@ -0,0 +1,118 @@
+"""
+Concurrent preparation of a chat turn's prompt inputs
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Union
+
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.executors import BoundedExecutor
+from app.core.pipeline import Pipeline, Stage
+from app.models.conversation import ScenarioType
+from app.services.chat_service import ChatService
+from app.services.prompt_service import RETRIEVAL_LIMIT, PromptService
+
+logger = logging.getLogger(__name__)
+
+
+class TurnInputs(BaseModel):
+    summary: Optional[str] = None
+    context: List[Dict[str, Any]] = []
+    timings_ms: Dict[str, float] = {}
+
+
+class TurnPipeline:
+    """
+    Loads a turn's conversation history while the scenario's prompt prefix
+    (system prompt plus business context) and the message's knowledge
+    retrieval are computed in worker threads, each with its own session.
+    Prompt assembly then finds the prefix and ranking already cached, so
+    the time before the first LLM byte is the slowest of the three
+    instead of their sum.
+
+    Prefix and retrieval only warm caches: when one fails or times out,
+    prompt assembly (in its own worker thread) computes it or, if the stage
+    is still filling that cache key, waits at most the cache lock timeout
+    for it. Stages run on their own bounded pool, so stages that outlive
+    their timeout cannot starve the default pool prompt assembly uses.
+    """
+
+    def __init__(
+        self,
+        stage_timeouts: Optional[Dict[str, float]] = None,
+        prefetch: bool = True,
+        max_workers: int = 8
+    ):
+        self.stage_timeouts = stage_timeouts or {}
+        self.prefetch = prefetch
+        self.executor = BoundedExecutor("turn_prefetch", max_workers=max_workers)
+        self.prompt_service = PromptService()
+        stages = [Stage("history", self._history, timeout=self.stage_timeouts.get("history"))]
+        if prefetch:
+            stages += [
+                Stage("prefix", self._prefix, timeout=self.stage_timeouts.get("prefix"), fallback=None, blocking=True),
+                Stage("retrieval", self._retrieval, timeout=self.stage_timeouts.get("retrieval"), fallback=None, blocking=True)
+            ]
+        self.pipeline = Pipeline("chat_turn", stages, executor=self.executor)
+
+    async def prepare(
+        self,
+        conversation_id: str,
+        scenario_type: Union[ScenarioType, str],
+        message: str,
+        chat_service: ChatService,
+        knowledge_ids: Optional[List[int]] = None
+    ) -> TurnInputs:
+        """
+        Rolling summary and recent context for the turn, with prompt inputs
+        pre-computed. knowledge_ids is a ranking the turn already has (from
+        its typing draft), so retrieval is skipped.
+        """
+        result = await self.pipeline.run(
+            conversation_id=conversation_id,
+            scenario=scenario_type,
+            message=message,
+            chat_service=chat_service,
+            knowledge_ids=knowledge_ids
+        )
+        summary, context = result.results["history"]
+        return TurnInputs(summary=summary, context=context, timings_ms=result.timings_ms)
+
+    @staticmethod
+    async def _history(inputs: Dict[str, Any]):
+        # Uses the request's session, so it stays on the event loop
+        return await inputs["chat_service"].get_prompt_context(inputs["conversation_id"])
+
+    def _prefix(self, inputs: Dict[str, Any]):
+        db = SessionLocal()
+        try:
+            return self.prompt_service.get_prompt_prefix(inputs["scenario"], db)
+        finally:
+            db.close()
+
+    def _retrieval(self, inputs: Dict[str, Any]):
+        if inputs.get("knowledge_ids") is not None:
+            return inputs["knowledge_ids"]
+        scenario = inputs["scenario"]
+        scenario_id = scenario.value if hasattr(scenario, "value") else str(scenario)
+        db = SessionLocal()
+        try:
+            entries = self.prompt_service.knowledge_service.semantic_search(
+                inputs["message"],
+                limit=RETRIEVAL_LIMIT,
+                db=db,
+                category=f"{scenario_id}_BUSINESS_CONTEXT"
+            )
+            return [entry.id for entry in entries]
+        finally:
+            db.close()
+
+
+turn_pipeline = TurnPipeline(
+    stage_timeouts=settings.CHAT_PIPELINE_STAGE_TIMEOUTS,
+    prefetch=settings.CHAT_PIPELINE_PREFETCH,
+    max_workers=settings.CHAT_PIPELINE_MAX_WORKERS
+)
@@ -0,0 +1,120 @@
+"""
+Token, cost and latency accounting for LLM calls
+"""
+
+import threading
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.llm_providers import LLMUsage
+
+
+class TurnUsage(BaseModel):
+    """Token counts and cost of one generation"""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    total_tokens: int = 0
+    cost_usd: float = 0.0
+    source: str = "provider"  # "provider" when reported with the response, else "estimate"
+
+
+class UsageLedger:
+    """
+    Converts provider usage metadata into per-turn counts and cost, and
+    keeps per-scenario totals next to the matching metrics counters
+    (llm.prompt_tokens, llm.completion_tokens, llm.cached_tokens,
+    llm.cost_usd, llm.latency_ms, llm.calls). Averages per call show what
+    prompt-size changes actually save. When the provider reports nothing,
+    the prompt assembler's estimate and the tokenizer's count of the reply
+    stand in, and the call is counted in llm.estimated_usage.
+    """
+
+    def __init__(self, pricing: Optional[Dict[str, Dict[str, float]]] = None):
+        # model -> USD per 1K tokens for "prompt", "completion" and "cached" input
+        self.pricing = pricing or {}
+        self._totals: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        scenario_id: str,
+        model: str,
+        usage: Optional[LLMUsage],
+        latency_ms: float,
+        prompt_estimate: int,
+        completion_estimate: int
+    ) -> TurnUsage:
+        turn = self._turn_usage(usage, prompt_estimate, completion_estimate)
+        turn.cost_usd = self.cost(model, turn)
+
+        labels = {"scenario": scenario_id, "model": model}
+        metrics.increment("llm.calls", **labels)
+        metrics.increment("llm.prompt_tokens", turn.prompt_tokens, **labels)
+        metrics.increment("llm.completion_tokens", turn.completion_tokens, **labels)
+        metrics.increment("llm.cached_tokens", turn.cached_tokens, **labels)
+        metrics.increment("llm.cost_usd", turn.cost_usd, **labels)
+        metrics.increment("llm.latency_ms", latency_ms, **labels)
+        if turn.source != "provider":
+            metrics.increment("llm.estimated_usage", **labels)
+
+        with self._lock:
+            totals = self._totals.setdefault(scenario_id, {
+                "calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "cached_tokens": 0, "cost_usd": 0.0, "latency_ms": 0.0
+            })
+            totals["calls"] += 1
+            totals["prompt_tokens"] += turn.prompt_tokens
+            totals["completion_tokens"] += turn.completion_tokens
+            totals["cached_tokens"] += turn.cached_tokens
+            totals["cost_usd"] += turn.cost_usd
+            totals["latency_ms"] += latency_ms
+        return turn
+
+    def cost(self, model: str, turn: TurnUsage) -> float:
+        """USD for the turn; cached input is billed at its own rate when priced"""
+        rates = self.pricing.get(model)
+        if not rates:
+            return 0.0
+        uncached = turn.prompt_tokens - turn.cached_tokens
+        cost = (
+            uncached * rates.get("prompt", 0.0)
+            + turn.cached_tokens * rates.get("cached", rates.get("prompt", 0.0))
+            + turn.completion_tokens * rates.get("completion", 0.0)
+        ) / 1000
+        return round(cost, 8)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Per-scenario totals and per-call averages"""
+        with self._lock:
+            totals = {scenario: dict(values) for scenario, values in self._totals.items()}
+        for values in totals.values():
+            calls = values["calls"] or 1
+            values["cost_usd"] = round(values["cost_usd"], 6)
+            values["avg_prompt_tokens"] = round(values["prompt_tokens"] / calls, 1)
+            values["avg_completion_tokens"] = round(values["completion_tokens"] / calls, 1)
+            values["avg_cost_usd"] = round(values["cost_usd"] / calls, 8)
+            values["avg_latency_ms"] = round(values.pop("latency_ms") / calls, 1)
+        return totals
+
+    @staticmethod
+    def _turn_usage(usage: Optional[LLMUsage], prompt_estimate: int, completion_estimate: int) -> TurnUsage:
+        if usage is None or usage.prompt_tokens is None or usage.completion_tokens is None:
+            return TurnUsage(
+                prompt_tokens=prompt_estimate,
+                completion_tokens=completion_estimate,
+                total_tokens=prompt_estimate + completion_estimate,
+                source="estimate"
+            )
+        return TurnUsage(
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            cached_tokens=usage.cached_tokens or 0,
+            total_tokens=usage.total_tokens or usage.prompt_tokens + usage.completion_tokens
+        )
+
+
+usage_ledger = UsageLedger(pricing=settings.LLM_PRICING_PER_1K_TOKENS)
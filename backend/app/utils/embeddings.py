@@ -3,12 +3,17 @@ Utility functions for working with embeddings
 """
 
 import numpy as np
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Iterable, Iterator
 from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.cluster import KMeans
+import hashlib
+import math
 import pickle
 import os
 
+# Rows processed per block by the streaming corpus diagnostics
+DEFAULT_BLOCK_SIZE = 4096
+
 
 class EmbeddingUtils:
     """
@@ -194,26 +199,119 @@ class EmbeddingUtils:
         return results
 
     @staticmethod
-    def embedding_diversity_score(embeddings: List[List[float]]) -> float:
+    def _iter_blocks(
+        embeddings: Iterable[List[float]],
+        block_size: int = DEFAULT_BLOCK_SIZE
+    ) -> Iterator[List[List[float]]]:
+        """
+        Yield embeddings in lists of at most block_size rows so corpus-wide
+        diagnostics only ever materialize one block as a NumPy array
+        """
+        block = []
+        for embedding in embeddings:
+            block.append(embedding)
+            if len(block) >= block_size:
+                yield block
+                block = []
+        if block:
+            yield block
+
+    @staticmethod
+    def _unit_rows(block: np.ndarray) -> np.ndarray:
+        """L2-normalize rows, leaving zero vectors at zero (matches sklearn)"""
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        norms = np.where(norms == 0, 1, norms)
+        return block / norms
+
+    @staticmethod
+    def embedding_diversity_score(
+        embeddings: Iterable[List[float]],
+        block_size: int = DEFAULT_BLOCK_SIZE
+    ) -> float:
         """
         Calculate a diversity score for a set of embeddings
         Higher score means more diverse embeddings
+
+        The mean pairwise cosine similarity is computed exactly without the
+        n x n matrix: for unit vectors u_i, the sum over pairs i != j of
+        u_i . u_j equals ||sum(u)||^2 - sum(||u_i||^2). Memory is bounded by
+        one block of rows.
         """
-        if len(embeddings) < 2:
+        vector_sum = None
+        squared_norms = 0.0
+        count = 0
+
+        for block in EmbeddingUtils._iter_blocks(embeddings, block_size):
+            unit = EmbeddingUtils._unit_rows(np.asarray(block, dtype=np.float64))
+            block_sum = unit.sum(axis=0)
+            vector_sum = block_sum if vector_sum is None else vector_sum + block_sum
+            squared_norms += float(np.einsum("ij,ij->", unit, unit))
+            count += len(block)
+
+        if count < 2:
             return 0.0
-        
-        # Calculate pairwise similarities
-        sim_matrix = EmbeddingUtils.cosine_similarity_matrix(embeddings)
-        
-        # Get upper triangle (excluding diagonal)
-        upper_triangle = sim_matrix[np.triu_indices_from(sim_matrix, k=1)]
-        
+
+        pair_similarity_sum = (float(np.dot(vector_sum, vector_sum)) - squared_norms) / 2
+        avg_similarity = pair_similarity_sum / (count * (count - 1) / 2)
+
         # Diversity is inverse of average similarity
-        avg_similarity = np.mean(upper_triangle)
         diversity_score = 1.0 - avg_similarity
-        
+
         return float(diversity_score)
 
+    @staticmethod
+    def estimate_diversity_score(
+        embeddings: List[List[float]],
+        sample_pairs: int = 10000,
+        confidence: float = 0.95,
+        random_state: int = 42
+    ) -> Dict[str, Any]:
+        """
+        Estimate the diversity score from randomly sampled pairs
+        Returns the point estimate with a normal-approximation confidence interval
+        """
+        n = len(embeddings)
+        if n < 2:
+            return {"score": 0.0, "ci_low": 0.0, "ci_high": 0.0, "sampled_pairs": 0, "method": "sampled"}
+
+        rng = np.random.default_rng(random_state)
+        first = rng.integers(0, n, size=sample_pairs)
+        # Offset in [1, n) guarantees the second index differs from the first
+        second = (first + rng.integers(1, n, size=sample_pairs)) % n
+
+        similarities = np.empty(sample_pairs, dtype=np.float64)
+        chunk = 4096
+        for start in range(0, sample_pairs, chunk):
+            stop = min(start + chunk, sample_pairs)
+            a = EmbeddingUtils._unit_rows(np.asarray([embeddings[i] for i in first[start:stop]], dtype=np.float64))
+            b = EmbeddingUtils._unit_rows(np.asarray([embeddings[j] for j in second[start:stop]], dtype=np.float64))
+            similarities[start:stop] = np.einsum("ij,ij->i", a, b)
+
+        mean_similarity = float(similarities.mean())
+        std_error = float(similarities.std(ddof=1)) / math.sqrt(sample_pairs) if sample_pairs > 1 else 0.0
+        z = EmbeddingUtils._normal_quantile(0.5 + confidence / 2)
+
+        return {
+            "score": 1.0 - mean_similarity,
+            "ci_low": 1.0 - (mean_similarity + z * std_error),
+            "ci_high": 1.0 - (mean_similarity - z * std_error),
+            "confidence": confidence,
+            "sampled_pairs": int(sample_pairs),
+            "method": "sampled"
+        }
+
+    @staticmethod
+    def _normal_quantile(p: float) -> float:
+        """Inverse standard normal CDF by bisection on math.erf"""
+        low, high = -10.0, 10.0
+        for _ in range(100):
+            mid = (low + high) / 2
+            if 0.5 * (1 + math.erf(mid / math.sqrt(2))) < p:
+                low = mid
+            else:
+                high = mid
+        return (low + high) / 2
+
     @staticmethod
     def find_outliers(
         embeddings: List[List[float]], 
@@ -245,46 +343,81 @@ class EmbeddingUtils:
         return outlier_indices.tolist()
 
     @staticmethod
-    def embedding_quality_check(embeddings: List[List[float]]) -> Dict[str, Any]:
+    def embedding_quality_check(
+        embeddings: Iterable[List[float]],
+        block_size: int = DEFAULT_BLOCK_SIZE
+    ) -> Dict[str, Any]:
         """
         Perform quality checks on embeddings
+
+        Rows are scanned in blocks and duplicates are found by hashing each
+        row's bytes, so memory is bounded by one block plus a 16-byte digest
+        per unique row instead of a sorted copy of the whole matrix.
         """
-        if not embeddings:
+        total = 0
+        nan_rows = 0
+        inf_rows = 0
+        zero_vectors = 0
+        expected_dim = None
+        inconsistent_dims = False
+        seen_digests = set()
+        duplicates = 0
+
+        for block in EmbeddingUtils._iter_blocks(embeddings, block_size):
+            total += len(block)
+
+            # Check dimensionality consistency
+            if expected_dim is None:
+                expected_dim = len(block[0])
+            consistent = [row for row in block if len(row) == expected_dim]
+            if len(consistent) != len(block):
+                inconsistent_dims = True
+            if not consistent:
+                continue
+
+            # Adding 0.0 folds -0.0 into 0.0 so equal vectors hash equally
+            block_array = np.asarray(consistent, dtype=np.float64) + 0.0
+
+            # Check for NaN or infinite values
+            nan_rows += int(np.isnan(block_array).any(axis=1).sum())
+            inf_rows += int(np.isinf(block_array).any(axis=1).sum())
+
+            # Check for zero vectors
+            zero_vectors += int(np.sum(np.linalg.norm(block_array, axis=1) == 0))
+
+            # Check for duplicates
+            for row in block_array:
+                digest = hashlib.blake2b(row.tobytes(), digest_size=16).digest()
+                if digest in seen_digests:
+                    duplicates += 1
+                else:
+                    seen_digests.add(digest)
+
+        if total == 0:
             return {"status": "empty", "issues": ["No embeddings provided"]}
-        
-        embeddings_array = np.array(embeddings)
+
         issues = []
-        
-        # Check for NaN or infinite values
-        if np.isnan(embeddings_array).any():
+        if nan_rows > 0:
             issues.append("Contains NaN values")
-        
-        if np.isinf(embeddings_array).any():
+
+        if inf_rows > 0:
             issues.append("Contains infinite values")
-        
-        # Check for zero vectors
-        norms = np.linalg.norm(embeddings_array, axis=1)
-        zero_vectors = np.sum(norms == 0)
+
         if zero_vectors > 0:
             issues.append(f"Contains {zero_vectors} zero vectors")
-        
-        # Check dimensionality consistency
-        dimensions = [len(emb) for emb in embeddings]
-        if len(set(dimensions)) > 1:
+
+        if inconsistent_dims:
             issues.append("Inconsistent embedding dimensions")
-        
-        # Check for duplicates
-        unique_embeddings = np.unique(embeddings_array, axis=0)
-        duplicates = len(embeddings) - len(unique_embeddings)
+
         if duplicates > 0:
             issues.append(f"Contains {duplicates} duplicate embeddings")
-        
+
         status = "healthy" if not issues else "issues_found"
-        
+
         return {
             "status": status,
             "issues": issues,
-            "total_embeddings": len(embeddings),
-            "unique_embeddings": len(unique_embeddings),
-            "dimensions": embeddings_array.shape[1] if embeddings else 0
-        }
\ No newline at end of file
+            "total_embeddings": total,
+            "unique_embeddings": len(seen_digests),
+            "dimensions": expected_dim or 0
+        }
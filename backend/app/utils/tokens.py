@@ -0,0 +1,193 @@
+"""
+Token counting for prompt budgeting
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_PIECE_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+class HeuristicTokenizer:
+    """
+    Offline approximation of a subword tokenizer: each punctuation mark is
+    one token, short words are one token, and longer words cost about one
+    token per four characters. Needs no model files or network calls, but
+    its error against a real tokenizer is unmeasured, so prompt budgets
+    built on it should keep some headroom.
+    """
+
+    name = "heuristic"
+
+    def count(self, text: str) -> int:
+        total = 0
+        for piece in _PIECE_PATTERN.findall(text):
+            total += 1 if len(piece) <= 6 else math.ceil(len(piece) / 4)
+        return total
+
+
+class HuggingFaceTokenizer:
+    """Exact counts from a Hugging Face tokenizer (transformers ships with sentence-transformers)"""
+
+    def __init__(self, model_name: str):
+        from transformers import AutoTokenizer
+
+        self.name = f"hf:{model_name}"
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        # Counting only; silence the max-length warning for long prompts
+        self.tokenizer.model_max_length = 10 ** 9
+
+    def count(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+
+class TiktokenTokenizer:
+    """Counts from a tiktoken encoding, if tiktoken is installed"""
+
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        import tiktoken
+
+        self.name = f"tiktoken:{encoding_name}"
+        self.encoding = tiktoken.get_encoding(encoding_name)
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+
+class GeminiTokenizer:
+    """
+    Provider-exact counts via the count_tokens API. Each text not yet in the
+    TokenCounter's memo is a network round trip. When a call fails, the
+    heuristic count is used instead, and calls are skipped for retry_after
+    seconds so an outage does not add a timeout to every turn.
+    """
+
+    # Counts are network calls; TokenCounter.truncate searches with local counts instead
+    remote = True
+
+    def __init__(self, model_name: str = "gemini-2.5-flash", timeout: float = 5.0, retry_after: float = 60.0):
+        import google.generativeai as genai
+
+        self.name = f"gemini:{model_name}"
+        self.model = genai.GenerativeModel(model_name)
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.fallback = HeuristicTokenizer()
+        self._failed_until = 0.0
+
+    def count(self, text: str) -> int:
+        if time.monotonic() < self._failed_until:
+            return self.fallback.count(text)
+        try:
+            return int(self.model.count_tokens(text, request_options={"timeout": self.timeout}).total_tokens)
+        except Exception as e:
+            logger.warning(f"count_tokens failed, using heuristic counts for {self.retry_after:.0f}s: {e}")
+            self._failed_until = time.monotonic() + self.retry_after
+            return self.fallback.count(text)
+
+
+def create_tokenizer(spec: str):
+    """
+    Build a tokenizer from a spec: "heuristic", "hf:<model name>",
+    "tiktoken:<encoding>" or "gemini:<model>". Falls back to the heuristic
+    tokenizer if the requested one cannot be loaded.
+    """
+    kind, _, arg = (spec or "heuristic").partition(":")
+    try:
+        if kind == "hf":
+            return HuggingFaceTokenizer(arg)
+        if kind == "tiktoken":
+            return TiktokenTokenizer(arg or "cl100k_base")
+        if kind == "gemini":
+            return GeminiTokenizer(arg or "gemini-2.5-flash")
+        if kind != "heuristic":
+            logger.warning(f"Unknown tokenizer '{spec}', using heuristic counts")
+    except Exception as e:
+        logger.warning(f"Could not load tokenizer '{spec}', using heuristic counts: {e}")
+    return HeuristicTokenizer()
+
+
+class TokenCounter:
+    """
+    Memoized token counts. Prompt pieces such as the system prompt, business
+    context and knowledge chunks repeat across turns, so counts are cached
+    by content digest and most turns only tokenize the new message.
+    The tokenizer is loaded on first use.
+    """
+
+    def __init__(self, spec: str = "heuristic", max_entries: int = 50000, tokenizer=None):
+        self.spec = spec
+        self.max_entries = max_entries
+        self._tokenizer = tokenizer
+        self._counts: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            with self._lock:
+                if self._tokenizer is None:
+                    self._tokenizer = create_tokenizer(self.spec)
+        return self._tokenizer
+
+    def count(self, text: Optional[str]) -> int:
+        if not text:
+            return 0
+
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached is not None:
+                self._counts.move_to_end(key)
+                return cached
+
+        value = self.tokenizer.count(text)
+        with self._lock:
+            self._counts[key] = value
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return value
+
+    async def count_async(self, text: Optional[str]) -> int:
+        """count() for callers on the event loop; remote tokenizers run in a worker thread"""
+        if getattr(self.tokenizer, "remote", False):
+            return await asyncio.to_thread(self.count, text)
+        return self.count(text)
+
+    def truncate(self, text: str, max_tokens: int, marker: str = " …[truncated]") -> str:
+        """Longest prefix of text (cut at a word boundary) that fits in max_tokens"""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+
+        budget = max(0, max_tokens - self.count(marker))
+        count = self.tokenizer.count
+        if getattr(self.tokenizer, "remote", False):
+            # A round trip per probe is too slow: search with local counts scaled to the exact total
+            local = HeuristicTokenizer()
+            scale = self.count(text) / max(1, local.count(text))
+            count = lambda piece: math.ceil(local.count(piece) * scale)
+
+        low, high = 0, len(text)
+        # Binary search on character length; counts are monotonic in prefix length
+        while low < high:
+            mid = (low + high + 1) // 2
+            if count(text[:mid]) <= budget:
+                low = mid
+            else:
+                high = mid - 1
+
+        cut = text[:low]
+        if " " in cut:
+            cut = cut[:cut.rfind(" ")]
+        return cut.rstrip() + marker
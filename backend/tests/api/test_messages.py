@@ -0,0 +1,138 @@
+"""
+Tests for the message endpoints persisting the assistant message with its usage
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.v1.endpoints import messages as message_endpoints
+from app.core.database import Base, get_db
+from app.models.conversation import Conversation, ConversationStatus, MessageRole
+from app.models.message import Message
+from app.services.ai_service import AIResponse, AIStreamChunk
+from app.services.container import get_ai_service
+from app.services.turn_pipeline import TurnInputs
+
+engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+RESPONSE = AIResponse(
+    content="Your order ships tomorrow.",
+    model="test-model",
+    tokens_used=130,
+    prompt_tokens=120,
+    completion_tokens=10,
+    cost_usd=0.0004,
+    usage_source="provider",
+    confidence=0.9
+)
+
+
+HANDOFF = AIResponse(
+    content="A support agent will follow up with you here.",
+    model="intent-router",
+    tokens_used=0,
+    intent="human_handoff"
+)
+
+
+class FakeAIService:
+    response = RESPONSE
+
+    async def generate_response(self, **kwargs):
+        return self.response
+
+    async def stream_response(self, **kwargs):
+        yield AIStreamChunk(sequence=0, delta=self.response.content)
+        yield AIStreamChunk(sequence=1, done=True, response=self.response)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def prepare(*args, **kwargs):
+        return TurnInputs()
+
+    monkeypatch.setattr(message_endpoints.turn_pipeline, "prepare", prepare)
+    monkeypatch.setattr(message_endpoints.conversation_summarizer, "schedule_refresh", lambda conversation_id: None)
+    monkeypatch.setattr(message_endpoints, "SessionLocal", TestingSessionLocal)
+
+    app = FastAPI()
+    app.include_router(message_endpoints.router, prefix="/conversations")
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_ai_service] = FakeAIService
+
+    db = TestingSessionLocal()
+    db.add(Conversation(id="conv-1", scenario_type="ECOMMERCE", title="Order status"))
+    db.commit()
+    db.close()
+    yield TestClient(app)
+
+    db = TestingSessionLocal()
+    db.query(Message).delete()
+    db.query(Conversation).delete()
+    db.commit()
+    db.close()
+
+
+def assistant_metadata():
+    db = TestingSessionLocal()
+    try:
+        message = db.query(Message).filter(Message.role == MessageRole.ASSISTANT).one()
+        return message.msg_metadata, message.tokens_used
+    finally:
+        db.close()
+
+
+def assert_usage_persisted():
+    metadata, tokens_used = assistant_metadata()
+    assert tokens_used == 130
+    assert metadata["prompt_tokens"] == 120
+    assert metadata["completion_tokens"] == 10
+    assert metadata["cost_usd"] == 0.0004
+    assert metadata["usage_source"] == "provider"
+
+
+def test_sent_message_stores_its_usage(client):
+    """The REST endpoint saves the token split and cost with the assistant message"""
+    response = client.post("/conversations/conv-1/messages", json={"content": "Where is my order?"})
+
+    assert response.status_code == 200
+    assert response.json()["msg_metadata"]["completion_tokens"] == 10
+    assert_usage_persisted()
+
+
+def test_streamed_message_stores_its_usage(client):
+    """The SSE endpoint saves the same usage once the stream completes"""
+    response = client.post("/conversations/conv-1/messages/stream", json={"content": "Where is my order?"})
+
+    assert response.status_code == 200
+    assert "event: complete" in response.text
+    assert_usage_persisted()
+
+
+@pytest.mark.parametrize("path", ["messages", "messages/stream"])
+def test_hand_off_request_escalates_the_conversation(client, monkeypatch, path):
+    """A routed hand-off reply marks the conversation for a human agent, as the reply promises"""
+    monkeypatch.setattr(FakeAIService, "response", HANDOFF)
+
+    response = client.post(f"/conversations/conv-1/{path}", json={"content": "talk to a human"})
+
+    assert response.status_code == 200
+    db = TestingSessionLocal()
+    try:
+        assert db.query(Conversation).one().status == ConversationStatus.ESCALATED
+    finally:
+        db.close()
@@ -0,0 +1,84 @@
+"""
+Tests for LLM admission control: priorities, per-scenario fairness and queue limits
+"""
+
+import asyncio
+
+import pytest
+
+from app.core.admission import AdmissionController, AdmissionRejected, Priority
+
+
+async def run_in_order(controller, requests):
+    """Queue requests behind one held slot and return the order they were admitted in"""
+    admitted = []
+    release = asyncio.Event()
+
+    async def holder():
+        async with controller.admit("warmup"):
+            await release.wait()
+
+    async def request(scenario_id, priority):
+        async with controller.admit(scenario_id, priority):
+            admitted.append((scenario_id, priority))
+
+    hold = asyncio.create_task(holder())
+    await asyncio.sleep(0)
+    tasks = []
+    for scenario_id, priority in requests:
+        tasks.append(asyncio.create_task(request(scenario_id, priority)))
+        await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(hold, *tasks)
+    return admitted
+
+
+def test_interactive_requests_go_first_and_scenarios_take_turns():
+    """Test that interactive requests are admitted first and scenarios alternate within a priority"""
+    controller = AdmissionController(max_concurrent=1)
+    admitted = asyncio.run(run_in_order(controller, [
+        ("A", Priority.STANDARD),
+        ("A", Priority.STANDARD),
+        ("B", Priority.STANDARD),
+        ("C", Priority.INTERACTIVE)
+    ]))
+
+    assert admitted == [
+        ("C", Priority.INTERACTIVE),
+        ("A", Priority.STANDARD),
+        ("B", Priority.STANDARD),
+        ("A", Priority.STANDARD)
+    ]
+    assert controller.in_flight == 0 and controller.queued == 0
+
+
+def test_rejects_when_queue_is_full():
+    """Test that a request is rejected instead of queued when the queue is full"""
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=0)
+        async with controller.admit("A"):
+            with pytest.raises(AdmissionRejected):
+                async with controller.admit("B"):
+                    pass
+
+    asyncio.run(scenario())
+
+
+def test_reports_queue_position_and_times_out():
+    """Test that a queued request hears its position and is rejected after the queue timeout"""
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, queue_timeout=0.05, position_interval=0.01)
+        positions = []
+
+        async def on_position(position):
+            positions.append(position)
+
+        async with controller.admit("A"):
+            with pytest.raises(AdmissionRejected):
+                async with controller.admit("B", on_position=on_position):
+                    pass
+        return controller, positions
+
+    controller, positions = asyncio.run(scenario())
+    assert positions == [1]
+    assert controller.queued == 0 and controller.in_flight == 0
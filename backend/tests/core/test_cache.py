@@ -0,0 +1,126 @@
+"""
+Tests for the shared cache service
+"""
+
+import asyncio
+import threading
+import time
+
+from app.core.cache import CacheService, MemoryCacheBackend
+
+
+def make_cache(**kwargs):
+    return CacheService(redis_url=None, default_ttl=60, max_local_entries=3, **kwargs)
+
+
+def test_memory_backend_evicts_least_recently_used():
+    """Test that the local backend evicts the least recently read entry"""
+    backend = MemoryCacheBackend(max_entries=2)
+    backend.set("a", "1")
+    backend.set("b", "2")
+    backend.get_many(["a"])
+    backend.set("c", "3")
+
+    assert backend.get_many(["a", "b", "c"]) == ["1", None, "3"]
+
+
+def test_tag_invalidation_makes_entries_stale():
+    """Test that bumping a tag only drops the entries stored under it"""
+    cache = make_cache()
+    cache.set("answer", "ECOMMERCE", "track my order", value={"answer": "x"}, tags=["knowledge:A"])
+    cache.set("answer", "SAAS", "reset password", value={"answer": "y"}, tags=["knowledge:B"])
+
+    cache.invalidate_tags("knowledge:A")
+
+    assert cache.get("answer", "ECOMMERCE", "track my order") is None
+    assert cache.get("answer", "SAAS", "reset password") == {"answer": "y"}
+
+
+def test_get_or_set_computes_once_for_concurrent_misses():
+    """Test that concurrent misses on one key share a single factory call"""
+    cache = make_cache()
+    calls = []
+
+    def factory():
+        calls.append(1)
+        time.sleep(0.05)
+        return [1, 2, 3]
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_set("retrieval", "q", factory=factory)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [[1, 2, 3]] * 8
+
+
+def test_memory_backend_delete_if_only_removes_matching_value():
+    """Test that compare-and-delete leaves a lock held by another token alone"""
+    backend = MemoryCacheBackend()
+    backend.add("k:lock", "owner", ttl=10)
+
+    assert backend.delete_if("k:lock", "someone-else") is False
+    assert backend.get_many(["k:lock"]) == ["owner"]
+    assert backend.delete_if("k:lock", "owner") is True
+    assert backend.get_many(["k:lock"]) == [None]
+
+
+def test_get_or_set_does_not_release_a_lock_it_does_not_own():
+    """Test that a caller that timed out waiting computes without deleting the holder's lock"""
+    cache = make_cache(lock_timeout=0.1)
+    key = cache.make_key("retrieval", "q")
+    cache.local.add(f"{key}:lock", "other-worker", 10)
+
+    value = cache.get_or_set("retrieval", "q", factory=lambda: [4])
+
+    assert value == [4]
+    assert cache.local.get_many([f"{key}:lock"]) == ["other-worker"]
+
+
+def test_get_or_set_releases_its_own_lock():
+    """Test that the caller that filled the key removes its lock"""
+    cache = make_cache()
+    key = cache.make_key("retrieval", "q")
+
+    cache.get_or_set("retrieval", "q", factory=lambda: [1])
+
+    assert cache.local.get_many([f"{key}:lock"]) == [None]
+
+
+def test_aget_or_set_keeps_the_event_loop_free_while_waiting():
+    """Test that a fill waiting on another worker's lock does not block the loop"""
+    cache = make_cache(lock_timeout=0.3)
+    key = cache.make_key("retrieval", "q")
+    cache.local.add(f"{key}:lock", "other-worker", 10)
+    ticks = []
+
+    async def tick():
+        for _ in range(5):
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.02)
+
+    async def main():
+        fill = asyncio.create_task(cache.aget_or_set("retrieval", "q", factory=lambda: [7]))
+        await tick()
+        return await fill
+
+    assert asyncio.run(main()) == [7]
+    assert ticks[-1] - ticks[0] < 0.25
+
+
+def test_bumped_tag_versions_key_a_change_log():
+    """Test that bump_tag returns successive versions and get_many reads several keys at once"""
+    cache = make_cache()
+
+    first, second = cache.bump_tag("changes"), cache.bump_tag("changes")
+    cache.set("change", first, value=7)
+    cache.set("change", second, value=9)
+
+    assert second == first + 1 == cache.tag_version("changes")
+    assert cache.get_many("change", [(first,), (second,), (second + 1,)]) == [7, 9, None]
@@ -0,0 +1,43 @@
+"""
+Tests for bounded thread pools for blocking calls
+"""
+
+import asyncio
+import time
+
+from app.core.executors import BoundedExecutor
+from app.core.metrics import metrics
+
+
+def test_work_beyond_max_workers_queues_and_is_counted():
+    """Test that calls beyond max_workers wait for a worker and are counted as saturation"""
+    executor = BoundedExecutor("test-bounded", max_workers=2)
+
+    async def scenario():
+        return await asyncio.gather(*(executor.run(time.sleep, 0.05) for _ in range(4)))
+
+    start = time.perf_counter()
+    asyncio.run(scenario())
+    elapsed = time.perf_counter() - start
+
+    assert elapsed >= 0.1  # Two waves of two
+    assert metrics.get_counter("executor.saturated", executor="test-bounded") == 2
+    assert executor.stats()["active"] == 0 and executor.stats()["pending"] == 0
+    executor.shutdown()
+
+
+def test_cancelled_call_leaves_the_queue():
+    """Test that a queued call cancelled before it starts is dropped from the pending count"""
+    executor = BoundedExecutor("test-cancel", max_workers=1)
+
+    async def scenario():
+        busy = asyncio.ensure_future(executor.run(time.sleep, 0.05))
+        waiting = asyncio.ensure_future(executor.run(time.sleep, 0.05))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await busy
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    assert executor.pending == 0 and executor.active == 0
+    executor.shutdown()
@@ -0,0 +1,34 @@
+"""
+Tests for the in-process metrics registry
+"""
+
+from app.core.metrics import MetricsRegistry
+
+
+def test_counters_are_keyed_by_labels():
+    """Counters with different labels are tracked separately"""
+    registry = MetricsRegistry()
+    registry.increment("ai.errors", scenario="ECOMMERCE")
+    registry.increment("ai.errors", scenario="ECOMMERCE")
+    registry.increment("ai.errors", scenario="SAAS")
+    
+    assert registry.get_counter("ai.errors", scenario="ECOMMERCE") == 2
+    assert registry.snapshot()["counters"]["ai.errors{scenario=SAAS}"] == 1
+
+
+def test_histogram_percentiles():
+    """Percentiles use the nearest-rank method over recent observations"""
+    registry = MetricsRegistry()
+    for value in range(1, 101):
+        registry.observe("ai.time_to_first_token_ms", value)
+    
+    assert registry.percentile("ai.time_to_first_token_ms", 50) == 50
+    assert registry.percentile("ai.time_to_first_token_ms", 95) == 95
+    summary = registry.snapshot()["histograms"]["ai.time_to_first_token_ms"]
+    assert summary["count"] == 100
+    assert summary["max"] == 100
+
+
+def test_percentile_of_unknown_metric_is_none():
+    """Nothing observed yet means no percentile"""
+    assert MetricsRegistry().percentile("missing", 99) is None
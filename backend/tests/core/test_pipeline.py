@@ -0,0 +1,69 @@
+"""
+Tests for the request pipeline runner
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.core.executors import BoundedExecutor
+from app.core.pipeline import Pipeline, Stage
+
+
+def test_independent_stages_run_concurrently_and_dependents_wait():
+    """Test that independent stages overlap and a dependent stage sees their results"""
+    async def slow(name):
+        await asyncio.sleep(0.05)
+        return name
+
+    pipeline = Pipeline("test", [
+        Stage("combined", lambda r: r["a"] + r["b"] + r["suffix"], depends_on=["a", "b"]),
+        Stage("a", lambda r: slow("a")),
+        Stage("b", lambda r: time.sleep(0.05) or "b", blocking=True),
+    ])
+
+    result = asyncio.run(pipeline.run(suffix="!"))
+
+    assert result.results["combined"] == "ab!"
+    assert result.total_ms < result.sequential_ms
+    assert set(result.timings_ms) == {"a", "b", "combined"}
+
+
+def test_stage_timeout_uses_fallback_or_fails_the_run():
+    """Test that a timed-out stage degrades to its fallback, or fails the run without one"""
+    async def hang(_):
+        await asyncio.sleep(1)
+
+    degraded = Pipeline("test", [Stage("slow", hang, timeout=0.01, fallback=None)])
+    result = asyncio.run(degraded.run())
+    assert result.results["slow"] is None
+    assert result.degraded == ["slow"]
+
+    required = Pipeline("test", [Stage("slow", hang, timeout=0.01)])
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(required.run())
+
+
+def test_unknown_dependencies_are_rejected():
+    """Test that a stage depending on a missing stage is rejected up front"""
+    with pytest.raises(ValueError):
+        Pipeline("test", [Stage("a", lambda r: 1, depends_on=["missing"])])
+
+
+def test_blocking_stages_run_on_the_pipeline_executor():
+    """Test that blocking stages use the pipeline's own pool instead of the default one"""
+    executor = BoundedExecutor("pipeline-test", max_workers=1)
+    pipeline = Pipeline(
+        "test",
+        [Stage("thread", lambda r: threading.current_thread().name, blocking=True)],
+        executor=executor
+    )
+
+    try:
+        result = asyncio.run(pipeline.run())
+    finally:
+        executor.shutdown()
+
+    assert result.results["thread"].startswith("pipeline-test-executor")
@@ -0,0 +1,96 @@
+"""
+Tests for circuit breaking, retries, deadlines and hedging of upstream calls
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.core.resilience import CircuitBreaker, CircuitOpenError, ResilientCaller
+
+
+class ResourceExhausted(Exception):
+    """Stands in for the provider's 429 error; matched by class name"""
+
+
+def test_breaker_opens_on_error_rate_and_recovers_after_probe():
+    """Test that the breaker opens at the error rate and one successful probe closes it"""
+    breaker = CircuitBreaker("test", failure_threshold=0.5, min_calls=4, open_seconds=0.05)
+    for ok in (True, True, False, False):
+        assert breaker.allow()
+        if ok:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()  # Only one probe at a time
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_retries_rate_limits_then_succeeds():
+    """Test that rate limits are retried with backoff until a call succeeds"""
+    caller = ResilientCaller("test", timeout=2, max_retries=2, backoff_base=0.01)
+    attempts = []
+
+    async def operation():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ResourceExhausted()
+        return "ok"
+
+    assert asyncio.run(caller.call(operation)) == "ok"
+    assert len(attempts) == 3
+
+
+def test_deadline_and_open_circuit_fail_fast():
+    """Test that a missed deadline counts as a failure and the open circuit then fails fast"""
+    breaker = CircuitBreaker("test", min_calls=1, open_seconds=60)
+    caller = ResilientCaller("test", timeout=0.05, breaker=breaker)
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(caller.call(slow))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(caller.call(slow))
+
+
+def test_hedged_attempt_wins_when_primary_is_slow():
+    """Test that a hedged attempt answers when the primary is slower than usual"""
+    caller = ResilientCaller("test", timeout=2, hedge_percentile=50, hedge_min_samples=1)
+    caller.latencies.observe(10)
+    delays = [1.0, 0.0]
+
+    async def operation():
+        await asyncio.sleep(delays.pop(0))
+        return "done"
+
+    assert asyncio.run(caller.call(operation)) == "done"
+    assert delays == []
+
+
+def test_deferred_success_keeps_the_probe_until_the_caller_settles():
+    """Test that record_success=False leaves exactly one outcome to the caller, e.g. once a stream ends"""
+    breaker = CircuitBreaker("test", min_calls=1, open_seconds=0)
+    breaker.record_failure()
+    caller = ResilientCaller("test", timeout=1, breaker=breaker)
+
+    async def open_stream():
+        return "stream"
+
+    assert asyncio.run(caller.call(open_stream, record_success=False)) == "stream"
+    assert breaker.state == "half_open"
+    assert not breaker.allow()  # The probe is still in flight
+
+    breaker.record_failure()
+    assert breaker.state == "open"
@@ -0,0 +1,86 @@
+"""
+Tests for coalescing identical in-flight calls
+"""
+
+import asyncio
+
+import pytest
+
+from app.core.singleflight import SingleFlight
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    """Test that concurrent calls with one key run the operation once and all get its result"""
+    flights = SingleFlight("test")
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def scenario():
+        return await asyncio.gather(*(flights.do("key", operation) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["answer"] * 5
+    assert len(calls) == 1
+    assert flights.in_flight() == 0
+
+
+def test_errors_are_shared_and_keys_are_not_cached():
+    """Test that a failure reaches every waiter and the next call with the key runs afresh"""
+    flights = SingleFlight("test")
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream")
+
+    async def scenario():
+        results = await asyncio.gather(flights.do("key", failing), flights.do("key", failing), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        return await flights.do("key", lambda: asyncio.sleep(0, result="fresh"))
+
+    assert asyncio.run(scenario()) == "fresh"
+
+
+def test_waiters_take_over_when_leader_is_cancelled():
+    """Test that cancelling the leader does not cancel the waiters; one of them runs the call instead"""
+    flights = SingleFlight("test")
+
+    async def scenario():
+        leader = asyncio.ensure_future(flights.do("key", lambda: asyncio.sleep(1, result="leader")))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("key", lambda: asyncio.sleep(0, result="follower")))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(scenario()) == "follower"
+
+
+def test_one_waiter_takes_over_from_a_cancelled_leader():
+    """Test that after the leader is cancelled, the waiters share one new execution instead of each running it"""
+    flights = SingleFlight("test")
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def scenario():
+        leader = asyncio.ensure_future(flights.do("key", lambda: asyncio.sleep(1, result="leader")))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(flights.do("key", operation)) for _ in range(4)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        results = await asyncio.gather(*waiters)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return results
+
+    assert asyncio.run(scenario()) == ["answer"] * 4
+    assert len(calls) == 1
+    assert flights.in_flight() == 0
@@ -0,0 +1,70 @@
+"""
+Tests for streamed generation under the LLM circuit breaker
+"""
+
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.core.resilience import CircuitBreaker, ResilientCaller
+from app.services import ai_service
+from app.services.ai_service import AIService
+from app.services.llm_providers import LLMChunk, LLMProvider
+
+
+class ScriptedStreamProvider(LLMProvider):
+    """Streams the given chunks, raising any exception found among them"""
+
+    name = "scripted"
+    model = "scripted"
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def open_stream(self, prompt):
+        async def stream():
+            for chunk in self.chunks:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield LLMChunk(text=chunk)
+        return stream()
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    """A fresh breaker behind the shared caller, with caching and stale answers out of the way"""
+    breaker = CircuitBreaker("scripted", min_calls=100)
+    monkeypatch.setattr(ai_service, "llm_breaker", breaker)
+    monkeypatch.setattr(ai_service, "llm_caller", ResilientCaller("scripted", timeout=5, breaker=breaker))
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "STALE_ANSWERS_ENABLED", False)
+    monkeypatch.setattr(settings, "INTENT_ROUTER_ENABLED", False)
+    monkeypatch.setattr(settings, "AI_COALESCE_ENABLED", False)
+    return breaker
+
+
+def stream(provider, message):
+    async def collect():
+        return [chunk async for chunk in AIService(provider=provider).stream_response(message, "ECOMMERCE")]
+    return asyncio.run(collect())
+
+
+def outcomes(breaker):
+    return [ok for _, ok in breaker._outcomes]
+
+
+def test_completed_stream_records_one_success(breaker):
+    """Opening the stream and reading it to the end is one call, recorded once"""
+    chunks = stream(ScriptedStreamProvider(["Hello", " there"]), "Where is my order?")
+
+    assert chunks[-1].response.content == "Hello there"
+    assert outcomes(breaker) == [True]
+
+
+def test_stream_failing_mid_way_records_one_failure(breaker):
+    """A stream that opened but broke off counts as a failure only, not a success and a failure"""
+    chunks = stream(ScriptedStreamProvider(["Hello", RuntimeError("connection reset")]), "Where is my order?")
+
+    assert chunks[-1].response.model == "fallback"
+    assert outcomes(breaker) == [False]
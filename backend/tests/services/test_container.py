@@ -0,0 +1,69 @@
+"""
+Tests for the application-scoped service container and its dependency providers
+"""
+
+import threading
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.v1.endpoints import knowledge as knowledge_endpoints
+from app.core.dependencies import get_current_admin_user
+from app.services import container
+
+
+class SlowService:
+    """Counts constructions; slow enough that racing first uses overlap"""
+
+    built = 0
+
+    def __init__(self):
+        SlowService.built += 1
+        time.sleep(0.05)
+
+
+class FakeVectorIndex:
+    def get_index_stats(self):
+        return {"total_vectors": 3}
+
+
+def test_each_service_is_built_once_per_container(monkeypatch):
+    """Concurrent first uses share one instance, and later uses get the same one"""
+    monkeypatch.setattr(container, "AIService", SlowService)
+    monkeypatch.setattr(SlowService, "built", 0)
+    services = container.ServiceContainer()
+    seen = []
+
+    threads = [threading.Thread(target=lambda: seen.append(services.ai)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert SlowService.built == 1
+    assert all(service is seen[0] for service in seen)
+    assert services.ai is seen[0]
+    assert services.knowledge is services.knowledge
+
+
+def test_dependency_providers_hand_out_the_shared_instances(monkeypatch):
+    """Endpoints get the process container's services, not per-request copies"""
+    services = container.ServiceContainer()
+    monkeypatch.setattr(container, "services", services)
+
+    assert container.get_knowledge_service() is services.knowledge
+    assert container.get_scenario_service() is container.get_scenario_service()
+
+
+def test_dependency_overrides_replace_container_services():
+    """Tests and embedders can swap a service per app through dependency_overrides"""
+    app = FastAPI()
+    app.include_router(knowledge_endpoints.router, prefix="/knowledge")
+    app.dependency_overrides[get_current_admin_user] = lambda: None
+    app.dependency_overrides[container.get_vector_index] = FakeVectorIndex
+
+    response = TestClient(app).get("/knowledge/index")
+
+    assert response.status_code == 200
+    assert response.json() == {"total_vectors": 3}
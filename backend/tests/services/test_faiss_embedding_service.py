@@ -0,0 +1,137 @@
+"""
+Tests for the FAISS vector index and its generations
+"""
+
+import numpy as np
+import pytest
+
+from app.services import faiss_embedding_service
+from app.services.faiss_embedding_service import AttributeBitmaps, FAISSEmbeddingService, make_id_selector
+from app.services.knowledge_service import IndexEntryBatches, SimpleEmbeddingService
+
+ENTRIES = [
+    {"id": 1, "title": "Returns", "content": "How to return an item for a refund", "category": "A", "tags": ["returns"]},
+    {"id": 2, "title": "Shipping", "content": "Shipping takes three to five days", "category": "A", "tags": ["shipping"]},
+    {"id": 3, "title": "Billing", "content": "Refund of a subscription payment", "category": "B", "tags": ["billing", "returns"]},
+]
+
+
+class DeferredThread:
+    """Stands in for threading.Thread so a test decides when the background build runs"""
+    started = []
+
+    def __init__(self, target, args=(), daemon=None):
+        self.target, self.args = target, args
+
+    def start(self):
+        DeferredThread.started.append(self)
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = FAISSEmbeddingService(model_name=SimpleEmbeddingService.model_id, index_mode="memory", storage_dir=tmp_path)
+    service.rebuild_index(ENTRIES)
+    return service
+
+
+def result_ids(service, query="refund", **filters):
+    return sorted(r["knowledge_id"] for r in service.search_similar(query, limit=10, min_score=-1.0, **filters))
+
+
+def test_bitmaps_combine_active_category_and_tag_filters():
+    """Masks keep only active rows that pass the category and tag filters"""
+    bitmaps = AttributeBitmaps(capacity=2)
+    for entry in ENTRIES:
+        bitmaps.append(entry["id"], True, entry["category"], entry["tags"])
+    bitmaps.set_active(2, False)
+
+    assert bitmaps.build_mask().tolist() == [True, False, True]
+    assert bitmaps.build_mask(category="A").tolist() == [True, False, False]
+    assert bitmaps.build_mask(tags=["returns", "shipping"]).tolist() == [True, False, True]
+    assert bitmaps.build_mask(tags=["billing", "returns"], match_all_tags=True).tolist() == [False, False, True]
+    assert not bitmaps.build_mask(category="missing").any()
+
+
+def test_id_selector_matches_the_mask_exactly():
+    """The selector admits exactly the masked rows, including past the last full byte"""
+    mask = np.zeros(21, dtype=bool)
+    mask[[0, 9, 20]] = True
+
+    selector, bitmap = make_id_selector(mask)
+
+    assert len(bitmap) == 3
+    assert [i for i in range(64) if selector.is_member(i)] == [0, 9, 20]
+
+
+def test_search_is_prefiltered_by_attributes(service):
+    """Filtered-out rows never appear in results"""
+    assert result_ids(service) == [1, 2, 3]
+    assert result_ids(service, category="B") == [3]
+    assert result_ids(service, tags=["returns"]) == [1, 3]
+
+    service.remove_from_index(1)
+
+    assert result_ids(service, tags=["returns"]) == [3]
+
+
+def test_deactivation_during_reembedding_survives_the_swap(service, monkeypatch):
+    """Removals queued while a generation builds are replayed into it before the swap"""
+    monkeypatch.setattr(faiss_embedding_service.threading, "Thread", DeferredThread)
+    DeferredThread.started = []
+
+    service.start_reembedding(ENTRIES, SimpleEmbeddingService.model_id, model_version="2")
+    service.remove_from_index(1)
+    service.add_to_index("Exchange an item for another size", 4, "Exchanges", category="A", tags=["returns"])
+    service.remove_from_index(4)
+
+    # The background build runs on the snapshot taken when it started
+    build = DeferredThread.started[0]
+    build.target(*build.args)
+    assert service.swap_generation()
+
+    assert service.get_index_stats()["model_version"] == "2"
+    assert result_ids(service) == [2, 3]
+
+
+def test_rows_persist_without_rewriting_the_index_and_survive_a_restart(service, tmp_path):
+    """Single adds only append to the row store; a reload re-embeds rows the index file missed"""
+    index_file = service._active.index_path
+    index_mtime = index_file.stat().st_mtime_ns
+    service.add_to_index("Exchange an item for another size", 4, "Exchanges", category="A", tags=["returns"])
+    service.remove_from_index(2)
+
+    assert service._active.unsaved_rows == 1
+    assert index_file.stat().st_mtime_ns == index_mtime
+    reloaded = FAISSEmbeddingService(model_name=SimpleEmbeddingService.model_id, index_mode="memory", storage_dir=tmp_path)
+
+    assert reloaded.size == 4
+    assert result_ids(reloaded) == [1, 3, 4]
+    assert reloaded.search_similar("exchange size", limit=1, min_score=-1.0)[0]["text"] == "Exchange an item for another size"
+
+
+def test_ivf_build_streams_batches_and_returns_stored_text(tmp_path, monkeypatch):
+    """The on-disk build samples and adds batch by batch, and results still carry the entry text"""
+    monkeypatch.setattr(faiss_embedding_service, "MIN_POINTS_PER_CENTROID", 5)
+    monkeypatch.setattr(faiss_embedding_service, "MIN_IVF_LISTS", 2)
+    entries = [
+        {"id": i, "title": f"Entry {i}", "content": f"topic{i % 4} detail number {i}", "category": "A"}
+        for i in range(1, 121)
+    ]
+    passes = []
+
+    def batches():
+        passes.append(0)
+        for start in range(0, len(entries), 25):
+            passes[-1] += 1
+            yield entries[start:start + 25]
+
+    service = FAISSEmbeddingService(model_name=SimpleEmbeddingService.model_id, index_mode="ondisk_ivf", storage_dir=tmp_path)
+    service.nlist, service.train_size = 4, 40
+    assert service._training_sample(IndexEntryBatches(batches, len(entries)), service.model).shape == (40, 300)
+
+    service.rebuild_index(IndexEntryBatches(batches, len(entries)))
+
+    assert service.get_index_stats()["index_type"] == "ivf_ondisk"
+    assert passes == [5, 5, 5]
+    hit = service.search_similar("topic1 detail number 5", limit=1, min_score=-1.0)[0]
+    assert hit["knowledge_id"] == 5 and hit["text"] == "topic1 detail number 5"
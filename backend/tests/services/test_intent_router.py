@@ -0,0 +1,58 @@
+"""
+Tests for the fast-path intent router
+"""
+
+import pytest
+
+from app.services.intent_router import ScenarioIntentModel
+from app.services.knowledge_service import KnowledgeService
+
+SAMPLE_QUERIES = [
+    "Where is my order?",
+    "How do I return an item?",
+    "What is your refund policy?",
+    "My package arrived damaged",
+    "Can I change my shipping address?"
+]
+
+
+@pytest.fixture(scope="module")
+def model():
+    """Intent model for an ecommerce-like scenario without FAQ entries"""
+    knowledge_service = KnowledgeService()
+    return knowledge_service.generate_embedding, ScenarioIntentModel(
+        knowledge_service.generate_embedding, SAMPLE_QUERIES, []
+    )
+
+
+def classify(model, message):
+    embed, intent_model = model
+    return intent_model.classify(message, embed(message), threshold=0.45, margin=0.2, faq_threshold=0.9)
+
+
+@pytest.mark.parametrize("message,intent", [
+    ("hi!", "greeting"),
+    ("Good morning", "greeting"),
+    ("thank you so much!", "thanks"),
+    ("Thanks again, really", "thanks"),
+    ("bye", "goodbye"),
+    ("speak to a human please", "human_handoff"),
+])
+def test_small_talk_is_answered_locally(model, message, intent):
+    """Test that plain small talk and light paraphrases route to their intent"""
+    match = classify(model, message)
+
+    assert match is not None
+    assert match.intent == intent
+
+
+@pytest.mark.parametrize("message", [
+    "thanks but the item is broken",
+    "can I speak to a human about my refund",
+    "hi, where is my order?",
+    "Where is my order #1234?",
+    "bye, and cancel my subscription",
+])
+def test_turns_with_a_request_go_to_the_llm(model, message):
+    """Test that small talk mixed with a real request is not answered from a template"""
+    assert classify(model, message) is None
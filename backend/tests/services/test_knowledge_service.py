@@ -0,0 +1,295 @@
+"""
+Tests for knowledge embeddings, their model tags and the vector index wiring
+"""
+
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.v1.endpoints import knowledge as knowledge_endpoints
+from app.core.cache import cache
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.database import Base
+from app.models.knowledge import KnowledgeBase
+from app.schemas import VectorIndexReembed
+from app.schemas.knowledge import KnowledgeBaseInDB
+from app.services import container
+from app.services.faiss_embedding_service import FAISSEmbeddingService
+from app.services.knowledge_service import KnowledgeService, SimpleEmbeddingService, TagIndex
+
+engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+
+@pytest.fixture
+def db():
+    session = TestingSessionLocal()
+    yield session
+    session.query(KnowledgeBase).delete()
+    session.commit()
+    session.close()
+
+
+class RecordingIndex:
+    """Records the calls a knowledge write makes on the vector index"""
+
+    def __init__(self):
+        self.calls = []
+
+    def set_entry_active(self, knowledge_id, is_active):
+        self.calls.append(("set_active", knowledge_id, is_active))
+
+    def add_to_index(self, text, knowledge_id, title, category=None, tags=None):
+        self.calls.append(("add", knowledge_id, text))
+
+
+def test_embedding_buckets_do_not_depend_on_the_process_hash_seed():
+    """Features are bucketed with crc32, so a vector is identical in every worker and after restarts"""
+    vector = SimpleEmbeddingService().generate_embedding("refund")
+
+    # Word bucket 48, plus the "ref", "efu", "fun" and "und" trigram buckets
+    assert [i for i, value in enumerate(vector) if value] == [48, 212, 251, 253, 299]
+
+
+def test_stored_embeddings_carry_the_model_tag(db):
+    """New entries store their vector with the model id and version that produced it"""
+    service = KnowledgeService()
+
+    entry = service.add_knowledge_entry("Refunds", "How to get a refund", db=db)
+
+    assert entry.embedding["model_id"] == SimpleEmbeddingService.model_id
+    assert entry.embedding["model_version"] == SimpleEmbeddingService.model_version
+    assert service.stored_vector(entry.embedding) == service.generate_embedding("Refunds How to get a refund")
+    assert KnowledgeBaseInDB.model_validate(entry).embedding == entry.embedding["vector"]
+
+
+def test_untagged_and_foreign_vectors_are_not_compared_with_queries():
+    """Legacy lists and vectors from another model version are treated as stale"""
+    service = KnowledgeService()
+    vector = service.generate_embedding("refund")
+
+    assert service.stored_vector(vector) is None
+    assert service.stored_vector({**service.embedding_tag(), "model_version": "1", "vector": vector}) is None
+    assert service.stored_vector({**service.embedding_tag(), "vector": vector}) == vector
+
+
+def test_stale_entries_are_still_found_and_refreshed_in_bulk(db):
+    """Search scores stale entries with a fresh embedding until bulk_update_embeddings re-tags them"""
+    service = KnowledgeService()
+    fresh = service.add_knowledge_entry("Shipping", "Delivery takes five days", db=db)
+    # An old-model vector of the same length would otherwise be compared as if it were current
+    stale = KnowledgeBase(title="Refunds", content="How to get a refund", embedding=[1.0] * 300, is_active=True)
+    db.add(stale)
+    db.commit()
+
+    results = service.semantic_search("refund", db=db, min_similarity=0.2)
+
+    assert [entry.id for entry in results] == [stale.id]
+    assert service.bulk_update_embeddings(db) == 1
+    db.refresh(stale)
+    assert service.stored_vector(stale.embedding) is not None
+    assert service.bulk_update_embeddings(db) == 0
+    assert fresh.embedding["model_version"] == SimpleEmbeddingService.model_version
+
+
+def test_startup_backfill_re_embeds_stale_entries_a_batch_at_a_time(db, monkeypatch):
+    """The container's backfill commits each batch and stops between batches on shutdown"""
+    services = container.ServiceContainer()
+    monkeypatch.setattr(container, "SessionLocal", TestingSessionLocal)
+    db.add_all(
+        KnowledgeBase(title=f"Entry {i}", content="Old vector", embedding=[1.0] * 300, is_active=True)
+        for i in range(5)
+    )
+    db.commit()
+    embedded = []
+    embed_for_storage = services.knowledge.embed_for_storage
+
+    def recording_embed(text):
+        embedded.append(text)
+        return embed_for_storage(text)
+
+    monkeypatch.setattr(services.knowledge, "embed_for_storage", recording_embed)
+
+    # Asked to stop once the first batch is done
+    assert services.knowledge.bulk_update_embeddings(db, batch_size=2, should_stop=lambda: len(embedded) >= 2) == 2
+
+    assert services.backfill_embeddings() == 3
+    db.expire_all()
+    assert all(services.knowledge.stored_vector(entry.embedding) for entry in db.query(KnowledgeBase))
+
+
+def test_entry_writes_reach_the_vector_index(db):
+    """Updates mask the old index rows before re-adding; deletes only mask them"""
+    index = RecordingIndex()
+    service = KnowledgeService(vector_index=index)
+
+    entry = service.add_knowledge_entry("Refunds", "How to get a refund", db=db)
+    entry.is_active = False
+    service.refresh_entry_indexes(entry)
+
+    assert index.calls == [
+        ("set_active", entry.id, False),
+        ("add", entry.id, "How to get a refund"),
+        ("set_active", entry.id, False),
+    ]
+
+
+def test_vector_index_dependency_reports_a_disabled_index(monkeypatch):
+    """Index endpoints answer 503 instead of failing when the index is turned off"""
+    monkeypatch.setattr(settings, "VECTOR_INDEX_ENABLED", False)
+    monkeypatch.setattr(container, "services", container.ServiceContainer())
+
+    with pytest.raises(HTTPException) as error:
+        container.get_vector_index()
+
+    assert error.value.status_code == 503
+
+
+def test_reembed_and_swap_endpoints_drive_the_index(db, tmp_path, monkeypatch):
+    """The admin endpoints rebuild the index from the database and swap the new generation in"""
+    monkeypatch.setattr(settings, "VECTOR_INDEX_ENABLED", True)
+    monkeypatch.setattr(settings, "VECTOR_INDEX_STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "VECTOR_INDEX_MODEL", SimpleEmbeddingService.model_id)
+    services = container.ServiceContainer()
+    monkeypatch.setattr(container, "services", services)
+    index = container.get_vector_index()
+    service = services.knowledge
+    assert isinstance(index, FAISSEmbeddingService) and service.vector_index is index
+
+    entry = service.add_knowledge_entry("Refunds", "How to get a refund", db=db)
+    with pytest.raises(HTTPException) as error:
+        knowledge_endpoints.swap_vector_index_generation(current_user=None, vector_index=index)
+    assert error.value.status_code == 409
+
+    started = knowledge_endpoints.start_vector_index_reembedding(
+        VectorIndexReembed(model_name=SimpleEmbeddingService.model_id, model_version="3"),
+        db=db,
+        current_user=None,
+        vector_index=index,
+        knowledge_service=service
+    )
+    for _ in range(200):
+        if index.get_reembed_status()["state"] == "ready":
+            break
+        time.sleep(0.01)
+    stats = knowledge_endpoints.swap_vector_index_generation(current_user=None, vector_index=index)
+
+    assert started["status"]["total"] == 1
+    assert stats["model_version"] == "3"
+    assert [r["knowledge_id"] for r in index.search_similar("refund", min_score=-1.0)] == [entry.id]
+
+
+def test_index_entry_batches_page_through_active_entries(db):
+    """Entries are read in id-ordered batches, and every pass starts from the beginning"""
+    service = KnowledgeService()
+    for i in range(5):
+        service.add_knowledge_entry(f"Entry {i}", "content", db=db)
+    service.add_knowledge_entry("Hidden", "content", db=db).is_active = False
+    db.commit()
+
+    batches = service.index_entry_batches(db, batch_size=2)
+
+    assert len(batches) == 5
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [entry["title"] for batch in batches for entry in batch] == [f"Entry {i}" for i in range(5)]
+
+
+def test_search_uses_the_vector_index_and_loads_entries_by_id(db, tmp_path):
+    """With a populated index, ranking comes from FAISS and content from the database"""
+    index = FAISSEmbeddingService(model_name=SimpleEmbeddingService.model_id, index_mode="memory", storage_dir=tmp_path)
+    service = KnowledgeService(vector_index=index)
+    refund = service.add_knowledge_entry("Refunds", "How to get a refund", db=db)
+    service.add_knowledge_entry("Shipping", "Delivery takes five days", db=db)
+
+    results = service.semantic_search("refund", limit=1, db=db)
+
+    assert index.size == 2
+    assert [entry.id for entry in results] == [refund.id]
+    assert results[0].content == "How to get a refund"
+
+
+class SlowTagQuery:
+    """Session stand-in whose tag query runs a callback mid-read, before returning its rows"""
+
+    def __init__(self, rows, during_read):
+        self.rows = rows
+        self.during_read = during_read
+
+    def query(self, *columns):
+        return self
+
+    def filter(self, *criteria):
+        return self
+
+    def all(self):
+        self.during_read()
+        return self.rows
+
+
+def test_tag_index_applies_writes_from_other_workers_without_reloading(db):
+    """Each write is replayed from the shared change log; the rest of the index is not reloaded"""
+    index = TagIndex()
+    other_worker = TagIndex()
+    faq = KnowledgeBase(title="FAQ", content="Opening hours", tags=["FAQ"], is_active=True)
+    db.add(faq)
+    db.commit()
+    index.ensure_loaded(db)
+    reloads = metrics.get_counter("tag_index.reloads")
+
+    added = KnowledgeBase(title="FAQ 2", content="Holiday hours", tags=["faq"], is_active=True)
+    db.add(added)
+    faq.is_active = False
+    db.commit()
+    index.ensure_loaded(db)
+    assert index.lookup(["faq"]) == [faq.id]  # Not told yet
+
+    other_worker.publish(added.id)
+    other_worker.publish(faq.id)
+    index.ensure_loaded(db)
+
+    assert index.lookup(["faq"]) == [added.id]
+    assert metrics.get_counter("tag_index.reloads") == reloads
+
+
+def test_tag_index_reloads_on_request_and_after_a_gap_in_the_change_log(db):
+    """An admin reload, or change records that expired, fall back to reading every entry"""
+    index = TagIndex(max_replay=2)
+    index.ensure_loaded(db)
+    reloads = metrics.get_counter("tag_index.reloads")
+
+    entries = [KnowledgeBase(title=f"FAQ {i}", content="Hours", tags=["faq"], is_active=True) for i in range(3)]
+    db.add_all(entries)
+    db.commit()
+    for entry in entries:
+        TagIndex().publish(entry.id)
+    index.ensure_loaded(db)
+
+    assert index.lookup(["faq"]) == sorted(entry.id for entry in entries)
+    assert metrics.get_counter("tag_index.reloads") == reloads + 1
+
+    TagIndex().invalidate()
+    index.ensure_loaded(db)
+    assert metrics.get_counter("tag_index.reloads") == reloads + 2
+
+
+def test_tag_index_keeps_upserts_that_arrive_during_a_reload():
+    """An upsert racing a reload waits for the swap instead of being overwritten by it"""
+    index = TagIndex()
+    writer = threading.Thread(target=index.upsert, args=(2, ["refunds"]))
+
+    def start_writer():
+        writer.start()
+        time.sleep(0.05)
+
+    index.ensure_loaded(SlowTagQuery([(1, ["Shipping"])], start_writer))
+    writer.join()
+
+    assert index.lookup(["refunds"]) == [2]
+    assert index.lookup(["shipping"]) == [1]
@@ -0,0 +1,128 @@
+"""
+Tests for LLM provider construction and the Gemini context cache
+"""
+
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services import llm_providers
+from app.services.llm_providers import (
+    GeminiContextCache,
+    LLMProviderUnavailable,
+    MockLLMProvider,
+    create_llm_provider,
+    get_llm_provider,
+    provider_name,
+    tokenizer_spec,
+)
+from app.services.prompt_service import PromptService
+
+
+@pytest.fixture
+def fresh_provider(monkeypatch):
+    """Forget the process's provider so each test builds its own"""
+    monkeypatch.setattr(llm_providers, "_llm_provider", None)
+
+
+def test_gemini_without_sdk_fails_with_clear_error(monkeypatch, fresh_provider):
+    """Test that a missing SDK fails provider construction, not module import"""
+    monkeypatch.setattr(llm_providers, "genai", None)
+    monkeypatch.setattr(settings, "AI_MODEL", "gemini-2.5-flash")
+
+    with pytest.raises(LLMProviderUnavailable, match="google-generativeai"):
+        get_llm_provider()
+
+
+def test_provider_is_built_once_per_process(monkeypatch, fresh_provider):
+    """Test that the shared provider is built on first use and reused"""
+    monkeypatch.setattr(settings, "AI_MODEL", "mock")
+
+    provider = get_llm_provider()
+
+    assert isinstance(provider, MockLLMProvider)
+    assert get_llm_provider() is provider
+
+
+def test_provider_name_does_not_build_the_provider(monkeypatch):
+    """Test that the provider name is known without the SDK"""
+    monkeypatch.setattr(llm_providers, "genai", None)
+
+    assert provider_name("gemini-2.5-flash") == "gemini"
+    assert provider_name("mock:fast") == "mock"
+    assert isinstance(create_llm_provider("mock:fast"), MockLLMProvider)
+
+
+def test_prompt_tokenizer_follows_the_configured_model(monkeypatch):
+    """Test that Gemini models count with count_tokens, and the mock or a missing key with the heuristic"""
+    monkeypatch.setattr(llm_providers, "genai", object())
+    monkeypatch.setattr(settings, "GOOGLE_AI_API_KEY", "key")
+
+    assert tokenizer_spec("gemini-2.5-flash") == "gemini:gemini-2.5-flash"
+    assert tokenizer_spec("mock:fast") == "heuristic"
+
+    monkeypatch.setattr(settings, "GOOGLE_AI_API_KEY", "")
+    assert tokenizer_spec("gemini-2.5-flash") == "heuristic"
+
+
+class RecordingContextCache(GeminiContextCache):
+    """Registers prefixes locally, recording each upstream registration"""
+
+    def __init__(self, **kwargs):
+        super().__init__("gemini-2.5-flash", min_tokens=1, **kwargs)
+        self.registered = []
+        self.fail = False
+
+    def _register(self, prefix):
+        self.registered.append(prefix.fingerprint)
+        if self.fail:
+            raise RuntimeError("quota exceeded")
+        return f"model-{prefix.fingerprint[:8]}"
+
+
+def prefix(scenario_id, business_context="Ships worldwide", canonical=True):
+    return PromptService().build_prompt_prefix(
+        scenario_id, business_context, system_prompt="You are a support agent", canonical=canonical
+    )
+
+
+def test_context_cache_registers_only_canonical_prefixes():
+    """Trimmed one-off prefixes are sent in full; the scenario's canonical prefix is registered once"""
+    context_cache = RecordingContextCache()
+
+    assert context_cache.model_for(prefix("ECOMMERCE", "Ships", canonical=False)) is None
+    model = context_cache.model_for(prefix("ECOMMERCE"))
+
+    assert context_cache.model_for(prefix("ECOMMERCE")) == model
+    assert context_cache.registered == [prefix("ECOMMERCE").fingerprint]
+
+
+def test_context_cache_keeps_one_prefix_per_scenario_and_bounds_scenarios():
+    """A changed prefix replaces the scenario's registration, and the least recent scenario is dropped"""
+    context_cache = RecordingContextCache(max_scenarios=2)
+
+    context_cache.model_for(prefix("ECOMMERCE"))
+    context_cache.model_for(prefix("ECOMMERCE", "Ships to the EU only"))
+    context_cache.model_for(prefix("SAAS"))
+    context_cache.model_for(prefix("SERVICE"))
+
+    assert list(context_cache._models) == ["SAAS", "SERVICE"]
+    assert len(context_cache.registered) == 4
+
+
+def test_context_cache_failures_back_off_until_they_expire(monkeypatch):
+    """A failed registration is not retried on every turn, but is retried after the TTL"""
+    context_cache = RecordingContextCache()
+    context_cache.fail = True
+
+    assert context_cache.model_for(prefix("ECOMMERCE")) is None
+    assert context_cache.model_for(prefix("ECOMMERCE")) is None
+    assert len(context_cache.registered) == 1
+
+    context_cache.fail = False
+    now = time.time()
+    monkeypatch.setattr(llm_providers.time, "time", lambda: now + context_cache.ttl + 1)
+
+    assert context_cache.model_for(prefix("ECOMMERCE")) is not None
+    assert len(context_cache.registered) == 2
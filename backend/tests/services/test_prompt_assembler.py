@@ -0,0 +1,38 @@
+"""
+Tests for token-budgeted prompt assembly
+"""
+
+from app.services.prompt_assembler import PromptAssembler, PromptSection
+from app.utils.tokens import HeuristicTokenizer, TokenCounter
+
+
+class RecordingTokenizer(HeuristicTokenizer):
+    """Records every text it is asked to count, like a provider's count_tokens call log"""
+
+    def __init__(self):
+        self.texts = []
+
+    def count(self, text):
+        self.texts.append(text)
+        return super().count(text)
+
+
+def test_trimming_counts_each_piece_once():
+    """Dropping history lines subtracts their counts instead of recounting the section per pop"""
+    tokenizer = RecordingTokenizer()
+    assembler = PromptAssembler(TokenCounter(tokenizer=tokenizer))
+    history = [f"Customer: question number {i} about my order" for i in range(20)]
+    sections = [
+        PromptSection(name="system", items=["You are a support agent."]),
+        PromptSection(name="history", header="## Previous Conversation\n", items=history, trim="oldest"),
+        PromptSection(name="query", header="Customer: ", items=["Where is my order?"], priority=4, trim="truncate")
+    ]
+
+    fitted, total, trimmed = assembler.fit(sections, budget=60)
+
+    assert total <= 60
+    assert 0 < len(fitted[1].items) < len(history)
+    assert fitted[1].items == history[-len(fitted[1].items):]
+    assert trimmed["history"] > 0
+    assert len(tokenizer.texts) == len(set(tokenizer.texts))
+    assert assembler.render(fitted) not in tokenizer.texts
@@ -0,0 +1,108 @@
+"""
+Tests for the compiled prompt template registry and custom scenario prompts
+"""
+
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.v1.endpoints import scenarios as scenario_endpoints
+from app.core.database import Base
+from app.models.conversation import ScenarioType
+from app.models.scenario import CustomScenario
+from app.schemas.scenario import CustomScenarioUpdate
+from app.services.prompt_templates import DEFAULT_SYSTEM_PROMPT, PromptTemplateRegistry
+
+engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+
+@pytest.fixture
+def db():
+    session = TestingSessionLocal()
+    yield session
+    session.query(CustomScenario).delete()
+    session.commit()
+    session.close()
+
+
+@pytest.fixture
+def prompts_dir(tmp_path):
+    for relative, text in {
+        "base/system_base.md": "You are a support agent.",
+        "ecommerce/system.md": "Help with orders.",
+        "saas/system.md": "Help with subscriptions.",
+        "service/system.md": "Help with bookings."
+    }.items():
+        path = tmp_path / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+    return tmp_path
+
+
+@pytest.fixture
+def registry(prompts_dir, monkeypatch):
+    """A registry without a watcher thread, also used by the scenario endpoints"""
+    registry = PromptTemplateRegistry(prompts_dir, reload_interval=0, recheck_seconds=3600)
+    monkeypatch.setattr(scenario_endpoints, "prompt_templates", registry)
+    return registry
+
+
+def add_custom_scenario(db, system_prompt="Help with pet grooming."):
+    scenario = CustomScenario(id="GROOMING", name="Grooming", description="Pet grooming", system_prompt=system_prompt)
+    db.add(scenario)
+    db.commit()
+    return scenario
+
+
+def test_built_in_prompts_are_compiled_from_base_and_scenario_templates(registry):
+    """Each built-in scenario's prompt is the base template followed by its own"""
+    assert registry.system_prompt(ScenarioType.SAAS) == "You are a support agent.\n\nHelp with subscriptions."
+    assert registry.system_prompt("ECOMMERCE") == "You are a support agent.\n\nHelp with orders."
+    assert registry.template("service/system.md") == "Help with bookings."
+    assert registry.system_prompt("UNKNOWN") == DEFAULT_SYSTEM_PROMPT
+
+
+def test_edited_template_files_are_recompiled(registry, prompts_dir):
+    """A changed file is detected by mtime and the next load serves the new text"""
+    registry.system_prompt(ScenarioType.SAAS)
+    path = prompts_dir / "saas/system.md"
+    path.write_text("Help with invoices.", encoding="utf-8")
+    stat = path.stat()
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+    assert registry._changed()
+    registry.load()
+
+    assert registry.system_prompt(ScenarioType.SAAS).endswith("Help with invoices.")
+    assert not registry._changed()
+
+
+def test_updating_a_custom_scenario_replaces_its_cached_prompt(registry, db):
+    """The update endpoint invalidates the cached prompt instead of waiting for the recheck"""
+    add_custom_scenario(db)
+    assert registry.system_prompt("GROOMING", db) == "Help with pet grooming."
+
+    asyncio.run(scenario_endpoints.update_custom_scenario(
+        "grooming",
+        CustomScenarioUpdate(system_prompt="Help with pet grooming and boarding."),
+        db=db,
+        current_user=None
+    ))
+
+    assert registry.system_prompt("GROOMING", db) == "Help with pet grooming and boarding."
+
+
+def test_deleting_a_custom_scenario_drops_its_cached_prompt(registry, db):
+    """A deleted scenario falls back to the default prompt on the next turn"""
+    add_custom_scenario(db)
+    assert registry.system_prompt("GROOMING", db) == "Help with pet grooming."
+
+    asyncio.run(scenario_endpoints.delete_custom_scenario("grooming", db=db, current_user=None))
+
+    assert registry.system_prompt("GROOMING", db) == DEFAULT_SYSTEM_PROMPT
@@ -0,0 +1,129 @@
+"""
+Tests for the semantic response cache and the stale answer store
+"""
+
+import numpy as np
+
+from app.services.response_cache_service import SemanticResponseCache, StaleAnswerStore
+
+
+class SynonymEncoder:
+    """Stands in for a sentence model: questions about refunds or returns land on one vector"""
+
+    def generate_embedding(self, text):
+        topic = any(word in text for word in ("refund", "return"))
+        return np.array([1.0, 0.0] if topic else [0.0, 1.0], dtype=np.float32)
+
+
+def cache_answer(response_cache, message, prefix_fingerprint="prefix-a"):
+    response_cache.store(
+        "ECOMMERCE",
+        message,
+        answer=f"Answer to: {message}",
+        model="test-model",
+        knowledge_ids=[3],
+        prefix_fingerprint=prefix_fingerprint
+    )
+
+
+def remember(store, message, knowledge_ids):
+    store.remember(
+        "ECOMMERCE",
+        message,
+        answer=f"Answer to: {message}",
+        model="test-model",
+        knowledge_ids=knowledge_ids,
+        sources=["Refunds"]
+    )
+
+
+def test_stale_answer_is_served_for_a_repeat_grounded_in_the_same_knowledge():
+    """Case, spacing and punctuation differences still hit when retrieval matches"""
+    store = StaleAnswerStore()
+    remember(store, "What is your refund policy?", [3, 7])
+
+    stale = store.lookup("ECOMMERCE", "what is your  refund policy", [7, 3])
+
+    assert stale["answer"] == "Answer to: What is your refund policy?"
+    assert stale["similarity"] > 0.99
+
+
+def test_questions_differing_in_one_detail_are_not_served():
+    """"...for electronics" scores about 0.82 against "...for clothing", below the grounded threshold"""
+    store = StaleAnswerStore()
+    remember(store, "What is your refund policy for electronics?", [3])
+
+    assert store.lookup("ECOMMERCE", "What is your refund policy for clothing?", [3]) is None
+
+
+def test_a_different_retrieval_is_not_served_even_for_the_same_question():
+    """The stored answer was grounded in other entries, so it may contradict the current ones"""
+    store = StaleAnswerStore()
+    remember(store, "What is your refund policy?", [3])
+
+    assert store.lookup("ECOMMERCE", "What is your refund policy?", [4]) is None
+
+
+def test_unknown_retrieval_only_serves_near_exact_repeats():
+    """Without knowledge ids, a question must clear the much stricter ungrounded threshold"""
+    store = StaleAnswerStore(threshold=0.5)
+    remember(store, "What is your refund policy?", [3])
+
+    assert store.lookup("ECOMMERCE", "What is your refund policy", None)["similarity"] > 0.99
+    assert store.lookup("ECOMMERCE", "What is the refund policy?", [3]) is not None
+    assert store.lookup("ECOMMERCE", "What is the refund policy?", None) is None
+
+
+def test_cached_answer_is_served_for_a_repeat_under_the_same_prompt_prefix():
+    """Repeats that differ only in case, spacing or trailing punctuation share a key"""
+    response_cache = SemanticResponseCache()
+    cache_answer(response_cache, "Do you ship to Canada?")
+
+    cached = response_cache.lookup("ECOMMERCE", "do you ship to  canada", "prefix-a")
+
+    assert cached["answer"] == "Answer to: Do you ship to Canada?"
+    assert cached["similarity"] == 1.0
+
+
+def test_a_changed_prompt_prefix_retires_cached_answers():
+    """An edited system prompt or business context yields a new fingerprint and a miss"""
+    response_cache = SemanticResponseCache()
+    cache_answer(response_cache, "Do you ship to Mexico?")
+
+    assert response_cache.lookup("ECOMMERCE", "Do you ship to Mexico?", "prefix-b") is None
+
+
+def test_without_a_sentence_model_paraphrases_miss():
+    """The hashed features score everyday paraphrases far below the threshold, so only repeats hit"""
+    response_cache = SemanticResponseCache()
+    cache_answer(response_cache, "What is your refund policy for shoes?")
+    hashed = response_cache.knowledge_service
+    first, second = (
+        np.array(hashed.generate_embedding(SemanticResponseCache.normalize(text)))
+        for text in ("What is your refund policy for shoes?", "What's your refund policy for shoes?")
+    )
+
+    assert first @ second / np.linalg.norm(first) / np.linalg.norm(second) < response_cache.threshold
+    assert response_cache.encoder is None and response_cache.index.size("ECOMMERCE") == 0
+    assert response_cache.lookup("ECOMMERCE", "What's your refund policy for shoes?", "prefix-a") is None
+
+
+def test_a_sentence_model_serves_paraphrases_under_the_same_prefix_only():
+    """Paraphrase hits use the model's embeddings and still require the prefix to match"""
+    response_cache = SemanticResponseCache(encoder=SynonymEncoder())
+    cache_answer(response_cache, "How do refunds for hats work?")
+
+    cached = response_cache.lookup("ECOMMERCE", "Can I return a hat?", "prefix-a")
+
+    assert cached["answer"] == "Answer to: How do refunds for hats work?"
+    assert response_cache.lookup("ECOMMERCE", "Can I return a hat?", "prefix-b") is None
+    assert response_cache.lookup("ECOMMERCE", "Where is my parcel?", "prefix-a") is None
+
+
+def test_answers_without_retrieved_knowledge_are_not_kept():
+    """An ungrounded answer is never replayed during an outage, however exact the repeat"""
+    store = StaleAnswerStore()
+    remember(store, "What is your refund policy?", [])
+
+    assert store.lookup("ECOMMERCE", "What is your refund policy?", []) is None
+    assert store.lookup("ECOMMERCE", "What is your refund policy?", None) is None
@@ -0,0 +1,120 @@
+"""
+Tests for speculative retrieval from typing drafts
+"""
+
+import asyncio
+import time
+
+import numpy as np
+
+from app.core.cache import cache
+from app.services import speculative_retrieval
+from app.services.speculative_retrieval import SpeculativeRetriever
+
+
+class FakeEntry:
+    def __init__(self, entry_id):
+        self.id = entry_id
+
+
+class FakeKnowledgeService:
+    """Letter-count embeddings and a fixed ranking, so drafts and messages compare predictably"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.searches = []
+
+    def semantic_search(self, query, limit=5, db=None, category=None):
+        self.searches.append(query)
+        time.sleep(self.delay)
+        return [FakeEntry(7), FakeEntry(3)]
+
+    def generate_embedding(self, text):
+        return np.array([text.count(c) for c in "abcdefghijklmnopqrstuvwxyz"], dtype=np.float32)
+
+    def get_knowledge_version(self, category):
+        return 1
+
+
+class FakeSession:
+    def close(self):
+        pass
+
+
+def make_retriever(delay=0.0):
+    retriever = SpeculativeRetriever(similarity=0.9, min_chars=5, min_interval=0.0, max_workers=2)
+    retriever.knowledge_service = FakeKnowledgeService(delay)
+    return retriever
+
+
+def test_claim_returns_draft_ranking_for_similar_message():
+    """Test that a close final message reuses the draft's ranked ids"""
+    retriever = make_retriever()
+    retriever.prefetch("c1", "ECOMMERCE", "where is my ord", FakeSession())
+
+    assert retriever.claim("c1", "ECOMMERCE", "where is my order") == [7, 3]
+    # Claimed once; the next message retrieves for itself
+    assert retriever.claim("c1", "ECOMMERCE", "where is my order") is None
+
+
+def test_claim_rejects_different_message():
+    """Test that a final message unlike the draft does not reuse its results"""
+    retriever = make_retriever()
+    retriever.prefetch("c1", "ECOMMERCE", "where is my order", FakeSession())
+
+    assert retriever.claim("c1", "ECOMMERCE", "cancel subscription plan") is None
+
+
+def test_claim_does_not_write_the_shared_retrieval_cache():
+    """Test that reused ids are returned to the turn instead of seeded into the cache"""
+    retriever = make_retriever()
+    retriever.prefetch("c1", "ECOMMERCE", "where is my ord", FakeSession())
+
+    entries_before = cache.local.size()
+
+    assert retriever.claim("c1", "ECOMMERCE", "where is my order") == [7, 3]
+    assert cache.local.size() == entries_before
+    assert retriever.knowledge_service.searches == ["where is my ord"]
+
+
+def test_schedule_prefetch_runs_in_the_background(monkeypatch):
+    """Test that scheduling returns at once and the draft is retrieved off the event loop"""
+    monkeypatch.setattr(speculative_retrieval, "SessionLocal", FakeSession)
+    retriever = make_retriever(delay=0.1)
+
+    async def main():
+        start = time.perf_counter()
+        assert retriever.schedule_prefetch("c1", "ECOMMERCE", "where is my ord") is True
+        scheduled_ms = (time.perf_counter() - start) * 1000
+        # A second draft while the first is running is skipped
+        assert retriever.schedule_prefetch("c1", "ECOMMERCE", "where is my orde") is False
+        await retriever._tasks["c1"]
+        return scheduled_ms
+
+    try:
+        scheduled_ms = asyncio.run(main())
+    finally:
+        retriever.executor.shutdown()
+
+    assert scheduled_ms < 50
+    assert retriever.claim("c1", "ECOMMERCE", "where is my order") == [7, 3]
+
+
+def test_prefetch_finishing_after_claim_is_dropped(monkeypatch):
+    """Test that a draft retrieved after the message was sent is not kept for the next turn"""
+    monkeypatch.setattr(speculative_retrieval, "SessionLocal", FakeSession)
+    retriever = make_retriever(delay=0.1)
+
+    async def main():
+        retriever.schedule_prefetch("c1", "ECOMMERCE", "where is my ord")
+        task = retriever._tasks["c1"]
+        assert retriever.claim("c1", "ECOMMERCE", "where is my order") is None
+        return await task
+
+    try:
+        stored = asyncio.run(main())
+    finally:
+        retriever.executor.shutdown()
+
+    assert stored is False
+    assert retriever.claim("c1", "ECOMMERCE", "where is my order") is None
@@ -0,0 +1,119 @@
+"""
+Tests for rolling conversation summaries
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core import database
+from app.core.cache import cache
+from app.core.database import Base
+from app.models.conversation import MessageRole
+from app.models.message import Message
+from app.services import summary_service
+from app.services.llm_providers import LLMResult
+from app.services.summary_service import ConversationSummarizer
+
+engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+
+class FakeProvider:
+    """Records prompts and answers with the number of calls so far"""
+
+    def __init__(self):
+        self.prompts = []
+
+    async def generate(self, prompt):
+        self.prompts.append(prompt)
+        return LLMResult(text=f"summary {len(self.prompts)}", model="fake")
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    fake = FakeProvider()
+    monkeypatch.setattr(summary_service, "get_llm_provider", lambda: fake)
+    return fake
+
+
+@pytest.fixture
+def db():
+    session = TestingSessionLocal()
+    yield session
+    session.close()
+
+
+def add_conversation(db, message_count):
+    """A conversation with alternating customer and assistant messages, one minute apart"""
+    conversation_id = str(uuid4())
+    start = datetime(2026, 1, 1)
+    for index in range(message_count):
+        db.add(Message(
+            id=str(uuid4()),
+            conversation_id=conversation_id,
+            role=MessageRole.USER if index % 2 == 0 else MessageRole.ASSISTANT,
+            content=f"message {index}",
+            msg_metadata={},
+            created_at=start + timedelta(minutes=index)
+        ))
+    db.commit()
+    return conversation_id
+
+
+def test_summary_is_persisted_with_the_conversation(db, provider):
+    """Test that a summary survives losing its cache entry"""
+    summarizer = ConversationSummarizer(recent_messages=2, interval=2)
+    conversation_id = add_conversation(db, 6)
+
+    summary = asyncio.run(summarizer.refresh(conversation_id, db))
+    cache.delete("conversation_summary", conversation_id)
+
+    reloaded = summarizer.get(conversation_id, db)
+    assert reloaded == summary
+    assert reloaded.message_count == 4
+
+
+def test_long_history_is_folded_in_bounded_chunks(db, provider):
+    """Test that a backlog without a summary is folded a chunk at a time"""
+    summarizer = ConversationSummarizer(recent_messages=6, interval=4, max_chunk=10)
+    conversation_id = add_conversation(db, 40)
+
+    summary = asyncio.run(summarizer.refresh(conversation_id, db))
+
+    assert len(provider.prompts) == 4
+    assert all(prompt.count("Customer: ") + prompt.count("Assistant: ") <= 10 for prompt in provider.prompts)
+    assert summary.message_count == 34
+    assert summary.text == "summary 4"
+
+
+def test_refresh_waits_for_enough_aged_out_messages(db, provider):
+    """Test that nothing is summarized until a full interval has left the recent window"""
+    summarizer = ConversationSummarizer(recent_messages=6, interval=4)
+    conversation_id = add_conversation(db, 8)
+
+    assert asyncio.run(summarizer.refresh(conversation_id, db)) is None
+    assert provider.prompts == []
+
+
+def test_scheduled_refresh_keeps_its_task_until_done(db, provider, monkeypatch):
+    """Test that background refreshes stay referenced until they finish"""
+    monkeypatch.setattr(database, "SessionLocal", TestingSessionLocal)
+    summarizer = ConversationSummarizer(recent_messages=2, interval=2)
+    conversation_id = add_conversation(db, 6)
+
+    async def main():
+        summarizer.schedule_refresh(conversation_id)
+        assert len(summarizer._tasks) == 1
+        await asyncio.gather(*summarizer._tasks)
+
+    asyncio.run(main())
+
+    assert summarizer._tasks == set()
+    assert summarizer.get(conversation_id, db).text == "summary 1"
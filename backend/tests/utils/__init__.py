@@ -0,0 +1,3 @@
+"""
+Utility tests package
+"""
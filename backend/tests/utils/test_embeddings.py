@@ -0,0 +1,60 @@
+"""
+Tests for embedding corpus diagnostics
+"""
+
+import numpy as np
+import pytest
+
+from app.utils.embeddings import EmbeddingUtils
+
+
+def _random_embeddings(n: int, dim: int = 16, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(n, dim)).tolist()
+
+
+def test_diversity_score_matches_pairwise_matrix():
+    """Streaming diversity equals the brute-force n x n computation"""
+    embeddings = _random_embeddings(300) + [[0.0] * 16]
+    
+    sim_matrix = EmbeddingUtils.cosine_similarity_matrix(embeddings)
+    expected = 1.0 - np.mean(sim_matrix[np.triu_indices_from(sim_matrix, k=1)])
+    
+    assert EmbeddingUtils.embedding_diversity_score(embeddings, block_size=64) == pytest.approx(expected)
+
+
+def test_diversity_score_needs_two_embeddings():
+    """A single embedding has no pairs to compare"""
+    assert EmbeddingUtils.embedding_diversity_score([[1.0, 0.0]]) == 0.0
+
+
+def test_sampled_diversity_interval_contains_exact_score():
+    """The sampled estimator's confidence interval covers the exact score"""
+    embeddings = _random_embeddings(500, seed=1)
+    exact = EmbeddingUtils.embedding_diversity_score(embeddings)
+    
+    estimate = EmbeddingUtils.estimate_diversity_score(embeddings, sample_pairs=20000)
+    
+    assert estimate["ci_low"] <= exact <= estimate["ci_high"]
+
+
+def test_quality_check_counts_duplicates_across_blocks():
+    """Duplicates are detected even when the copies land in different blocks"""
+    embeddings = _random_embeddings(50)
+    embeddings += [list(embeddings[0]), list(embeddings[10]), [0.0] * 16]
+    
+    result = EmbeddingUtils.embedding_quality_check(embeddings, block_size=8)
+    
+    assert result["status"] == "issues_found"
+    assert result["total_embeddings"] == 53
+    assert result["unique_embeddings"] == 51
+    assert "Contains 2 duplicate embeddings" in result["issues"]
+    assert "Contains 1 zero vectors" in result["issues"]
+
+
+def test_quality_check_flags_inconsistent_dimensions():
+    """Rows with a different dimension are reported, not crashed on"""
+    result = EmbeddingUtils.embedding_quality_check([[1.0, 2.0], [1.0, 2.0, 3.0]])
+    
+    assert "Inconsistent embedding dimensions" in result["issues"]
+    assert result["dimensions"] == 2
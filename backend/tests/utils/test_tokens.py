@@ -0,0 +1,65 @@
+"""
+Tests for token counting
+"""
+
+from app.utils.tokens import HeuristicTokenizer, TokenCounter, create_tokenizer
+
+
+class CountingTokenizer(HeuristicTokenizer):
+    def __init__(self):
+        self.calls = 0
+
+    def count(self, text):
+        self.calls += 1
+        return super().count(text)
+
+
+class RemoteTokenizer(CountingTokenizer):
+    """Counts twice what the heuristic does, like a provider whose tokens are smaller"""
+
+    remote = True
+
+    def count(self, text):
+        return 2 * super().count(text)
+
+
+def test_counts_are_cached_by_content():
+    """Test that repeated text is tokenized once"""
+    tokenizer = CountingTokenizer()
+    counter = TokenCounter(tokenizer=tokenizer)
+
+    first = counter.count("Where is my order #1234?")
+    second = counter.count("Where is my order #1234?")
+
+    assert first == second > 0
+    assert tokenizer.calls == 1
+
+
+def test_truncate_fits_budget():
+    """Test that truncated text fits the budget and is marked"""
+    counter = TokenCounter()
+    text = " ".join(["shipping"] * 500)
+
+    truncated = counter.truncate(text, 50)
+
+    assert counter.count(truncated) <= 50
+    assert truncated.endswith("[truncated]")
+    assert counter.truncate("short text", 50) == "short text"
+
+
+def test_truncate_with_a_remote_tokenizer_counts_the_whole_text_once():
+    """Test that provider counts are not requested for every binary search probe"""
+    tokenizer = RemoteTokenizer()
+    counter = TokenCounter(tokenizer=tokenizer)
+    text = " ".join(["shipping"] * 500)
+
+    truncated = counter.truncate(text, 50)
+
+    assert tokenizer.calls == 2  # The whole text and the marker
+    assert tokenizer.count(truncated) <= 50
+
+
+def test_unknown_tokenizer_falls_back_to_heuristic():
+    """Test that an unknown spec does not break prompt assembly"""
+    assert create_tokenizer("nonexistent:model").name == "heuristic"
+